@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import os
+import struct
+import sys
+import time
+import zlib
+from collections.abc import Iterator
+from typing import Any
+
+from msgpack import packb, unpackb
+
+from .common import (
+    BLACKNET_ARCHIVE_BATCH,
+    BLACKNET_ARCHIVE_COMPRESSION,
+    BLACKNET_ARCHIVE_DELTA,
+    blacknet_ensure_unicode,
+)
+from .config import BlacknetConfig, BlacknetConfigurationInterface
+from .database import BlacknetDatabaseCursor, blacknet_database
+
+# Fields of each archived attempt, in the order of archived rows.
+BLACKNET_ARCHIVE_FIELDS = [
+    "id",
+    "attacker_id",
+    "session_id",
+    "target",
+    "date",
+    "user",
+    "password",
+    "client",
+    "pubkey",
+]
+# Size header of each segment in archive files (compressed length).
+BLACKNET_ARCHIVE_HEADER = struct.Struct("!I")
+
+
+def blacknet_archive_name(date: int) -> str:
+    """Name of the archive file holding attempts from the month of date."""
+    return time.strftime("attempts-%Y-%m.bna", time.localtime(date))
+
+
+def blacknet_archive_read(path: str) -> Iterator[dict[str, Any]]:
+    """Iterate over all attempts of an archive file, one segment at a time."""
+    with open(path, "rb") as f:
+        header = f.read(BLACKNET_ARCHIVE_HEADER.size)
+        while header:
+            if len(header) < BLACKNET_ARCHIVE_HEADER.size:
+                raise ValueError(f"{path}: truncated segment header")
+            (size,) = BLACKNET_ARCHIVE_HEADER.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size:
+                raise ValueError(f"{path}: truncated segment")
+
+            segment = unpackb(zlib.decompress(payload))
+            fields = segment["fields"]
+            for row in segment["rows"]:
+                yield dict(zip(fields, row))
+            header = f.read(BLACKNET_ARCHIVE_HEADER.size)
+
+
+class BlacknetArchiver(BlacknetConfigurationInterface):
+    """Move old attempts from the database to compressed archive files.
+
+    Attempts are appended to a file per month, by segments of msgpack rows
+    compressed with zlib (each preceded by its size). Archived attempts are
+    replaced by counters (by session and by credentials) so that statistics
+    and scrubber checks still account for them. Successful attempts are kept.
+    """
+
+    def __init__(self, cfg_file: str | None = None) -> None:
+        """Load configuration file and database parameters."""
+        config = BlacknetConfig()
+        config.load(cfg_file)
+        super().__init__(config, "archive")
+
+        self.__database = blacknet_database(config)
+        self.__dry_run = False
+        self.__archive_path = None  # type: str | None
+        self.__archive_delta = None  # type: int | None
+
+    @property
+    def dry_run(self) -> bool:
+        """Tell whether changes are only displayed."""
+        return self.__dry_run
+
+    @dry_run.setter
+    def dry_run(self, val: bool) -> None:
+        """Set whether changes are only displayed."""
+        self.__dry_run = val
+
+    @property
+    def archive_path(self) -> str:
+        """Directory in which archive files are written."""
+        if self.__archive_path is None:
+            self.__archive_path = self.get_config("path")
+        return self.__archive_path
+
+    @property
+    def archive_delta(self) -> int:
+        """Attempts older than this number of days are archived."""
+        if self.__archive_delta is None:
+            if self.has_config("delta"):
+                self.__archive_delta = int(self.get_config("delta"))
+            else:
+                self.__archive_delta = BLACKNET_ARCHIVE_DELTA
+        return self.__archive_delta
+
+    def log(self, message: str) -> None:
+        """Write something stdout."""
+        suffix = " (DRY-RUN)" if self.__dry_run else ""
+        sys.stdout.write(f"{message}{suffix}\n")
+
+    def __append_segment(self, filename: str, rows: list[list[Any]]) -> tuple[str, int]:
+        """Append a segment to an archive file, returning where it starts."""
+        segment = {"fields": BLACKNET_ARCHIVE_FIELDS, "rows": rows}
+        payload = zlib.compress(packb(segment), BLACKNET_ARCHIVE_COMPRESSION)
+
+        path = os.path.join(self.archive_path, filename)
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(BLACKNET_ARCHIVE_HEADER.pack(len(payload)) + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        return (path, offset)
+
+    @staticmethod
+    def __counters(rows: list[Any]) -> tuple[list[Any], list[Any], list[Any], list[Any]]:
+        """Aggregate archived attempts by session, credentials and attacker."""
+        sessions = {}  # type: dict[int, list[Any]]
+        credentials = {}  # type: dict[tuple[int, int], int]
+        attackers = {}  # type: dict[int, int]
+        for _, atk_id, ses_id, _, date, user_id, _, password_id, *_ in rows:
+            session = sessions.setdefault(ses_id, [ses_id, atk_id, date, date, 0])
+            session[2] = min(session[2], date)
+            session[3] = max(session[3], date)
+            session[4] += 1
+            # No password is stored as 0 (counters are keyed by credentials).
+            key = (user_id, password_id or 0)
+            credentials[key] = credentials.get(key, 0) + 1
+            attackers[atk_id] = attackers.get(atk_id, 0) + 1
+
+        return (
+            list(sessions.values()),
+            [(u_id, p_id, n) for (u_id, p_id), n in credentials.items()],
+            [(s[4], s[0]) for s in sessions.values()],
+            [(n, atk_id) for atk_id, n in attackers.items()],
+        )
+
+    def __archive_batch(
+        self, cursor: BlacknetDatabaseCursor, rows: list[Any], before: int
+    ) -> None:
+        segments = {}  # type: dict[str, list[list[Any]]]
+        for att_id, atk_id, ses_id, target, date, _, user, _, password, client, pubkey in rows:
+            # Interned strings are binary on MySQL.
+            user, password, client, pubkey = (
+                blacknet_ensure_unicode(v) if isinstance(v, bytes) else v
+                for v in (user, password, client, pubkey)
+            )
+            record = [att_id, atk_id, ses_id, target, date, user, password, client, pubkey]
+            segments.setdefault(blacknet_archive_name(date), []).append(record)
+
+        sessions, credentials, session_counts, attacker_counts = self.__counters(rows)
+        written = []  # type: list[tuple[str, int]]
+        try:
+            for filename, records in sorted(segments.items()):
+                written.append(self.__append_segment(filename, records))
+
+            cursor.archive_sessions(sessions)
+            cursor.archive_credentials(credentials)
+            cursor.delete_attempts([row[0] for row in rows], before)
+            # Deletion triggers decremented these counters, archived attempts still count.
+            cursor.restore_attempts_count("session", session_counts)
+            cursor.restore_attempts_count("attacker", attacker_counts)
+            self.__database.commit()
+        except BaseException:
+            # Archive files only hold attempts that were removed from the database.
+            for path, offset in written:
+                os.truncate(path, offset)
+            raise
+
+    def archive(self, before: int | None = None) -> int:
+        """Move attempts older than before (or the archive delta) to archive files."""
+        if before is None:
+            before = int(time.time() - 24 * 3600 * self.archive_delta)
+
+        cursor = self.__database.cursor()
+        if self.__dry_run:
+            count = cursor.archivable_attempts(before)
+            self.log(f"[+] {count} attempts would be archived")
+            return 0
+
+        total = 0
+        rows = cursor.archive_attempts(before, BLACKNET_ARCHIVE_BATCH)
+        while rows:
+            self.__archive_batch(cursor, rows, before)
+            total += len(rows)
+            self.log(f"[+] Archived {total} attempts")
+            if len(rows) < BLACKNET_ARCHIVE_BATCH:
+                break
+            rows = cursor.archive_attempts(before, BLACKNET_ARCHIVE_BATCH)
+
+        if not total:
+            self.log("[+] No attempt to archive")
+        return total
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import random
+import time
+from threading import Lock
+from typing import Callable
+
+from .common import (
+    BLACKNET_BREAKER_BACKOFF_MAX,
+    BLACKNET_BREAKER_BACKOFF_MIN,
+    BLACKNET_BREAKER_JITTER,
+)
+from .metrics import BlacknetMetrics
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half-open"
+
+
+class BlacknetCircuitBreaker:
+    """Circuit breaker guarding connections to an unavailable service.
+
+    A failed connection opens the breaker: no connection is attempted until
+    an exponentially growing (and jittered) delay has elapsed. The breaker
+    is then half-open, letting a single caller probe the service while all
+    others are still turned away, and closes again once the probe succeeds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        log: Callable[[str], None] | None = None,
+        metrics: BlacknetMetrics | None = None,
+    ) -> None:
+        """Create a new (closed) circuit breaker."""
+        self.name = name
+        self.__log = log
+        self.__metrics = metrics
+        self.__lock = Lock()
+        self.__state = BREAKER_CLOSED
+        self.__failures = 0
+        self.__deadline = 0.0
+
+    @property
+    def state(self) -> str:
+        """Current state of the breaker (closed, open or half-open)."""
+        return self.__state
+
+    def __transition(self, state: str, reason: str) -> None:
+        self.__state = state
+        if self.__log is not None:
+            self.__log(f"{self.name}: circuit breaker {state} ({reason})")
+        if self.__metrics is not None:
+            name = state.replace("-", "_")
+            self.__metrics.counter(f"breaker.{self.name}.{name}").inc()
+
+    def allow(self) -> bool:
+        """Tell whether the caller may attempt to connect now."""
+        with self.__lock:
+            if self.__state == BREAKER_CLOSED:
+                return True
+            if self.__state == BREAKER_OPEN and time.monotonic() >= self.__deadline:
+                self.__transition(BREAKER_HALF_OPEN, "probing")
+                return True
+            return False
+
+    def success(self) -> None:
+        """Report a successful connection."""
+        with self.__lock:
+            self.__failures = 0
+            if self.__state != BREAKER_CLOSED:
+                self.__transition(BREAKER_CLOSED, "connection restored")
+
+    def failure(self) -> None:
+        """Report a failed connection, (re)opening the breaker."""
+        with self.__lock:
+            # Concurrent failures of an already open breaker do not extend its delay.
+            if self.__state == BREAKER_OPEN:
+                return
+
+            delay = BLACKNET_BREAKER_BACKOFF_MIN * 2 ** min(self.__failures, 16)
+            delay = min(delay, BLACKNET_BREAKER_BACKOFF_MAX)
+            delay += random.uniform(0.0, delay * BLACKNET_BREAKER_JITTER)  # noqa: S311
+            self.__failures += 1
+            self.__deadline = time.monotonic() + delay
+            self.__transition(BREAKER_OPEN, f"retrying in {delay:.1f}s")
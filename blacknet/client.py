@@ -3,6 +3,7 @@ from __future__ import annotations
 import select
 import socket
 import sys
+import time
 from contextlib import suppress
 from threading import Lock, RLock
 from typing import Any
@@ -24,6 +25,7 @@ from .common import (
 )
 from .config import BlacknetConfig
 from .logger import BlacknetLogger
+from .metrics import BlacknetMetrics
 from .sslif import BlacknetSSLInterface
 
 
@@ -34,10 +36,12 @@ class BlacknetClient(BlacknetSSLInterface):
         self,
         config: BlacknetConfig,
         logger: BlacknetLogger | None = None,
+        metrics: BlacknetMetrics | None = None,
     ) -> None:
         """Initialize a new client for blacknet."""
         super().__init__(config, "honeypot")
         self.__logger = logger
+        self.__send_time = metrics.histogram("link.send_time") if metrics else None
         self.__server_hostname = None  # type: str | None
         self.__server_address = None  # type: str | tuple[str, int] | None
         self.__server_socket = None  # type: socket.socket | None
@@ -244,6 +248,7 @@ class BlacknetClient(BlacknetSSLInterface):
         self._send(BlacknetMsgType.GOODBYE)
 
     def _send_retry(self, msgtype: int, message: Any, tries: int = 2) -> None:
+        time_start = time.monotonic()
         while tries > 0:
             self.__send_lock.acquire()
             try:
@@ -255,14 +260,25 @@ class BlacknetClient(BlacknetSSLInterface):
             finally:
                 self.__send_lock.release()
 
+        if self.__send_time is not None:
+            self.__send_time.observe(time.monotonic() - time_start)
+
     def send_ssh_credential(self, data: dict[str, Any]) -> None:
         """Send SSH credentials to the blacknet server."""
         self._send_retry(BlacknetMsgType.SSH_CREDENTIAL, data)
 
+    def send_ssh_credentials(self, data: list[dict[str, Any]]) -> None:
+        """Send aggregated SSH credentials to the blacknet server."""
+        self._send_retry(BlacknetMsgType.SSH_CREDENTIALS, data)
+
     def send_ssh_publickey(self, data: dict[str, Any]) -> None:
         """Send SSH public key to the blacknet server."""
         self._send_retry(BlacknetMsgType.SSH_PUBLICKEY, data)
 
+    def send_ssh_banners(self, data: list[dict[str, Any]]) -> None:
+        """Send a batch of SSH client versions to the blacknet server."""
+        self._send_retry(BlacknetMsgType.SSH_BANNERS, data)
+
     def send_ping(self) -> None:
         """Send a keep-alive probe to the server."""
         answered = False
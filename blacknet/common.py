@@ -14,6 +14,8 @@ class BlacknetMsgType:
     CLIENT_NAME = 1
     SSH_CREDENTIAL = 2
     SSH_PUBLICKEY = 3
+    SSH_BANNERS = 4
+    SSH_CREDENTIALS = 5
     PING = 10
     PONG = 11
     GOODBYE = 16
@@ -49,8 +51,25 @@ BLACKNET_HELLO = "CPE1704TKS"
 BLACKNET_SSL_DEFAULT_ADDRESS = "127.0.0.1"
 BLACKNET_SSL_DEFAULT_PORT = 10443
 BLACKNET_SSL_DEFAULT_LISTEN = f"{BLACKNET_SSL_DEFAULT_ADDRESS}:{BLACKNET_SSL_DEFAULT_PORT}"
+# Maximum duration of the SSL handshake with sensors (seconds).
+BLACKNET_SSL_HANDSHAKE_TIMEOUT = 10.0
 # Default session interval is set to 1 hour.
 BLACKNET_DEFAULT_SESSION_INTERVAL = 3600
+# How long to wait for connection threads to terminate on shutdown (seconds).
+BLACKNET_SERVER_SHUTDOWN_TIMEOUT = 10.0
+# First file descriptor passed by systemd socket activation (SD_LISTEN_FDS_START).
+BLACKNET_LISTEN_FDS_START = 3
+# Listening sockets handoff: maximum number of sockets and exchange timeout.
+BLACKNET_HANDOFF_MAXFDS = 64
+BLACKNET_HANDOFF_TIMEOUT = 5.0
+# How long connections are allowed to finish after a handoff (seconds).
+BLACKNET_DRAIN_TIMEOUT = 60.0
+# Default length of the accept queue on listening sockets.
+BLACKNET_LISTEN_BACKLOG = 128
+# How often kernel accept queue overflows are checked (seconds).
+BLACKNET_LISTEN_CHECK_INTERVAL = 60.0
+# Kernel TCP statistics holding accept queue overflows (Linux only).
+BLACKNET_LISTEN_NETSTAT = "/proc/net/netstat"
 
 # Default listening / connection interface for SSH server (blacknet client)
 BLACKNET_SSH_DEFAULT_ADDRESS = "0.0.0.0"  # noqa: S104
@@ -61,17 +80,86 @@ BLACKNET_SSH_AUTH_RETRIES = 42  # Max. number of auth retries before disconnecti
 
 # SSH client maximum socket duration
 BLACKNET_SSH_CLIENT_TIMEOUT = 20 * BLACKNET_SSH_AUTH_RETRIES
-
-# Used in select timeout to ping server regularly (5mn here).
+# SSH client maximum idle time before its first authentication attempt.
+BLACKNET_SSH_PREAUTH_TIMEOUT = 60
+# SSH client maximum idle time after its first authentication attempt.
+BLACKNET_SSH_IDLE_TIMEOUT = 120
+# Timeouts are scaled by this factor while concurrent sessions are above
+# the configured high-water mark.
+BLACKNET_SSH_PRESSURE_SCALE = 0.25
+# How often stalled SSH sessions are looked for (seconds).
+BLACKNET_SSH_REAPER_INTERVAL = 5.0
+
+# Banner capture: how long a client has to send its version string (and then its
+# first key exchange packet) before being dropped.
+BLACKNET_SSH_BANNER_TIMEOUT = 15.0
+# Banner capture: maximum amount of data read before the client version string.
+BLACKNET_SSH_BANNER_MAXLEN = 8192
+# Maximum length of the SSH version line, CR and LF included (RFC 4253).
+BLACKNET_SSH_VERSION_MAXLEN = 255
+# Width of client versions stored in the banners table (longer ones are truncated).
+BLACKNET_BANNER_CLIENT_MAXLEN = 128
+# Banner capture: report client versions by batches of this size...
+BLACKNET_SSH_BANNER_BATCH = 64
+# ...or when the oldest pending client version is older than this (seconds).
+BLACKNET_SSH_BANNER_FLUSH_INTERVAL = 60.0
+# Banner capture: batches waiting to be reported, later ones are dropped beyond.
+BLACKNET_SSH_BANNER_PENDING = 64
+
+# Interval between two pings to the server (5mn here).
 BLACKNET_PING_INTERVAL = 5 * 60
+# Random delay added to each ping, so that sensor workers do not ping together.
+BLACKNET_PING_JITTER = 30.0
+# Delay before restarting a sensor worker (seconds), doubled on each exit up to the
+# maximum, and reset once the exited worker had been running for the stable time.
+BLACKNET_WORKER_RESTART_DELAY = 1.0
+BLACKNET_WORKER_RESTART_MAX = 60.0
+BLACKNET_WORKER_STABLE_TIME = 60.0
 
 # How many times to wait for close acknowledgement.
 BLACKNET_CLIENT_GOODBYE_TIMEOUT = 5.0
 BLACKNET_CLIENT_PING_TIMEOUT = 3.0
 BLACKNET_CLIENT_CONN_RETRIES = 3
 BLACKNET_DATABASE_RETRIES = 2
+# Maximum replication delay for reports to be read from a replica (seconds).
+BLACKNET_REPLICA_MAX_LAG = 300.0
+# Reconnection backoff once the database is unreachable (seconds), doubled on each
+# failure up to the maximum, plus a random part (as a fraction of the delay).
+BLACKNET_BREAKER_BACKOFF_MIN = 0.5
+BLACKNET_BREAKER_BACKOFF_MAX = 30.0
+BLACKNET_BREAKER_JITTER = 0.25
+# Number of rows read at once from streamed database queries.
+BLACKNET_DATABASE_FETCH_BATCH = 1000
+# How long to wait for a locked SQLite database (seconds).
+BLACKNET_SQLITE_TIMEOUT = 30.0
 # Stands for "Other country" in geolite-city database.
 BLACKNET_DEFAULT_LOCID = 1
+# How many monthly partitions of attempts to create ahead of the current month.
+BLACKNET_PARTITIONS_AHEAD = 3
+# Number of attempts updated by each transaction of long running migrations.
+BLACKNET_MIGRATION_BATCH = 100000
+# Number of interned strings (users, passwords, clients) cached by master threads.
+BLACKNET_LOOKUP_CACHE_SIZE = 10000
+# Maximum count of identical credentials aggregated by a sensor over a session.
+BLACKNET_CREDENTIALS_MAX_COUNT = 100000
+# Attempts older than this number of days are moved to archive files.
+BLACKNET_ARCHIVE_DELTA = 365
+# Number of attempts moved to archive files by each transaction.
+BLACKNET_ARCHIVE_BATCH = 10000
+# Compression level of archive file segments (zlib).
+BLACKNET_ARCHIVE_COMPRESSION = 9
+# Maximum number of rows deleted by a single statement (bound on placeholders).
+BLACKNET_DELETE_BATCH = 500
+# Number of rows inserted by each statement of geolocation imports.
+BLACKNET_BULK_INSERT_BATCH = 5000
+# Minimum size of imported geolocation tables, relative to the current ones.
+BLACKNET_GEO_MIN_RATIO = 0.5
+# Size of chunks written to disk while downloading files (bytes).
+BLACKNET_DOWNLOAD_CHUNK = 65536
+# Geolocation updates are applied as a whole above this ratio of changed rows.
+BLACKNET_GEO_DIFF_RATIO = 0.2
+# Relative tolerance on coordinates (MySQL FLOAT columns are read back rounded).
+BLACKNET_GEO_FLOAT_TOLERANCE = 1e-5
 
 
 # This is the actual list of supported ciphers for SSL
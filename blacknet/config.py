@@ -58,6 +58,10 @@ class BlacknetConfigurationInterface:
         """Get a configuration entry."""
         return self._config.get(self._role, key)
 
+    def get_config_bool(self, key: str) -> bool:
+        """Get a boolean configuration entry."""
+        return self._config.getboolean(self._role, key)
+
     def reload(self) -> None:
         """Reload the configuration file."""
         self._config.reload()
@@ -1,10 +1,16 @@
+from .archive import run_archive
+from .explain import run_explain
 from .master import run_master
+from .migrate import run_migrate
 from .scrubber import run_scrubber
 from .sensor import run_sensor
 from .updater import run_updater
 
 __all__ = [
+    "run_archive",
+    "run_explain",
     "run_master",
+    "run_migrate",
     "run_scrubber",
     "run_sensor",
     "run_updater",
@@ -0,0 +1,45 @@
+import json
+import sys
+from optparse import OptionParser, Values
+
+from ..archive import BlacknetArchiver, blacknet_archive_read
+
+
+def archive_options_parse() -> tuple[Values, list[str]]:
+    """Parse and get options from command line."""
+    parser = OptionParser(usage="%prog [options] | %prog --read FILE...")
+    parser.add_option(
+        "-c", "--config", dest="config", help="configuration file to use", metavar="FILE"
+    )
+    parser.add_option(
+        "-n",
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="only display what would be performed",
+        default=False,
+    )
+    parser.add_option(
+        "-r",
+        "--read",
+        dest="read",
+        action="store_true",
+        help="write attempts of archive files to stdout (one JSON object per line)",
+        default=False,
+    )
+    return parser.parse_args()
+
+
+def run_archive() -> None:
+    """Run the attempts archival console script."""
+    options, args = archive_options_parse()
+
+    if options.read:
+        for path in args:
+            for attempt in blacknet_archive_read(path):
+                sys.stdout.write(json.dumps(attempt) + "\n")
+        return
+
+    bna = BlacknetArchiver(options.config)
+    bna.dry_run = options.dry_run
+    bna.archive()
@@ -0,0 +1,20 @@
+from optparse import OptionParser, Values
+
+from ..explain import BlacknetExplainer
+
+
+def explain_options_parse() -> tuple[Values, list[str]]:
+    """Parse and get options from command line."""
+    parser = OptionParser()
+    parser.add_option(
+        "-c", "--config", dest="config", help="configuration file to use", metavar="FILE"
+    )
+    return parser.parse_args()
+
+
+def run_explain() -> None:
+    """Run the query plans console script."""
+    options, arg = explain_options_parse()
+
+    bne = BlacknetExplainer(options.config)
+    bne.run()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import os
 from optparse import OptionParser
-from signal import SIGHUP, SIGINT, SIGTERM, getsignal, signal
+from signal import SIGHUP, SIGINT, SIGTERM, getsignal, set_wakeup_fd, signal
 from types import FrameType
 
 from .. import BlacknetMasterServer
@@ -56,18 +56,21 @@ def run_master() -> None:
     signal(SIGHUP, blacknet_reload)
 
     bns = BlacknetMasterServer(options.config)
+    # Signals wake the serving loop up so they are handled right away.
+    set_wakeup_fd(bns.wakeup_fd)
 
     # Write PID after initialization
     if options.pidfile:
         blacknet_write_pid(options.pidfile)
 
-    while running:
+    while running and not bns.handed_off:
         if update:
             bns.reload()
             update = False
         bns.serve()
 
     # restore signal handlers
+    set_wakeup_fd(-1)
     signal(SIGINT, sigint_handler)
     signal(SIGTERM, sigterm_handler)
 
@@ -0,0 +1,64 @@
+from optparse import OptionParser, Values
+
+from ..migration import BlacknetMigrator, blacknet_month_parse
+
+
+def migrate_options_parse() -> tuple[Values, list[str]]:
+    """Parse and get options from command line."""
+    parser = OptionParser()
+    parser.add_option(
+        "-c", "--config", dest="config", help="configuration file to use", metavar="FILE"
+    )
+    parser.add_option(
+        "-l",
+        "--list",
+        dest="listing",
+        action="store_true",
+        help="show the schema version and pending migrations",
+        default=False,
+    )
+    parser.add_option(
+        "-n",
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="only display what would be performed",
+        default=False,
+    )
+    parser.add_option(
+        "-a",
+        "--add-partitions",
+        dest="ahead",
+        type="int",
+        help="create monthly attempts partitions up to N months ahead",
+        metavar="N",
+    )
+    parser.add_option(
+        "-d",
+        "--drop-before",
+        dest="before",
+        help="drop attempts partitions older than MONTH (YYYY-MM)",
+        metavar="MONTH",
+    )
+    return parser.parse_args()
+
+
+def run_migrate() -> None:
+    """Run the schema migration console script."""
+    options, arg = migrate_options_parse()
+
+    bnm = BlacknetMigrator(options.config)
+    bnm.dry_run = options.dry_run
+
+    if options.listing:
+        bnm.status()
+        return
+
+    if options.ahead is None and options.before is None:
+        bnm.migrate()
+
+    if options.ahead is not None:
+        bnm.partitions_add(options.ahead)
+
+    if options.before is not None:
+        bnm.partitions_drop(blacknet_month_parse(options.before))
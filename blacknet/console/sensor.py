@@ -3,11 +3,20 @@ from __future__ import annotations
 import logging
 import os
 import sys
-from optparse import OptionParser
-from signal import SIGHUP, SIGINT, SIGTERM, getsignal, signal
+import time
+import traceback
+from contextlib import suppress
+from optparse import OptionParser, Values
+from signal import SIGHUP, SIGINT, SIGTERM, getsignal, set_wakeup_fd, signal
 from types import FrameType
 
-from ..sensor import BlacknetSensor
+from ..common import (
+    BLACKNET_WORKER_RESTART_DELAY,
+    BLACKNET_WORKER_RESTART_MAX,
+    BLACKNET_WORKER_STABLE_TIME,
+)
+from ..config import BlacknetConfig
+from ..sensor import BlacknetSensor, blacknet_sensor_workers, blacknet_ssh_keys_check
 
 running = True
 update = False
@@ -31,6 +40,84 @@ def blacknet_write_pid(filename: str) -> None:
         fp.write(str(os.getpid()))
 
 
+def blacknet_log(message: str) -> None:
+    """Write a supervisor message to stdout."""
+    sys.stdout.write("%s\n" % message)
+    sys.stdout.flush()
+
+
+def sensor_serve(options: Values) -> None:
+    """Run a sensor instance until asked to quit."""
+    global update
+
+    bns = BlacknetSensor(options.config)
+    set_wakeup_fd(bns.wakeup_fd)
+    while running and not bns.handed_off:
+        if update:
+            bns.reload()
+            update = False
+        bns.serve()
+    set_wakeup_fd(-1)
+    bns.shutdown()
+
+
+def sensor_spawn(options: Values) -> int:
+    """Fork a new sensor worker process."""
+    pid = os.fork()
+    if pid == 0:
+        # Sockets passed by systemd are shared by all workers.
+        if os.environ.get("LISTEN_PID") == str(os.getppid()):
+            os.environ["LISTEN_PID"] = str(os.getpid())
+
+        status = os.EX_OK
+        try:
+            sensor_serve(options)
+        except BaseException:
+            traceback.print_exc()
+            status = os.EX_SOFTWARE
+        os._exit(status)
+    return pid
+
+
+def sensor_supervise(options: Values, workers: int) -> None:
+    """Run sensor workers, forward signals to them and restart them on failure."""
+    global update
+    children = {}  # type: dict[int, float]
+    delay = BLACKNET_WORKER_RESTART_DELAY
+    restart_at = 0.0
+
+    while running:
+        # Workers failing at startup are restarted with a growing delay.
+        while len(children) < workers and time.monotonic() >= restart_at:
+            children[sensor_spawn(options)] = time.monotonic()
+
+        if update:
+            for pid in children:
+                with suppress(ProcessLookupError):
+                    os.kill(pid, SIGHUP)
+            update = False
+
+        with suppress(ChildProcessError):
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid in children:
+                now = time.monotonic()
+                if now - children.pop(pid) >= BLACKNET_WORKER_STABLE_TIME:
+                    delay = BLACKNET_WORKER_RESTART_DELAY
+                restart_at = now + delay
+                blacknet_log(
+                    f"worker {pid} exited with status {status}, restarting in {delay:.0f}s"
+                )
+                delay = min(delay * 2, BLACKNET_WORKER_RESTART_MAX)
+        time.sleep(1.0)
+
+    for pid in children:
+        with suppress(ProcessLookupError):
+            os.kill(pid, SIGTERM)
+    for pid in children:
+        with suppress(ChildProcessError):
+            os.waitpid(pid, 0)
+
+
 def run_sensor() -> None:
     """Run the blacknet sensor console script."""
     global update
@@ -62,19 +149,36 @@ def run_sensor() -> None:
     signal(SIGTERM, blacknet_quit)
     signal(SIGHUP, blacknet_reload)
 
+    config = BlacknetConfig()
+    config.load(options.config)
+    workers = blacknet_sensor_workers(config)
+
+    if workers > 1:
+        # Make sure all workers share the same SSH host key.
+        blacknet_ssh_keys_check(config.get("honeypot", "ssh_keys"), blacknet_log)
+
+        if options.pidfile:
+            blacknet_write_pid(options.pidfile)
+
+        sensor_supervise(options, workers)
+        return
+
     bns = BlacknetSensor(options.config)
+    # Signals wake the serving loop up so they are handled right away.
+    set_wakeup_fd(bns.wakeup_fd)
 
     # Write PID after initialization
     if options.pidfile:
         blacknet_write_pid(options.pidfile)
 
-    while running:
+    while running and not bns.handed_off:
         if update:
             bns.reload()
             update = False
         bns.serve()
 
     # restore signal handlers
+    set_wakeup_fd(-1)
     signal(SIGINT, sigint_handler)
     signal(SIGTERM, sigterm_handler)
 
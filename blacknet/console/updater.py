@@ -1,3 +1,5 @@
+import os
+import sys
 from optparse import OptionParser
 
 from ..updater import BlacknetGeoUpdater
@@ -9,8 +11,26 @@ def run_updater() -> None:
     parser.add_option(
         "-c", "--config", dest="config", help="configuration file to use", metavar="FILE"
     )
+    parser.add_option(
+        "-r",
+        "--rollback",
+        dest="rollback",
+        action="store_true",
+        help="restore geolocation tables as they were before the last update",
+        default=False,
+    )
+    parser.add_option(
+        "-f",
+        "--full",
+        dest="full",
+        action="store_true",
+        help="import the whole geolocation database, even when unchanged",
+        default=False,
+    )
 
     options, arg = parser.parse_args()
 
     updater = BlacknetGeoUpdater(options.config)
-    updater.update()
+    success = updater.rollback() if options.rollback else updater.update(options.full)
+    if not success:
+        sys.exit(os.EX_SOFTWARE)
@@ -1,31 +1,66 @@
 from __future__ import annotations
 
+import re
+import sqlite3
+import sys
+import time
 import warnings
-from collections.abc import Collection, Iterable
+from collections.abc import Collection, Iterable, Iterator, Mapping
 from contextlib import suppress
+from datetime import datetime
 from threading import Lock
-from typing import Any, Optional
+from typing import Any, Callable, Optional, Union
 
 import pymysql
+import pymysql.cursors
 
+from .breaker import BlacknetCircuitBreaker
 from .common import (
+    BLACKNET_DATABASE_FETCH_BATCH,
     BLACKNET_DEFAULT_LOCID,
+    BLACKNET_DELETE_BATCH,
     BLACKNET_LOG_DEFAULT,
     BLACKNET_LOG_ERROR,
     BLACKNET_LOG_INFO,
+    BLACKNET_LOG_WARNING,
+    BLACKNET_REPLICA_MAX_LAG,
 )
 from .config import BlacknetConfig, BlacknetConfigurationInterface
 from .logger import BlacknetLogger
+from .metrics import BlacknetMetrics
+from .sqlite import BlacknetSQLiteConnection
 
 # Forces MySQL to shut up about binlog format
 warnings.filterwarnings("ignore", category=pymysql.Warning)
 
 DbConnectionParams = tuple[Optional[str], Optional[str], str, str, str]
+# Explained query: (calling method, query, plan columns, plan rows).
+DbQueryPlan = tuple[str, str, list[str], list[Any]]
+DbConnection = Union["pymysql.Connection[Any]", BlacknetSQLiteConnection]
+# Strings of attempts interned in lookup tables: (attempts column, table, length).
+BLACKNET_LOOKUPS = (
+    ("user", "users", 64),
+    ("password", "passwords", 64),
+    ("client", "clients", 128),
+)
+# Errors raised by any of the database backends.
+BlacknetDatabaseError = (pymysql.MySQLError, sqlite3.Error)
+
+
+class BlacknetDatabaseUnavailableError(Exception):
+    """Raised when the database cannot be reached (or is known to be down)."""
+
+
+def blacknet_caller_name() -> str:
+    """Name of the function calling the caller (queries are accounted for by method)."""
+    return sys._getframe(2).f_code.co_name  # noqa: SLF001
 
 
 class BlacknetDatabaseCursor:
     """Database cursor wrapper for Mysqldb interactions."""
 
+    explain_prefix = "EXPLAIN "
+
     def __init__(self, bnd: BlacknetDatabase, logger: BlacknetLogger | None = None) -> None:
         """Initialize a new Blacknet Database Cursor from a Mysqldb cursor."""
         self.__bnd = bnd
@@ -34,11 +69,44 @@ class BlacknetDatabaseCursor:
 
     def __del__(self) -> None:
         """Close the cursor database on instance deletion."""
-        self.__cursor.close()
+        # No cursor was created when the database could not be reached.
+        with suppress(AttributeError):
+            self.__cursor.close()
+
+    def __timed(self, name: str, query: str, function: Callable[..., Any], *args: Any) -> Any:
+        """Run a database call, accounting for its duration when enabled."""
+        bnd = self.__bnd
+        if not bnd.query_timing:
+            return function(query, *args)
+
+        time_start = time.perf_counter()
+        try:
+            return function(query, *args)
+        finally:
+            bnd.query_observe(name, query, time.perf_counter() - time_start)
+
+    def __explain(self, name: str, query: str, args: Iterable[Any] | None) -> int:
+        """Record the plan of a read query instead of running it (no rows)."""
+        explained = self.__bnd.explained
+        if explained is not None and query.lstrip().upper().startswith("SELECT"):
+            self.__cursor.execute(self.explain_prefix + query, args)
+            columns = [d[0] for d in self.__cursor.description]
+            explained.append((name, query, columns, list(self.__cursor.fetchall())))
+        return 0
 
     def execute(self, query: str, args: Iterable[Any] | None = None) -> Any:
         """Execute generic queries to the database."""
-        return self.__cursor.execute(query, args)
+        name = blacknet_caller_name()
+        if self.__bnd.explained is not None:
+            return self.__explain(name, query, args)
+        return self.__timed(name, query, self.__cursor.execute, args)
+
+    def executemany(self, query: str, rows: Iterable[Collection[Any]]) -> Any:
+        """Execute the same query for each provided row."""
+        if self.__bnd.explained is not None:
+            return 0
+        name = blacknet_caller_name()
+        return self.__timed(name, query, self.__cursor.executemany, rows)
 
     def fetchone(self) -> Any:
         """Fetch a single row from the cursor."""
@@ -48,6 +116,36 @@ class BlacknetDatabaseCursor:
         """Fetch all rows from the cursor."""
         return self.__cursor.fetchall()
 
+    def stream(self, query: str, args: Iterable[Any] | None = None) -> Iterator[Any]:
+        """Execute a query and iterate over its rows without loading them all at once.
+
+        Rows are read by batches from an unbuffered cursor on a dedicated
+        connection, so that other queries can run while iterating (but only
+        a single stream can be consumed at a time).
+        """
+        name = blacknet_caller_name()
+        return self.__stream(name, query, args)
+
+    def __stream(self, name: str, query: str, args: Iterable[Any] | None) -> Iterator[Any]:
+        if self.__bnd.explained is not None:
+            self.__explain(name, query, args)
+            return
+
+        database = self.__bnd.stream_database
+        cursor = database.cursor(pymysql.cursors.SSCursor)
+        try:
+            # Only the time until the first row is available is accounted for.
+            self.__timed(name, query, cursor.execute, args)
+            batch_size = self.__bnd.fetch_batch_size
+            rows = cursor.fetchmany(batch_size)
+            while rows:
+                yield from rows
+                rows = cursor.fetchmany(batch_size)
+        finally:
+            # Also reads the remaining rows (if any) and releases the snapshot.
+            cursor.close()
+            database.commit()
+
     def insert_attacker(self, args: Collection[Any]) -> None:
         """Insert a new attacker to the database."""
         query = (
@@ -56,6 +154,45 @@ class BlacknetDatabaseCursor:
         )
         return self.execute(query, args)
 
+    def __upsert_attackers(self, rows: Collection[Collection[Any]]) -> int:
+        # Location is resolved by the same statement, falling back to "other country".
+        values = (
+            "(%s,%s,%s,FROM_UNIXTIME(%s),FROM_UNIXTIME(%s),COALESCE(("
+            "SELECT locId FROM `blocks` WHERE %s BETWEEN startIpNum AND endIpNum LIMIT 1"
+            "),%s),%s)"
+        )
+        query = (
+            "INSERT INTO `attackers` (id,ip,dns,first_seen,last_seen,locId,n_attempts) "  # noqa: S608
+            f"VALUES {','.join([values] * len(rows))} "
+            "ON DUPLICATE KEY UPDATE "
+            "first_seen = LEAST(IFNULL(first_seen, VALUES(first_seen)), VALUES(first_seen)), "
+            "last_seen = GREATEST(IFNULL(last_seen, VALUES(last_seen)), VALUES(last_seen));"
+        )
+        args = []  # type: list[Any]
+        for atk_id, ip, dns, first_seen, last_seen, n_attempts in rows:
+            args += [atk_id, ip, dns, first_seen, last_seen]
+            args += [atk_id, BLACKNET_DEFAULT_LOCID, n_attempts]
+        return self.execute(query, args)
+
+    def upsert_attacker(self, args: Collection[Any]) -> bool:
+        """Insert a new attacker or extend the period during which it was seen.
+
+        Arguments are (id, ip, dns, first_seen, last_seen, n_attempts), tells
+        whether the attacker was just created.
+        """
+        # Affected rows are 1 for a new row, 2 for an updated one and 0 otherwise.
+        return self.__upsert_attackers([args]) == 1
+
+    def upsert_attackers(self, rows: Collection[Collection[Any]]) -> None:
+        """Insert or update many attackers with a single statement (see upsert_attacker)."""
+        if rows:
+            self.__upsert_attackers(rows)
+
+    def update_attacker_dns(self, atk_id: int, dns: str) -> None:
+        """Update the reverse DNS name of a given attacker."""
+        query = "UPDATE `attackers` SET dns = %s WHERE id = %s;"
+        return self.execute(query, [dns, atk_id])
+
     def insert_session(self, args: Collection[Any]) -> int:
         """Insert a new attack session to the database."""
         query = (
@@ -65,16 +202,50 @@ class BlacknetDatabaseCursor:
         self.execute(query, args)
         return self.__cursor.lastrowid
 
+    def intern_value(self, table: str, value: str) -> int:
+        """Get the identifier of a string from a lookup table, adding it when missing."""
+        query = f"SELECT id FROM `{table}` WHERE value = %s;"  # noqa: S608
+        if self.execute(query, [value]):
+            return self.fetchone()[0]
+
+        # Concurrent insertions of the same string are settled by the unique index.
+        query = (
+            f"INSERT INTO `{table}` (value) VALUES (%s) "  # noqa: S608
+            "ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id);"
+        )
+        self.execute(query, [value])
+        return self.__cursor.lastrowid
+
     def insert_attempt(self, args: Collection[Any]) -> int:
-        """Insert a single password attempt to the database."""
+        """Insert a single password attempt to the database.
+
+        Strings (user, password and client) are provided as lookup identifiers.
+        """
         query = (
             "INSERT INTO `attempts` "
-            "(attacker_id, session_id, user, password, target, date, client) "
+            "(attacker_id, session_id, user_id, password_id, target, date, client_id) "
             "VALUES (%s,%s,%s,%s,%s,FROM_UNIXTIME(%s),%s);"
         )
         self.execute(query, args)
         return self.__cursor.lastrowid
 
+    def insert_banners(self, rows: Iterable[Collection[Any]]) -> None:
+        """Insert a batch of client versions from banner-only connections."""
+        query = (
+            "INSERT INTO `banners` (attacker_id, target, date, client) "
+            "VALUES (%s,%s,FROM_UNIXTIME(%s),%s);"
+        )
+        self.executemany(query, rows)
+
+    def insert_attempts(self, rows: Iterable[Collection[Any]]) -> None:
+        """Insert many password attempts to the database at once."""
+        query = (
+            "INSERT INTO `attempts` "
+            "(attacker_id, session_id, user_id, password_id, target, date, client_id) "
+            "VALUES (%s,%s,%s,%s,%s,FROM_UNIXTIME(%s),%s);"
+        )
+        self.executemany(query, rows)
+
     def insert_pubkey(self, args: Collection[Any]) -> int:
         """Insert a new public key to the database."""
         query = "INSERT INTO `pubkeys` (name,fingerprint,data,bits)" "VALUES (%s,%s,%s,%s);"
@@ -193,96 +364,643 @@ class BlacknetDatabaseCursor:
             "latitude,longitude,metroCode,areaCode) "
             "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s);"
         )
+        return self.execute(query, self.__location_values(row))
+
+    def insert_blocks(self, rows: Iterable[Collection[Any]], table: str = "blocks") -> None:
+        """Insert many geolocation blocks at once (as multi-rows statements)."""
+        query = f"INSERT INTO `{table}` (startIpNum,endIpNum,locId) VALUES (%s,%s,%s);"  # noqa: S608
+        return self.executemany(query, rows)
+
+    def insert_locations(self, rows: Iterable[list[Any]], table: str = "locations") -> None:
+        """Insert many geolocations at once (as multi-rows statements)."""
+        query = (
+            f"INSERT INTO `{table}` "  # noqa: S608
+            "(locId,country,region,city,postalCode, "
+            "latitude,longitude,metroCode,areaCode) "
+            "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s);"
+        )
+        return self.executemany(query, [self.__location_values(row) for row in rows])
+
+    @staticmethod
+    def __location_values(row: list[Any]) -> list[Any]:
         # Make sure they are mapped to NULL.
         for i in (7, 8):
-            if not len(row[i]):
+            if row[i] == "":
                 row[i] = None
-        return self.execute(query, row)
+        return row
+
+    # Used for blacknet updater
+    def count_rows(self, table: str) -> int:
+        """Count rows of the provided table."""
+        self.execute(f"SELECT COUNT(*) FROM `{table}`;")  # noqa: S608
+        return self.fetchone()[0]
+
+    def shadow_create(self, table: str, indexes: Iterable[tuple[str, str]]) -> str:
+        """Create an empty staging copy of a table without its secondary indexes."""
+        shadow = f"{table}_new"
+        self.execute(f"DROP TABLE IF EXISTS `{shadow}`;")
+        self.execute(f"CREATE TABLE `{shadow}` LIKE `{table}`;")
+        self.replace_indexes(shadow, [name for name, _ in indexes], [])
+        return shadow
+
+    def shadow_swap(self, tables: Mapping[str, Iterable[tuple[str, str]]]) -> None:
+        """Replace tables by their staging copies at once, previous ones becoming `_old`.
+
+        Indexes of staging copies are built first, so that lookups keep using
+        the current tables until they are all renamed by a single statement.
+        """
+        renames = []
+        for table, indexes in tables.items():
+            self.replace_indexes(f"{table}_new", [], indexes)
+            self.execute(f"DROP TABLE IF EXISTS `{table}_old`;")
+            renames += [f"`{table}` TO `{table}_old`", f"`{table}_new` TO `{table}`"]
+        self.execute(f"RENAME TABLE {', '.join(renames)};")
+
+    def shadow_rollback(self, tables: Mapping[str, Iterable[tuple[str, str]]]) -> None:
+        """Swap tables with their previous generation (`_old`) at once."""
+        renames = []
+        for table in tables:
+            renames += [
+                f"`{table}` TO `{table}_tmp`",
+                f"`{table}_old` TO `{table}`",
+                f"`{table}_tmp` TO `{table}_old`",
+            ]
+        self.execute(f"RENAME TABLE {', '.join(renames)};")
+
+    def blocks_sorted(self) -> Iterator[tuple[int, int, int]]:
+        """Iterate over all geolocation blocks by ascending start address."""
+        query = "SELECT startIpNum, endIpNum, locId FROM `blocks` ORDER BY startIpNum;"
+        return self.stream(query)
+
+    def locations_sorted(self) -> Iterator[tuple[Any, ...]]:
+        """Iterate over all geolocations by ascending identifier."""
+        query = (
+            "SELECT locId, country, region, city, postalCode, "
+            "latitude, longitude, metroCode, areaCode "
+            "FROM `locations` ORDER BY locId;"
+        )
+        return self.stream(query)
+
+    def update_blocks(self, rows: Iterable[Collection[Any]]) -> None:
+        """Update ranges and locations of blocks, identified by start address."""
+        query = "UPDATE `blocks` SET endIpNum = %s, locId = %s WHERE startIpNum = %s;"
+        self.executemany(query, [(end, loc_id, start) for start, end, loc_id in rows])
+
+    def update_locations(self, rows: Iterable[list[Any]]) -> None:
+        """Update geolocations, identified by their first column (locId)."""
+        query = (
+            "UPDATE `locations` SET country = %s, region = %s, city = %s, "
+            "postalCode = %s, latitude = %s, longitude = %s, metroCode = %s, "
+            "areaCode = %s WHERE locId = %s;"
+        )
+        values = [self.__location_values(row) for row in rows]
+        self.executemany(query, [row[1:] + row[:1] for row in values])
+
+    def delete_blocks(self, starts: Iterable[int]) -> None:
+        """Delete geolocation blocks by start address."""
+        query = "DELETE FROM `blocks` WHERE startIpNum = %s;"
+        self.executemany(query, [(start,) for start in starts])
+
+    def delete_locations(self, ids: Iterable[int]) -> None:
+        """Delete geolocations by identifier."""
+        query = "DELETE FROM `locations` WHERE locId = %s;"
+        self.executemany(query, [(loc_id,) for loc_id in ids])
+
+    def geolocation_source(self, url: str) -> tuple[str | None, str | None, str] | None:
+        """Get (etag, last_modified, checksum) of the last import from url."""
+        query = (
+            "SELECT etag, last_modified, checksum FROM `geolocation_sources` WHERE url = %s;"
+        )
+        if self.execute(query, [url]):
+            return self.fetchone()
+        return None
+
+    def update_geolocation_source(
+        self, url: str, etag: str | None, last_modified: str | None, checksum: str
+    ) -> None:
+        """Record the state of the file that geolocation tables were imported from."""
+        query = (
+            "REPLACE INTO `geolocation_sources` "
+            "(url, etag, last_modified, checksum, imported) "
+            "VALUES (%s,%s,%s,%s,NOW());"
+        )
+        self.execute(query, [url, etag, last_modified, checksum])
+
+    def clear_geolocation_sources(self) -> None:
+        """Forget about imported files (tables do not match any of them anymore)."""
+        self.execute("DELETE FROM `geolocation_sources`;")
 
     # Used for blacknet scrubber
-    def missing_attackers(self) -> list[int]:
+    def missing_attackers(self) -> Iterator[int]:
         """Find any attacker that cannot be geolocated."""
         query = (
             "SELECT DISTINCT attacker_id FROM sessions "
             "WHERE attacker_id NOT IN (SELECT id FROM attackers);"
         )
-        res = self.execute(query)
-        if res:
-            return [a[0] for a in self.fetchall()]
-        return []
+        for row in self.stream(query):
+            yield row[0]
 
     def recompute_attacker_info(self, atk_id: int) -> tuple[int, int, int] | None:
-        """Recompute all fields from a provided attacker."""
+        """Recompute all fields from a provided attacker (archived and aggregated too)."""
         query = (
-            "SELECT UNIX_TIMESTAMP(MIN(date)), UNIX_TIMESTAMP(MAX(date)), COUNT(*) "
+            "SELECT UNIX_TIMESTAMP(MIN(first_date)), UNIX_TIMESTAMP(MAX(last_date)), "
+            "CAST(SUM(n) AS UNSIGNED) FROM ("
+            "SELECT MIN(date) AS first_date, MAX(date) AS last_date, COUNT(*) AS n "
             "FROM attempts WHERE attacker_id = %s "
-            "GROUP BY attacker_id LIMIT 1;"
+            "UNION ALL "
+            "SELECT MIN(first_attempt), MAX(last_attempt), SUM(n_attempts) "
+            "FROM archived_sessions WHERE attacker_id = %s "
+            "UNION ALL "
+            "SELECT NULL, NULL, SUM(n_attempts) "
+            "FROM aggregated_attempts WHERE attacker_id = %s"
+            ") AS A;"
         )
-        res = self.execute(query, [atk_id])
-        if res:
-            return self.fetchone()
+        self.execute(query, [atk_id, atk_id, atk_id])
+        row = self.fetchone()
+        if row is None or not row[2]:
+            return None
+        return row
+
+    def missing_attempts_count(self, table: str) -> Iterator[tuple[int, int, int]]:
+        """Find the missing attempts (archived and aggregated ones are counted apart)."""
+        query = (
+            "SELECT T.id, T.n_attempts, CAST(SUM(A.n) AS UNSIGNED) "  # noqa: S608
+            f"FROM {table}s AS T JOIN ("
+            f"SELECT {table}_id AS id, COUNT(*) AS n FROM attempts GROUP BY {table}_id "
+            "UNION ALL "
+            f"SELECT {table}_id, SUM(n_attempts) FROM archived_sessions GROUP BY {table}_id "
+            "UNION ALL "
+            f"SELECT {table}_id, SUM(n_attempts) FROM aggregated_attempts GROUP BY {table}_id"
+            ") AS A ON T.id = A.id "
+            "GROUP BY T.id "
+            "HAVING T.n_attempts != SUM(A.n);"
+        )
+        return self.stream(query)
+
+    def missing_dates(self, table: str) -> Iterator[tuple[int, int, int, int, int]]:
+        """Find all data mismatches (including archived attempts)."""
+        lsf = "last_seen" if table == "attacker" else "last_attempt"
+        fsf = "first_seen" if table == "attacker" else "first_attempt"
+
+        query = (
+            f"SELECT T.id, UNIX_TIMESTAMP(T.{fsf}), UNIX_TIMESTAMP(T.{lsf}), "  # noqa: S608
+            "UNIX_TIMESTAMP(MIN(A.first_date)), UNIX_TIMESTAMP(MAX(A.last_date)) "
+            f"FROM {table}s AS T JOIN ("
+            f"SELECT {table}_id AS id, MIN(date) AS first_date, MAX(date) AS last_date "
+            f"FROM attempts GROUP BY {table}_id "
+            "UNION ALL "
+            f"SELECT {table}_id, MIN(first_attempt), MAX(last_attempt) "
+            f"FROM archived_sessions GROUP BY {table}_id"
+            ") AS A ON T.id = A.id "
+            "GROUP BY T.id;"
+        )
+        return self.stream(query)
+
+    def get_attackers_location(self) -> Iterator[tuple[int, int]]:
+        """Find all attacker locations."""
+        query = "SELECT id, locId FROM attackers ORDER BY id;"
+        return self.stream(query)
+
+    def update_attacker_location(self, atk_id: int, locid: int) -> None:
+        """Update the attacker location."""
+        query = "UPDATE `attackers` SET locId = %s WHERE id = %s;"
+        return self.execute(query, [locid, atk_id])
+
+    # Used for blacknet archival
+    def archivable_attempts(self, before: int) -> int:
+        """Count attempts older than the provided timestamp (successful ones are kept)."""
+        query = (
+            "SELECT COUNT(*) FROM `attempts` "
+            "WHERE date < FROM_UNIXTIME(%s) AND success = 0;"
+        )
+        self.execute(query, [before])
+        row = self.fetchone()
+        return row[0] if row else 0
+
+    def archive_attempts(self, before: int, limit: int) -> list[Any]:
+        """Get the oldest attempts before the provided timestamp, with their strings."""
+        query = (
+            "SELECT attempts.id, attacker_id, session_id, target, UNIX_TIMESTAMP(date), "
+            "user_id, users.value, password_id, passwords.value, clients.value, "
+            "pubkeys.fingerprint "
+            "FROM `attempts` "
+            "JOIN `users` ON attempts.user_id = users.id "
+            "LEFT JOIN `passwords` ON attempts.password_id = passwords.id "
+            "JOIN `clients` ON attempts.client_id = clients.id "
+            "LEFT JOIN `attempts_pubkeys` ON attempts_pubkeys.attempt_id = attempts.id "
+            "LEFT JOIN `pubkeys` ON attempts_pubkeys.pubkey_id = pubkeys.id "
+            "WHERE date < FROM_UNIXTIME(%s) AND success = 0 "
+            "ORDER BY date LIMIT %s;"
+        )
+        if self.execute(query, [before, limit]):
+            return self.fetchall()
+        return []
+
+    def archive_sessions(self, rows: Iterable[Collection[Any]]) -> None:
+        """Add counters of archived attempts by session.
+
+        Rows are (session_id, attacker_id, first_attempt, last_attempt, n_attempts).
+        """
+        query = (
+            "INSERT INTO `archived_sessions` "
+            "(session_id, attacker_id, first_attempt, last_attempt, n_attempts) "
+            "VALUES (%s,%s,FROM_UNIXTIME(%s),FROM_UNIXTIME(%s),%s) "
+            "ON DUPLICATE KEY UPDATE "
+            "first_attempt = LEAST(first_attempt, VALUES(first_attempt)), "
+            "last_attempt = GREATEST(last_attempt, VALUES(last_attempt)), "
+            "n_attempts = n_attempts + VALUES(n_attempts);"
+        )
+        self.executemany(query, rows)
+
+    def archive_credentials(self, rows: Iterable[Collection[Any]]) -> None:
+        """Add counters of archived attempts by (user_id, password_id, n_attempts)."""
+        query = (
+            "INSERT INTO `archived_credentials` (user_id, password_id, n_attempts) "
+            "VALUES (%s,%s,%s) "
+            "ON DUPLICATE KEY UPDATE n_attempts = n_attempts + VALUES(n_attempts);"
+        )
+        self.executemany(query, rows)
+
+    def delete_attempts(self, ids: list[int], before: int) -> None:
+        """Delete archived attempts (the date restricts partitions to look into)."""
+        for start in range(0, len(ids), BLACKNET_DELETE_BATCH):
+            chunk = ids[start : start + BLACKNET_DELETE_BATCH]
+            marks = ",".join(["%s"] * len(chunk))
+            query = f"DELETE FROM `attempts_pubkeys` WHERE attempt_id IN ({marks});"  # noqa: S608
+            self.execute(query, chunk)
+            query = (
+                f"DELETE FROM `attempts` WHERE id IN ({marks}) "  # noqa: S608
+                "AND date < FROM_UNIXTIME(%s);"
+            )
+            self.execute(query, [*chunk, before])
+
+    def restore_attempts_count(self, table: str, rows: Iterable[Collection[Any]]) -> None:
+        """Add back (count, id) attempts of a table, removed by the deletion trigger."""
+        query = f"UPDATE `{table}s` SET n_attempts = n_attempts + %s WHERE id = %s;"  # noqa: S608
+        self.executemany(query, rows)
+
+    def insert_aggregated_attempts(self, rows: Iterable[Collection[Any]]) -> None:
+        """Count attempts aggregated by sensors, without their own row.
+
+        Rows are (session_id, attacker_id, user_id, password_id, n_attempts), no password
+        being 0. Sessions and attackers attempts counters are updated accordingly.
+        """
+        rows = list(rows)
+        query = (
+            "INSERT INTO `aggregated_attempts` "
+            "(session_id, attacker_id, user_id, password_id, n_attempts) "
+            "VALUES (%s,%s,%s,%s,%s) "
+            "ON DUPLICATE KEY UPDATE n_attempts = n_attempts + VALUES(n_attempts);"
+        )
+        self.executemany(query, rows)
+        self.restore_attempts_count("session", [(n, s_id) for s_id, _, _, _, n in rows])
+        self.restore_attempts_count("attacker", [(n, a_id) for _, a_id, _, _, n in rows])
+
+    # Used for read replicas
+    def replica_lag(self) -> float | None:
+        """Replication delay of this server (0 when not a replica, None when stopped)."""
+        for statement in ("SHOW REPLICA STATUS;", "SHOW SLAVE STATUS;"):
+            try:
+                self.execute(statement)
+            except pymysql.MySQLError:
+                continue  # Older servers only know about slaves.
+
+            row = self.fetchone()
+            if row is None:
+                return 0.0
+            columns = [d[0] for d in self.__cursor.description]
+            for name in ("Seconds_Behind_Source", "Seconds_Behind_Master"):
+                if name in columns:
+                    lag = row[columns.index(name)]
+                    return None if lag is None else float(lag)
         return None
 
-    def missing_attempts_count(self, table: str) -> list[tuple[int, int, int]]:
-        """Find the missing attempts."""
+    # Used for blacknet migrations
+    def table_exists(self, table: str) -> bool:
+        """Tell whether the provided table exists in the current database."""
+        query = (
+            "SELECT COUNT(*) FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s;"
+        )
+        self.execute(query, [table])
+        return bool(self.fetchone()[0])
+
+    def schema_version(self) -> int:
+        """Get the current schema version (0 for databases without any)."""
+        if not self.table_exists("schema_version"):
+            return 0
+        self.execute("SELECT MAX(version) FROM `schema_version`;")
+        return self.fetchone()[0] or 0
+
+    def create_schema_version(self) -> None:
+        """Create the table holding applied schema migrations."""
         query = (
-            "SELECT " + table + "s.id, " + table + "s.n_attempts, COUNT(*) "
-            "FROM " + table + "s "
-            "JOIN attempts ON " + table + "s.id = attempts." + table + "_id "
-            "GROUP BY " + table + "s.id "
-            "HAVING n_attempts != COUNT(*);"
+            "CREATE TABLE IF NOT EXISTS `schema_version` ("
+            "`version` int(10) unsigned NOT NULL, "
+            "`description` varchar(255) NOT NULL, "
+            "`applied` DATETIME NOT NULL, "
+            "PRIMARY KEY (`version`)"
+            ") ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;"
+        )
+        return self.execute(query)
+
+    def insert_schema_version(self, version: int, description: str) -> None:
+        """Record a newly applied schema migration."""
+        query = (
+            "INSERT INTO `schema_version` (version, description, applied) "
+            "VALUES (%s,%s,NOW());"
+        )
+        return self.execute(query, [version, description])
+
+    def table_engines(self) -> list[tuple[str, str]]:
+        """List all tables of the current database along with their storage engine."""
+        query = (
+            "SELECT TABLE_NAME, ENGINE FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE';"
         )
         res = self.execute(query)
         if res:
             return self.fetchall()
         return []
 
-    def missing_dates(self, table: str) -> list[tuple[int, int, int, int, int]]:
-        """Find all data mismatches."""
-        lsf = "last_seen" if table == "attacker" else "last_attempt"
-        fsf = "first_seen" if table == "attacker" else "first_attempt"
+    def alter_engine(self, table: str, engine: str) -> None:
+        """Convert the provided table to another storage engine."""
+        return self.execute(f"ALTER TABLE `{table}` ENGINE={engine};")
 
+    def table_indexes(self, table: str) -> list[str]:
+        """List names of all indexes of the provided table."""
         query = (
-            "SELECT " + table + "s.id, "
-            "UNIX_TIMESTAMP(" + fsf + "), UNIX_TIMESTAMP(" + lsf + "), "
-            "UNIX_TIMESTAMP(MIN(attempts.date)), UNIX_TIMESTAMP(MAX(attempts.date)) "
-            "FROM " + table + "s JOIN attempts "
-            "ON " + table + "s.id = attempts." + table + "_id "
-            "GROUP BY " + table + "s.id;"
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s;"
         )
-        res = self.execute(query)
+        res = self.execute(query, [table])
         if res:
-            return self.fetchall()
+            return [i[0] for i in self.fetchall()]
         return []
 
-    def get_attackers_location(self) -> list[tuple[int, int]]:
-        """Find all attacker locations."""
-        query = "SELECT id, locId FROM attackers ORDER BY id;"
+    def replace_indexes(
+        self, table: str, dropped: Iterable[str], added: Iterable[tuple[str, str]]
+    ) -> None:
+        """Drop and add indexes of a table at once, added ones being (name, columns)."""
+        existing = self.table_indexes(table)
+        changes = [f"DROP INDEX `{name}`" for name in dropped if name in existing]
+        changes += [
+            f"ADD INDEX `{name}` ({cols})" for name, cols in added if name not in existing
+        ]
+        if changes:
+            self.execute(f"ALTER TABLE `{table}` {', '.join(changes)};")
+
+    def attempts_oldest(self) -> datetime | None:
+        """Get the date of the oldest attempt (if any)."""
+        self.execute("SELECT MIN(date) FROM `attempts`;")
+        return self.fetchone()[0]
+
+    def attempts_partitions(self) -> list[str]:
+        """List all partitions of the attempts table, in order."""
+        query = (
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'attempts' "
+            "AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION;"
+        )
         res = self.execute(query)
         if res:
-            return self.fetchall()
+            return [p[0] for p in self.fetchall()]
         return []
 
-    def update_attacker_location(self, atk_id: int, locid: int) -> None:
-        """Update the attacker location."""
-        query = "UPDATE `attackers` SET locId = %s WHERE id = %s;"
-        return self.execute(query, [locid, atk_id])
+    def attempts_partition_by(self, partitions: Iterable[tuple[str, str]]) -> None:
+        """Partition attempts by range of dates, from (name, upper date) tuples.
+
+        Partitioning columns must be part of every unique key, thus the
+        primary key is extended with the (now mandatory) date.
+        """
+        query = "UPDATE `attempts` SET date = '1970-01-01 00:00:00' WHERE date IS NULL;"
+        self.execute(query)
+        query = (
+            "ALTER TABLE `attempts` MODIFY `date` DATETIME NOT NULL, "
+            "DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `date`);"
+        )
+        self.execute(query)
+        query = (
+            "ALTER TABLE `attempts` "
+            f"PARTITION BY RANGE (TO_DAYS(date)) ({self.__partitions(partitions)});"
+        )
+        return self.execute(query)
+
+    def attempts_partitions_split(self, partitions: Iterable[tuple[str, str]]) -> None:
+        """Create new partitions for attempts out of the catch-all partition."""
+        query = (
+            "ALTER TABLE `attempts` "
+            f"REORGANIZE PARTITION pmax INTO ({self.__partitions(partitions)});"
+        )
+        return self.execute(query)
+
+    def attempts_partition_drop(self, partition: str) -> None:
+        """Drop a whole partition of attempts, keeping counters consistent.
+
+        Triggers are not fired when dropping a partition.
+        """
+        for table in ["attacker", "session"]:
+            query = (
+                f"UPDATE `{table}s` JOIN ("  # noqa: S608
+                f"SELECT {table}_id AS t_id, COUNT(*) AS c "
+                f"FROM `attempts` PARTITION ({partition}) GROUP BY {table}_id"
+                f") AS ATT ON {table}s.id = ATT.t_id "
+                "SET n_attempts = n_attempts - LEAST(n_attempts, ATT.c);"
+            )
+            self.execute(query)
+        query = (
+            "DELETE attempts_pubkeys FROM `attempts_pubkeys` "
+            f"JOIN `attempts` PARTITION ({partition}) ON attempt_id = attempts.id;"
+        )
+        self.execute(query)
+        return self.execute(f"ALTER TABLE `attempts` DROP PARTITION {partition};")
+
+    def lookups_create(self) -> None:
+        """Create lookup tables holding interned attempt strings."""
+        for _, table, length in BLACKNET_LOOKUPS:
+            # Binary strings: values only differing by case or trailing spaces are
+            # distinct (utf8_bin is a PAD SPACE collation). Up to 3 bytes per character.
+            query = (
+                f"CREATE TABLE IF NOT EXISTS `{table}` ("
+                "`id` int(10) unsigned AUTO_INCREMENT, "
+                f"`value` varbinary({length * 3}) NOT NULL, "
+                "PRIMARY KEY (`id`), "
+                "UNIQUE (`value`)"
+                ") ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_bin;"
+            )
+            self.execute(query)
+
+    def lookups_fill(self, column: str, table: str) -> None:
+        """Intern all distinct strings of an attempts column in its lookup table."""
+        query = (
+            f"INSERT IGNORE INTO `{table}` (value) "  # noqa: S608
+            f"SELECT DISTINCT CAST(`{column}` AS BINARY) FROM `attempts` "
+            f"WHERE `{column}` IS NOT NULL;"
+        )
+        return self.execute(query)
+
+    def lookups_binary(self) -> None:
+        """Store values of lookup tables as binary strings, compared without padding."""
+        for _, table, length in BLACKNET_LOOKUPS:
+            self.execute(
+                f"ALTER TABLE `{table}` MODIFY `value` varbinary({length * 3}) NOT NULL;"
+            )
+
+    def attempts_add_lookups(self) -> None:
+        """Add lookup identifiers columns to attempts."""
+        query = (
+            "ALTER TABLE `attempts` "
+            "ADD `user_id` int(10) unsigned AFTER `session_id`, "
+            "ADD `password_id` int(10) unsigned AFTER `user_id`, "
+            "ADD `client_id` int(10) unsigned AFTER `date`;"
+        )
+        return self.execute(query)
+
+    def attempts_ids(self) -> tuple[int, int] | None:
+        """Get the lowest and highest identifiers of attempts (if any)."""
+        self.execute("SELECT MIN(id), MAX(id) FROM `attempts`;")
+        row = self.fetchone()
+        if row is None or row[0] is None:
+            return None
+        return (row[0], row[1])
+
+    def attempts_set_lookups(self, first: int, last: int) -> int:
+        """Fill lookup identifiers of attempts from first to last id (included)."""
+        values = ", ".join(
+            f"{column}_id = (SELECT id FROM `{table}` "  # noqa: S608
+            f"WHERE value = CAST(attempts.{column} AS BINARY))"
+            for column, table, _ in BLACKNET_LOOKUPS
+        )
+        query = f"UPDATE `attempts` SET {values} WHERE id BETWEEN %s AND %s;"  # noqa: S608
+        return self.execute(query, [first, last])
+
+    def attempts_drop_strings(self) -> None:
+        """Drop attempts strings (and their indexes) replaced by lookup identifiers."""
+        query = (
+            "ALTER TABLE `attempts` "
+            "DROP `user`, DROP `password`, DROP `client`, "
+            "MODIFY `user_id` int(10) unsigned NOT NULL, "
+            "MODIFY `client_id` int(10) unsigned NOT NULL, "
+            "ADD INDEX (`user_id`, `password_id`), "
+            "ADD INDEX (`password_id`);"
+        )
+        return self.execute(query)
+
+    def archives_create(self) -> None:
+        """Create tables holding counters of archived attempts."""
+        query = (
+            "CREATE TABLE IF NOT EXISTS `archived_sessions` ("
+            "`session_id` int(10) unsigned NOT NULL, "
+            "`attacker_id` int(10) unsigned NOT NULL, "
+            "`first_attempt` DATETIME, "
+            "`last_attempt` DATETIME, "
+            "`n_attempts` int(10) unsigned DEFAULT 0, "
+            "PRIMARY KEY (`session_id`), "
+            "INDEX (`attacker_id`)"
+            ") ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;"
+        )
+        self.execute(query)
+        query = (
+            "CREATE TABLE IF NOT EXISTS `archived_credentials` ("
+            "`user_id` int(10) unsigned NOT NULL, "
+            "`password_id` int(10) unsigned NOT NULL, "
+            "`n_attempts` int(10) unsigned DEFAULT 0, "
+            "PRIMARY KEY (`user_id`, `password_id`), "
+            "INDEX (`password_id`)"
+            ") ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;"
+        )
+        self.execute(query)
+
+    def aggregates_create(self) -> None:
+        """Create the table holding counters of attempts aggregated by sensors."""
+        query = (
+            "CREATE TABLE IF NOT EXISTS `aggregated_attempts` ("
+            "`session_id` int(10) unsigned NOT NULL, "
+            "`attacker_id` int(10) unsigned NOT NULL, "
+            "`user_id` int(10) unsigned NOT NULL, "
+            "`password_id` int(10) unsigned NOT NULL, "
+            "`n_attempts` int(10) unsigned DEFAULT 0, "
+            "PRIMARY KEY (`session_id`, `user_id`, `password_id`), "
+            "INDEX (`attacker_id`)"
+            ") ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;"
+        )
+        return self.execute(query)
+
+    def banners_create(self) -> None:
+        """Create the table holding client versions of banner-only connections."""
+        query = (
+            "CREATE TABLE IF NOT EXISTS `banners` ("
+            "`id` int(10) unsigned AUTO_INCREMENT, "
+            "`attacker_id` int(10) unsigned NOT NULL, "
+            "`target` varchar(15) NOT NULL, "
+            "`date` DATETIME, "
+            '`client` varchar(128) DEFAULT "" NOT NULL, '
+            "PRIMARY KEY (`id`), "
+            "INDEX (`attacker_id`), "
+            "INDEX (`date`)"
+            ") ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;"
+        )
+        return self.execute(query)
+
+    def geolocation_sources_create(self) -> None:
+        """Create the table holding the state of imported geolocation files."""
+        query = (
+            "CREATE TABLE IF NOT EXISTS `geolocation_sources` ("
+            "`url` varchar(255) NOT NULL, "
+            "`etag` varchar(255) DEFAULT NULL, "
+            "`last_modified` varchar(64) DEFAULT NULL, "
+            "`checksum` char(64) NOT NULL, "
+            "`imported` DATETIME NOT NULL, "
+            "PRIMARY KEY (`url`)"
+            ") ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;"
+        )
+        return self.execute(query)
+
+    @staticmethod
+    def __partitions(partitions: Iterable[tuple[str, str]]) -> str:
+        defs = [
+            f"PARTITION {name} VALUES LESS THAN (TO_DAYS('{until}'))"
+            for name, until in partitions
+        ]
+        defs.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        return ", ".join(defs)
 
 
 class BlacknetDatabase(BlacknetConfigurationInterface):
     """Blacknet database connection management."""
 
+    cursor_class = BlacknetDatabaseCursor
+
     def __init__(
         self,
         config: BlacknetConfig,
         logger: BlacknetLogger | None = None,
+        metrics: BlacknetMetrics | None = None,
+        breaker: BlacknetCircuitBreaker | None = None,
+        role: str = "mysql",
     ) -> None:
-        """Get logger and configuration structures from the caller."""
-        BlacknetConfigurationInterface.__init__(self, config, "mysql")
+        """Get logger, metrics and configuration structures from the caller.
+
+        A circuit breaker can be shared between databases using the same server,
+        so that a single connection attempt probes it while it is down.
+        """
+        BlacknetConfigurationInterface.__init__(self, config, role)
         self.__connection_parameters = None  # type: Optional[DbConnectionParams]
         self.__connection_lock = Lock()
         self.__logger = logger
-        self.__database = None  # type: Optional[pymysql.Connection[Any]]
+        self.__database = None  # type: Optional[DbConnection]
+        self.__stream_database = None  # type: Optional[DbConnection]
+        self.__fetch_batch_size = None  # type: Optional[int]
+        self.__metrics = metrics
+        self.__query_stats = None  # type: Optional[bool]
+        self.__slow_query_time = None  # type: Optional[float]
+        if breaker is None:
+            breaker = BlacknetCircuitBreaker(role, self.log_warning, metrics)
+        self.__breaker = breaker
+        self.__replica = None  # type: Optional[BlacknetDatabase]
+        self.__max_replica_lag = None  # type: Optional[float]
+        self.__explained = None  # type: Optional[list[DbQueryPlan]]
 
     def _get_connection_parameters(self) -> DbConnectionParams:
         if self.has_config("socket"):
@@ -304,14 +1022,143 @@ class BlacknetDatabase(BlacknetConfigurationInterface):
         return self.__connection_parameters
 
     @property
-    def database(self) -> pymysql.Connection[Any]:
+    def database(self) -> DbConnection:
         """Get a handle on the database instance."""
         if self.__database is None:
             self.connect()
             if self.__database is None:
-                raise Exception("Could not connect to the database!")
+                raise BlacknetDatabaseUnavailableError("Could not connect to the database!")
         return self.__database
 
+    @property
+    def stream_database(self) -> DbConnection:
+        """Get a handle on the connection dedicated to streamed queries."""
+        if self.__stream_database is None:
+            with self.__connection_lock:
+                try:
+                    params = self.connection_parameters
+                    self.__stream_database = self.__breaker_connect(params)
+                except BlacknetDatabaseUnavailableError:
+                    raise
+                except Exception as e:
+                    self.log_error("database: %s" % e)
+                    raise BlacknetDatabaseUnavailableError(
+                        "Could not connect to the database!"
+                    ) from e
+        return self.__stream_database
+
+    @property
+    def replica(self) -> BlacknetDatabase:
+        """Read replica configured in the [mysql_read] section (or this database)."""
+        if self.__replica is None:
+            if self.config.has_section("mysql_read"):
+                self.__replica = BlacknetDatabase(
+                    self.config, self.__logger, self.__metrics, role="mysql_read"
+                )
+            else:
+                self.__replica = self
+        return self.__replica
+
+    @property
+    def max_replica_lag(self) -> float:
+        """Maximum replication delay for reports to be read from this database."""
+        if self.__max_replica_lag is None:
+            if self.has_config("max_replica_lag"):
+                self.__max_replica_lag = float(self.get_config("max_replica_lag"))
+            else:
+                self.__max_replica_lag = BLACKNET_REPLICA_MAX_LAG
+        return self.__max_replica_lag
+
+    def reader(self) -> BlacknetDatabase:
+        """Database for read-only reports, the replica unless it lags behind.
+
+        Reports fall back to this (primary) database whenever the replica is
+        unreachable, stopped or late by more than its max_replica_lag.
+        """
+        replica = self.replica
+        if replica is self:
+            return self
+
+        try:
+            lag = replica.cursor().replica_lag()
+        except Exception as e:
+            self.log_warning(f"replica: {e}, reading from the primary")
+            return self
+
+        if lag is None:
+            self.log_warning("replica: replication is stopped, reading from the primary")
+            return self
+        if lag > replica.max_replica_lag:
+            self.log_warning(f"replica: {lag:.0f}s behind, reading from the primary")
+            return self
+        return replica
+
+    @property
+    def explained(self) -> list[DbQueryPlan] | None:
+        """Plans of queries explained so far (None unless explaining)."""
+        return self.__explained
+
+    def explain_start(self) -> None:
+        """Explain read queries instead of running them, skip all others."""
+        self.__explained = []
+
+    def explain_stop(self) -> list[DbQueryPlan]:
+        """Go back to running queries, returning plans of explained ones."""
+        explained = self.__explained or []
+        self.__explained = None
+        return explained
+
+    @property
+    def breaker(self) -> BlacknetCircuitBreaker:
+        """Circuit breaker guarding connections to the database."""
+        return self.__breaker
+
+    @property
+    def fetch_batch_size(self) -> int:
+        """Number of rows read at once from streamed queries."""
+        if self.__fetch_batch_size is None:
+            if self.has_config("fetch_batch_size"):
+                self.__fetch_batch_size = int(self.get_config("fetch_batch_size"))
+            else:
+                self.__fetch_batch_size = BLACKNET_DATABASE_FETCH_BATCH
+        return self.__fetch_batch_size
+
+    @property
+    def query_stats(self) -> bool:
+        """Whether query durations are recorded in metrics (per calling method)."""
+        if self.__query_stats is None:
+            if self.__metrics is not None and self.has_config("query_stats"):
+                self.__query_stats = self.get_config_bool("query_stats")
+            else:
+                self.__query_stats = False
+        return self.__query_stats
+
+    @property
+    def slow_query_time(self) -> float:
+        """Queries lasting longer than this are logged (seconds, 0 to disable)."""
+        if self.__slow_query_time is None:
+            if self.has_config("slow_query_time"):
+                self.__slow_query_time = float(self.get_config("slow_query_time"))
+            else:
+                self.__slow_query_time = 0.0
+        return self.__slow_query_time
+
+    @property
+    def query_timing(self) -> bool:
+        """Whether queries need to be timed at all."""
+        return self.query_stats or self.slow_query_time > 0
+
+    def query_observe(self, name: str, query: str, duration: float) -> None:
+        """Account for a query that took duration seconds to run."""
+        if self.__metrics is not None and self.query_stats:
+            self.__metrics.histogram(f"sql.{name}").observe(duration)
+
+        slow_query_time = self.slow_query_time
+        if slow_query_time > 0 and duration > slow_query_time:
+            if self.__metrics is not None:
+                self.__metrics.counter("sql.slow_queries").inc()
+            self.log_warning(f"slow query in {name} ({duration:.3f}s): {query[:256]}")
+
     def log(self, message: str, level: int = BLACKNET_LOG_DEFAULT) -> None:
         """Write something to the attached logger."""
         if self.__logger:
@@ -321,6 +1168,10 @@ class BlacknetDatabase(BlacknetConfigurationInterface):
         """Write an error message to the logger."""
         self.log(message, BLACKNET_LOG_ERROR)
 
+    def log_warning(self, message: str) -> None:
+        """Write a warning message to the logger."""
+        self.log(message, BLACKNET_LOG_WARNING)
+
     def log_info(self, message: str) -> None:
         """Write an informational message to the logger."""
         self.log(message, BLACKNET_LOG_INFO)
@@ -328,30 +1179,53 @@ class BlacknetDatabase(BlacknetConfigurationInterface):
     def reload(self) -> None:
         """Reload database configuration."""
         params = self._get_connection_parameters()
+        self.__fetch_batch_size = None
+        self.__query_stats = None
+        self.__slow_query_time = None
+        self.__max_replica_lag = None
+        if self.__replica is not None and self.__replica is not self:
+            self.__replica.reload()
 
         if params != self.connection_parameters:
             self.__connection_parameters = params
             self.disconnect()
 
+    def _connect(self, params: DbConnectionParams) -> DbConnection:
+        socket, host, user, passwd, database = params
+        kwargs = {
+            "host": host,
+            "user": user,
+            "password": passwd,
+            "db": database,
+            "unix_socket": socket,
+            "charset": "utf8",
+        }
+        return pymysql.connect(**kwargs)  # type: ignore
+
+    def __breaker_connect(self, params: DbConnectionParams) -> DbConnection:
+        """Connect to the database, unless the circuit breaker is open."""
+        if not self.__breaker.allow():
+            raise BlacknetDatabaseUnavailableError("circuit breaker open")
+        try:
+            connection = self._connect(params)
+        except Exception:
+            self.__breaker.failure()
+            raise
+        self.__breaker.success()
+        return connection
+
     def connect(self, params: DbConnectionParams | None = None) -> None:
         """Connect to the database."""
         if not params:
             params = self.connection_parameters
-        socket, host, user, passwd, database = params
 
         self.__connection_lock.acquire()
         try:
             if not self.__database:
-                kwargs = {
-                    "host": host,
-                    "user": user,
-                    "password": passwd,
-                    "db": database,
-                    "unix_socket": socket,
-                    "charset": "utf8",
-                }
-                self.__database = pymysql.connect(**kwargs)  # type: ignore
+                self.__database = self.__breaker_connect(params)
                 self.log_info("pymysql: database connection successful")
+        except BlacknetDatabaseUnavailableError:
+            pass  # Already reported when the circuit breaker was opened.
         except Exception as e:
             self.log_error("database: %s" % e)
         finally:
@@ -365,12 +1239,16 @@ class BlacknetDatabase(BlacknetConfigurationInterface):
                     self.__database.commit()
                     self.__database.close()
                 self.__database = None
+            if self.__stream_database:
+                with suppress(BaseException):
+                    self.__stream_database.close()
+                self.__stream_database = None
+        if self.__replica is not None and self.__replica is not self:
+            self.__replica.disconnect()
 
     def escape_string(self, query: str) -> str:
         """Manually escape a query using the datbase."""
-        if self.__database is not None:
-            return self.__database.escape_string(query)
-        return query
+        return self.database.escape_string(query)
 
     def commit(self) -> None:
         """Commit all changes to the database now."""
@@ -379,4 +1257,328 @@ class BlacknetDatabase(BlacknetConfigurationInterface):
 
     def cursor(self) -> BlacknetDatabaseCursor:
         """Build a database cursor from the database."""
-        return BlacknetDatabaseCursor(self, self.__logger)
+        return self.cursor_class(self, self.__logger)
+
+
+class BlacknetSQLiteDatabaseCursor(BlacknetDatabaseCursor):
+    """Database cursor for SQLite databases, where MySQL syntax differs."""
+
+    explain_prefix = "EXPLAIN QUERY PLAN "
+
+    def upsert_attacker(self, args: Collection[Any]) -> bool:
+        """Insert a new attacker or extend the period during which it was seen."""
+        atk_id, ip, dns, first_seen, last_seen, n_attempts = args
+        query = (
+            "INSERT OR IGNORE INTO `attackers` "
+            "(id,ip,dns,first_seen,last_seen,locId,n_attempts) "
+            "VALUES (%s,%s,%s,FROM_UNIXTIME(%s),FROM_UNIXTIME(%s),COALESCE(("
+            "SELECT locId FROM `blocks` WHERE %s BETWEEN startIpNum AND endIpNum LIMIT 1"
+            "),%s),%s);"
+        )
+        row = [atk_id, ip, dns, first_seen, last_seen, atk_id, BLACKNET_DEFAULT_LOCID]
+        if self.execute(query, [*row, n_attempts]):
+            return True
+
+        query = (
+            "UPDATE `attackers` SET "
+            "first_seen = MIN(IFNULL(first_seen, FROM_UNIXTIME(%s)), FROM_UNIXTIME(%s)), "
+            "last_seen = MAX(IFNULL(last_seen, FROM_UNIXTIME(%s)), FROM_UNIXTIME(%s)) "
+            "WHERE id = %s;"
+        )
+        self.execute(query, [first_seen, first_seen, last_seen, last_seen, atk_id])
+        return False
+
+    def upsert_attackers(self, rows: Collection[Collection[Any]]) -> None:
+        """Insert or update many attackers (see upsert_attacker)."""
+        for row in rows:
+            self.upsert_attacker(row)
+
+    def intern_value(self, table: str, value: str) -> int:
+        """Get the identifier of a string from a lookup table, adding it when missing."""
+        query = f"INSERT OR IGNORE INTO `{table}` (value) VALUES (%s);"  # noqa: S608
+        self.execute(query, [value])
+        query = f"SELECT id FROM `{table}` WHERE value = %s;"  # noqa: S608
+        self.execute(query, [value])
+        return self.fetchone()[0]
+
+    def truncate(self, table: str) -> None:
+        """Truncate the provided table."""
+        return self.execute(f"DELETE FROM `{table}`;")  # noqa: S608
+
+    def optimize(self, table: str) -> None:
+        """Optimize the provided table."""
+        return self.execute(f"ANALYZE `{table}`;")
+
+    def table_exists(self, table: str) -> bool:
+        """Tell whether the provided table exists in the current database."""
+        query = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s;"
+        self.execute(query, [table])
+        return bool(self.fetchone()[0])
+
+    def create_schema_version(self) -> None:
+        """Create the table holding applied schema migrations."""
+        query = (
+            "CREATE TABLE IF NOT EXISTS `schema_version` ("
+            "`version` INTEGER PRIMARY KEY, "
+            "`description` TEXT NOT NULL, "
+            "`applied` DATETIME NOT NULL"
+            ");"
+        )
+        return self.execute(query)
+
+    def table_indexes(self, table: str) -> list[str]:
+        """List names of all indexes of the provided table."""
+        query = "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s;"
+        res = self.execute(query, [table])
+        if res:
+            return [i[0] for i in self.fetchall()]
+        return []
+
+    def replace_indexes(
+        self, table: str, dropped: Iterable[str], added: Iterable[tuple[str, str]]
+    ) -> None:
+        """Drop and add indexes of a table, prefixed by its name (names are global)."""
+        for name in dropped:
+            self.execute(f"DROP INDEX IF EXISTS `{table}_{name}`;")
+        for name, cols in added:
+            self.execute(f"CREATE INDEX IF NOT EXISTS `{table}_{name}` ON `{table}` ({cols});")
+
+    def attempts_partitions(self) -> list[str]:
+        """List all partitions of the attempts table (SQLite has none)."""
+        return []
+
+    def lookups_create(self) -> None:
+        """Create lookup tables holding interned attempt strings."""
+        for _, table, _ in BLACKNET_LOOKUPS:
+            query = (
+                f"CREATE TABLE IF NOT EXISTS `{table}` ("
+                "`id` INTEGER PRIMARY KEY, "
+                "`value` TEXT NOT NULL UNIQUE"
+                ");"
+            )
+            self.execute(query)
+
+    def lookups_fill(self, column: str, table: str) -> None:
+        """Intern all distinct strings of an attempts column in its lookup table."""
+        query = (
+            f"INSERT OR IGNORE INTO `{table}` (value) "  # noqa: S608
+            f"SELECT DISTINCT `{column}` FROM `attempts` WHERE `{column}` IS NOT NULL;"
+        )
+        return self.execute(query)
+
+    def lookups_binary(self) -> None:
+        """Store values of lookup tables as binary strings (TEXT already compares bytes)."""
+
+    def attempts_add_lookups(self) -> None:
+        """Add lookup identifiers columns to attempts."""
+        for column, _, _ in BLACKNET_LOOKUPS:
+            self.execute(f"ALTER TABLE `attempts` ADD `{column}_id` INTEGER;")
+
+    def attempts_drop_strings(self) -> None:
+        """Drop attempts strings (and their indexes) replaced by lookup identifiers."""
+        for index in ("attempts_user", "attempts_password", "attempts_user_password"):
+            self.execute(f"DROP INDEX IF EXISTS `{index}`;")
+        for column, _, _ in BLACKNET_LOOKUPS:
+            self.execute(f"ALTER TABLE `attempts` DROP `{column}`;")
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS `attempts_user_password` "
+            "ON `attempts` (`user_id`, `password_id`);"
+        )
+        self.execute(
+            "CREATE INDEX IF NOT EXISTS `attempts_password` ON `attempts` (`password_id`);"
+        )
+
+    def shadow_create(self, table: str, indexes: Iterable[tuple[str, str]]) -> str:
+        """Create an empty staging copy of a table, indexes being created when swapped."""
+        shadow = f"{table}_new"
+        self.execute(f"DROP TABLE IF EXISTS `{shadow}`;")
+        self.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s;", [table]
+        )
+        query = re.sub(r"^CREATE TABLE\s+\S+", f"CREATE TABLE `{shadow}`", self.fetchone()[0])
+        self.execute(query)
+        return shadow
+
+    def __swap(
+        self, table: str, indexes: Iterable[tuple[str, str]], renames: list[str]
+    ) -> None:
+        # Index names are global, they are moved to the table being renamed in.
+        indexes = list(indexes)
+        self.replace_indexes(table, [name for name, _ in indexes], [])
+        for rename in renames:
+            self.execute(f"ALTER TABLE {rename};")
+        self.replace_indexes(table, [], indexes)
+
+    def shadow_swap(self, tables: Mapping[str, Iterable[tuple[str, str]]]) -> None:
+        """Replace tables by their staging copies at once, previous ones becoming `_old`.
+
+        All changes are performed by a single transaction, readers keep using
+        current tables until it is committed.
+        """
+        self.execute("BEGIN IMMEDIATE;")
+        for table, indexes in tables.items():
+            self.execute(f"DROP TABLE IF EXISTS `{table}_old`;")
+            renames = [
+                f"`{table}` RENAME TO `{table}_old`",
+                f"`{table}_new` RENAME TO `{table}`",
+            ]
+            self.__swap(table, indexes, renames)
+
+    def shadow_rollback(self, tables: Mapping[str, Iterable[tuple[str, str]]]) -> None:
+        """Swap tables with their previous generation (`_old`) at once."""
+        self.execute("BEGIN IMMEDIATE;")
+        for table, indexes in tables.items():
+            renames = [
+                f"`{table}` RENAME TO `{table}_tmp`",
+                f"`{table}_old` RENAME TO `{table}`",
+                f"`{table}_tmp` RENAME TO `{table}_old`",
+            ]
+            self.__swap(table, indexes, renames)
+
+    def archive_sessions(self, rows: Iterable[Collection[Any]]) -> None:
+        """Add counters of archived attempts by session (see parent class)."""
+        rows = list(rows)
+        query = (
+            "INSERT OR IGNORE INTO `archived_sessions` "
+            "(session_id, attacker_id, first_attempt, last_attempt, n_attempts) "
+            "VALUES (%s,%s,FROM_UNIXTIME(%s),FROM_UNIXTIME(%s),0);"
+        )
+        self.executemany(query, [row[:4] for row in map(tuple, rows)])
+        query = (
+            "UPDATE `archived_sessions` SET "
+            "first_attempt = MIN(first_attempt, FROM_UNIXTIME(%s)), "
+            "last_attempt = MAX(last_attempt, FROM_UNIXTIME(%s)), "
+            "n_attempts = n_attempts + %s "
+            "WHERE session_id = %s;"
+        )
+        self.executemany(query, [(first, last, n, s_id) for s_id, _, first, last, n in rows])
+
+    def archive_credentials(self, rows: Iterable[Collection[Any]]) -> None:
+        """Add counters of archived attempts by (user_id, password_id, n_attempts)."""
+        rows = list(rows)
+        query = (
+            "INSERT OR IGNORE INTO `archived_credentials` (user_id, password_id, n_attempts) "
+            "VALUES (%s,%s,0);"
+        )
+        self.executemany(query, [(u_id, p_id) for u_id, p_id, _ in rows])
+        query = (
+            "UPDATE `archived_credentials` SET n_attempts = n_attempts + %s "
+            "WHERE user_id = %s AND password_id = %s;"
+        )
+        self.executemany(query, [(n, u_id, p_id) for u_id, p_id, n in rows])
+
+    def archives_create(self) -> None:
+        """Create tables holding counters of archived attempts."""
+        self.execute(
+            "CREATE TABLE IF NOT EXISTS `archived_sessions` ("
+            "`session_id` INTEGER PRIMARY KEY, "
+            "`attacker_id` INTEGER NOT NULL, "
+            "`first_attempt` DATETIME, "
+            "`last_attempt` DATETIME, "
+            "`n_attempts` INTEGER DEFAULT 0"
+            ");"
+        )
+        self.execute(
+            "CREATE TABLE IF NOT EXISTS `archived_credentials` ("
+            "`user_id` INTEGER NOT NULL, "
+            "`password_id` INTEGER NOT NULL, "
+            "`n_attempts` INTEGER DEFAULT 0, "
+            "PRIMARY KEY (`user_id`, `password_id`)"
+            ");"
+        )
+        self.replace_indexes("archived_sessions", [], [("attacker_id", "`attacker_id`")])
+        self.replace_indexes("archived_credentials", [], [("password_id", "`password_id`")])
+
+    def insert_aggregated_attempts(self, rows: Iterable[Collection[Any]]) -> None:
+        """Count attempts aggregated by sensors, without their own row (see parent class)."""
+        rows = list(rows)
+        query = (
+            "INSERT OR IGNORE INTO `aggregated_attempts` "
+            "(session_id, attacker_id, user_id, password_id, n_attempts) "
+            "VALUES (%s,%s,%s,%s,0);"
+        )
+        self.executemany(query, [row[:4] for row in map(tuple, rows)])
+        query = (
+            "UPDATE `aggregated_attempts` SET n_attempts = n_attempts + %s "
+            "WHERE session_id = %s AND user_id = %s AND password_id = %s;"
+        )
+        self.executemany(query, [(n, s_id, u_id, p_id) for s_id, _, u_id, p_id, n in rows])
+        self.restore_attempts_count("session", [(n, s_id) for s_id, _, _, _, n in rows])
+        self.restore_attempts_count("attacker", [(n, a_id) for _, a_id, _, _, n in rows])
+
+    def aggregates_create(self) -> None:
+        """Create the table holding counters of attempts aggregated by sensors."""
+        self.execute(
+            "CREATE TABLE IF NOT EXISTS `aggregated_attempts` ("
+            "`session_id` INTEGER NOT NULL, "
+            "`attacker_id` INTEGER NOT NULL, "
+            "`user_id` INTEGER NOT NULL, "
+            "`password_id` INTEGER NOT NULL, "
+            "`n_attempts` INTEGER DEFAULT 0, "
+            "PRIMARY KEY (`session_id`, `user_id`, `password_id`)"
+            ");"
+        )
+        self.replace_indexes("aggregated_attempts", [], [("attacker_id", "`attacker_id`")])
+
+    def geolocation_sources_create(self) -> None:
+        """Create the table holding the state of imported geolocation files."""
+        query = (
+            "CREATE TABLE IF NOT EXISTS `geolocation_sources` ("
+            "`url` TEXT PRIMARY KEY, "
+            "`etag` TEXT DEFAULT NULL, "
+            "`last_modified` TEXT DEFAULT NULL, "
+            "`checksum` TEXT NOT NULL, "
+            "`imported` DATETIME NOT NULL"
+            ");"
+        )
+        return self.execute(query)
+
+    def banners_create(self) -> None:
+        """Create the table holding client versions of banner-only connections."""
+        self.execute(
+            "CREATE TABLE IF NOT EXISTS `banners` ("
+            "`id` INTEGER PRIMARY KEY, "
+            "`attacker_id` INTEGER NOT NULL, "
+            "`target` TEXT NOT NULL, "
+            "`date` DATETIME, "
+            "`client` TEXT NOT NULL DEFAULT ''"
+            ");"
+        )
+        self.replace_indexes(
+            "banners", [], [("attacker_id", "`attacker_id`"), ("date", "`date`")]
+        )
+
+
+class BlacknetSQLiteDatabase(BlacknetDatabase):
+    """Embedded SQLite database, the "database" entry being a file path."""
+
+    cursor_class = BlacknetSQLiteDatabaseCursor
+
+    @property
+    def replica(self) -> BlacknetDatabase:
+        """SQLite readers do not block the writer, reports use this database."""
+        return self
+
+    def _get_connection_parameters(self) -> DbConnectionParams:
+        return (None, None, "", "", self.get_config("database"))
+
+    def _connect(self, params: DbConnectionParams) -> DbConnection:
+        return BlacknetSQLiteConnection(params[4])
+
+
+def blacknet_database(
+    config: BlacknetConfig,
+    logger: BlacknetLogger | None = None,
+    metrics: BlacknetMetrics | None = None,
+    breaker: BlacknetCircuitBreaker | None = None,
+) -> BlacknetDatabase:
+    """Build the database connection manager for the configured backend."""
+    backend = "mysql"
+    if config.has_option("mysql", "backend"):
+        backend = config.get("mysql", "backend")
+
+    if backend == "sqlite":
+        return BlacknetSQLiteDatabase(config, logger, metrics, breaker)
+    if backend != "mysql":
+        raise ValueError(f"unknown database backend: {backend}")
+    return BlacknetDatabase(config, logger, metrics, breaker)
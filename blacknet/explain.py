@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import sys
+from typing import Any
+
+from .database import DbQueryPlan
+from .scrubber import BlacknetScrubber
+
+# Target name used by per-target queries (plans do not depend on its existence).
+BLACKNET_EXPLAIN_TARGET = "honeypot"
+
+
+class BlacknetExplainer:
+    """Display execution plans of hot queries, to check which indexes they use.
+
+    Queries are captured from the actual master and scrubber code paths: read
+    queries are explained instead of being run while all others are skipped,
+    so that nothing is ever written to the database.
+    """
+
+    def __init__(self, cfg_file: str | None = None) -> None:
+        """Load configuration file and database parameters (using the scrubber)."""
+        self.__scrubber = BlacknetScrubber(cfg_file)
+        self.__scrubber.verbosity = 0
+
+    def __run_queries(self) -> None:
+        scrubber = self.__scrubber
+        target = BLACKNET_EXPLAIN_TARGET
+
+        # Master lookups (for each received attempt).
+        cursor = scrubber.database.cursor()
+        cursor.check_attacker(0)
+        cursor.check_session(0, target)
+        cursor.check_pubkey("")
+        cursor.get_locid(0)
+
+        # Scrubber checks.
+        list(cursor.missing_attackers())
+        cursor.recompute_attacker_info(0)
+        for table in ("attacker", "session"):
+            list(cursor.missing_attempts_count(table))
+            list(cursor.missing_dates(table))
+        list(cursor.get_attackers_location())
+
+        # Scrubber reports, global and for a single target.
+        scrubber.generate_targets()
+        scrubber.targets = [(target, 1, 1)]
+        scrubber.generate_stats()
+        scrubber.generate_map_data()
+        scrubber.generate_minimaps()
+
+    def explain(self) -> list[DbQueryPlan]:
+        """Capture execution plans of all hot queries."""
+        scrubber = self.__scrubber
+        databases = [scrubber.database]
+        if scrubber.reports_database is not scrubber.database:
+            databases.append(scrubber.reports_database)
+
+        for database in databases:
+            database.explain_start()
+        try:
+            self.__run_queries()
+        finally:
+            plans = []
+            for database in databases:
+                plans += database.explain_stop()
+        return plans
+
+    @staticmethod
+    def full_scan(plan: dict[str, Any]) -> bool:
+        """Tell whether a plan step reads a whole table (without any index)."""
+        if "detail" in plan:
+            detail = str(plan["detail"])
+            if detail == "SCAN CONSTANT ROW":
+                return False
+            return detail.startswith("SCAN") and " INDEX " not in detail
+        return plan.get("type") == "ALL"
+
+    @staticmethod
+    def describe(plan: dict[str, Any]) -> str:
+        """Get a printable summary of a plan step (MySQL or SQLite)."""
+        if "detail" in plan:
+            return str(plan["detail"])
+        extra = plan.get("Extra") or ""
+        return "{}: type={} key={} rows={} {}".format(
+            plan.get("table"), plan.get("type"), plan.get("key"), plan.get("rows"), extra
+        ).rstrip()
+
+    def run(self) -> int:
+        """Display execution plans of all hot queries, returning the number of full scans."""
+        plans = self.explain()
+        scans = 0
+        for name, query, columns, rows in plans:
+            sys.stdout.write("== {}: {}\n".format(name, " ".join(query.split())[:160]))
+            for row in rows:
+                plan = dict(zip(columns, row))
+                full_scan = self.full_scan(plan)
+                scans += full_scan
+                marker = "[-]" if full_scan else "[+]"
+                sys.stdout.write(f"  {marker} {self.describe(plan)}\n")
+        sys.stdout.write(f"{len(plans)} queries explained, {scans} full table scans\n")
+        return scans
@@ -1,17 +1,20 @@
 from __future__ import annotations
 
 import socket
+import time
+from collections import OrderedDict
 from contextlib import suppress
 from ssl import SSLSocket
 from threading import Lock
 from typing import Any, Callable
 
 from msgpack import Packer, Unpacker
-from pymysql import MySQLError
 
+from .breaker import BlacknetCircuitBreaker
 from .common import (
+    BLACKNET_BANNER_CLIENT_MAXLEN,
+    BLACKNET_CREDENTIALS_MAX_COUNT,
     BLACKNET_DATABASE_RETRIES,
-    BLACKNET_DEFAULT_LOCID,
     BLACKNET_DEFAULT_SESSION_INTERVAL,
     BLACKNET_HELLO,
     BLACKNET_LOG_DEBUG,
@@ -19,12 +22,19 @@ from .common import (
     BLACKNET_LOG_ERROR,
     BLACKNET_LOG_INFO,
     BLACKNET_LOG_WARNING,
+    BLACKNET_LOOKUP_CACHE_SIZE,
+    BLACKNET_SSL_HANDSHAKE_TIMEOUT,
     BlacknetMsgType,
     blacknet_gethostbyaddr,
     blacknet_ip_to_int,
 )
 from .config import BlacknetBlacklist
-from .database import BlacknetDatabase, BlacknetDatabaseCursor
+from .database import (
+    BlacknetDatabaseCursor,
+    BlacknetDatabaseError,
+    BlacknetDatabaseUnavailableError,
+    blacknet_database,
+)
 from .server import BlacknetServer, BlacknetThread
 from .sslif import BlacknetSSLInterface
 
@@ -39,7 +49,12 @@ class BlacknetMasterServer(BlacknetServer, BlacknetSSLInterface):
 
         self.__test_mode = None  # type: bool | None
         self.__session_interval = None  # type: int | None
+        self.__ssl_handshake_timeout = None  # type: float | None
         self.blacklist = BlacknetBlacklist(self.config)
+        # Shared by all sensor threads, so that a single one probes a database outage.
+        self.database_breaker = BlacknetCircuitBreaker(
+            "database", self.log_warning, self.metrics
+        )
 
     @property
     def session_interval(self) -> int:
@@ -51,6 +66,16 @@ class BlacknetMasterServer(BlacknetServer, BlacknetSSLInterface):
                 self.__session_interval = BLACKNET_DEFAULT_SESSION_INTERVAL
         return self.__session_interval
 
+    @property
+    def ssl_handshake_timeout(self) -> float:
+        """Maximum duration of the SSL handshake with sensors."""
+        if self.__ssl_handshake_timeout is None:
+            if self.has_config("ssl_handshake_timeout"):
+                self.__ssl_handshake_timeout = float(self.get_config("ssl_handshake_timeout"))
+            else:
+                self.__ssl_handshake_timeout = BLACKNET_SSL_HANDSHAKE_TIMEOUT
+        return self.__ssl_handshake_timeout
+
     @property
     def test_mode(self) -> bool:
         """Whether we are currently running in test mode."""
@@ -66,10 +91,11 @@ class BlacknetMasterServer(BlacknetServer, BlacknetSSLInterface):
         super().reload()
         self.__test_mode = None
         self.__session_interval = None
+        self.__ssl_handshake_timeout = None
         self.blacklist.reload()
 
         # Reload database information.
-        for thr in self._threads:
+        for thr in self.threads:
             if isinstance(thr, BlacknetServerThread):
                 thr.database.reload()
 
@@ -94,13 +120,16 @@ class BlacknetServerThread(BlacknetThread):
             BlacknetMsgType.CLIENT_NAME: self.handle_client_name,
             BlacknetMsgType.SSH_CREDENTIAL: self.handle_ssh_credential,
             BlacknetMsgType.SSH_PUBLICKEY: self.handle_ssh_publickey,
+            BlacknetMsgType.SSH_BANNERS: self.handle_ssh_banners,
+            BlacknetMsgType.SSH_CREDENTIALS: self.handle_ssh_credentials,
             BlacknetMsgType.PING: self.handle_ping,
             BlacknetMsgType.GOODBYE: self.handle_goodbye,
         }
         self.handler = handler
-        self.started = False
 
-        self.database = BlacknetDatabase(bns.config, bns.logger)
+        self.database = blacknet_database(
+            bns.config, bns.logger, bns.metrics, bns.database_breaker
+        )
         self.__blacklist = bns.blacklist
         self.__client = None  # type: socket.socket | None
         self.__connect_lock = Lock()
@@ -111,11 +140,15 @@ class BlacknetServerThread(BlacknetThread):
         self.__unpacker = Unpacker()
         self.__packer = Packer()
         self.__dropped_count = 0
+        self.__shed_count = bns.metrics.counter("master.shed")
         self.__attempt_count = 0
         self.__atk_cache = {}  # type: dict[int, tuple[int, int]]
         self.__ses_cache = {}  # type: dict[int, tuple[int, int]]
         self.__key_cache = {}  # type: dict[str, int]
+        self.__lookup_cache = OrderedDict()  # type: OrderedDict[tuple[str, str], int]
         self.__test_mode = bns.test_mode
+        self.__handshake_timeout = bns.ssl_handshake_timeout
+        self.__handshake_time = bns.metrics.histogram("ssl.handshake_time")
 
         peer = client.getpeername()
         self.__peer_ip = peer[0] if peer else "local"
@@ -123,11 +156,12 @@ class BlacknetServerThread(BlacknetThread):
 
         client.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
         if self.__use_ssl:
-            client = bns.ssl_context.wrap_socket(client, server_side=True)
+            # The handshake is performed later on, from this thread.
+            client = bns.ssl_context.wrap_socket(
+                client, server_side=True, do_handshake_on_connect=False
+            )
         self.__client = client
-
-        self.name = self.peername
-        self.log_info("starting session (SSL: %s)" % self.__use_ssl)
+        self.name = "unknown"
 
     def __del__(self) -> None:
         """Close everything when deleted."""
@@ -181,16 +215,35 @@ class BlacknetServerThread(BlacknetThread):
             self.database.commit()
         self.disconnect()
 
-    def run(self) -> None:
-        """Thread entry point for the current client."""
-        self.started = True
+    def __ssl_handshake(self, client: SSLSocket) -> bool:
+        """Perform the SSL handshake with the sensor, within the configured timeout."""
+        time_start = time.monotonic()
+        client.settimeout(self.__handshake_timeout)
+        try:
+            client.do_handshake()
+        except OSError as e:
+            self.log_warning("SSL handshake: %s" % e)
+            return False
+        client.settimeout(None)
+        self.__handshake_time.observe(time.monotonic() - time_start)
+        return True
 
+    def handle(self) -> None:
+        """Handle the current client connection."""
         client = self.__client
-        if client is not None:
-            try:
-                self.handle_sensor(client)
-            except Exception as e:
-                self.log_warning("sensor exception: %s" % e)
+        if client is None:
+            return
+
+        if isinstance(client, SSLSocket) and not self.__ssl_handshake(client):
+            self.disconnect()
+            return
+
+        self.name = self.peername
+        self.log_info("starting session (SSL: %s)" % self.__use_ssl)
+        try:
+            self.handle_sensor(client)
+        except Exception as e:
+            self.log_warning("sensor exception: %s" % e)
 
     @property
     def cursor(self) -> BlacknetDatabaseCursor:
@@ -231,12 +284,14 @@ class BlacknetServerThread(BlacknetThread):
                 res = function(*args)
                 self.__mysql_error = 0
                 return res
-            except MySQLError as e:
+            except BlacknetDatabaseError as e:
                 if self.__mysql_error != e.args[0]:
                     self.__mysql_error = e.args[0]
-                    self.log_warning("MySQL: %s" % e)
+                    self.log_warning("database: %s" % e)
 
                 self.__cursor = None
+                # Strings interned by the lost transaction may have been rolled back.
+                self.__lookup_cache.clear()
                 self.database.disconnect()
                 saved_exception = e
 
@@ -294,40 +349,32 @@ class BlacknetServerThread(BlacknetThread):
         cursor = self.cursor
 
         ip = data["client"]
-        time = data["time"]
+        # Aggregated credentials span from their first to their last attempt.
+        first = data["time"]
+        last = data.get("last", first)
         atk_id = blacknet_ip_to_int(ip)
 
-        if atk_id not in self.__atk_cache:
-            res = cursor.check_attacker(atk_id)
-            if res is None:
-                locid = cursor.get_locid(atk_id)
-                if locid == BLACKNET_DEFAULT_LOCID:
-                    self.log_info("no gelocation for client %s" % ip)
-                dns = blacknet_gethostbyaddr(ip)
-                args = (atk_id, ip, dns, time, time, locid, 0)
-                cursor.insert_attacker(args)
-                first_seen, last_seen = (time, time)
-            else:
-                first_seen, last_seen = res
-            self.__atk_cache[atk_id] = (first_seen, last_seen)
-        else:
-            first_seen, last_seen = self.__atk_cache[atk_id]
-
-        # Check attacker dates to update first_seen and last_seen fields.
-        if first_seen and time < first_seen:
-            self.__atk_cache[atk_id] = (time, last_seen)
-            cursor.update_attacker_first_seen(atk_id, time)
+        # Cached dates are already known to be within the recorded period.
+        cached = self.__atk_cache.get(atk_id)
+        if cached is not None and cached[0] <= first and last <= cached[1]:
+            return atk_id
 
-        if last_seen and time > last_seen:
-            self.__atk_cache[atk_id] = (first_seen, time)
-            cursor.update_attacker_last_seen(atk_id, time)
+        if cursor.upsert_attacker((atk_id, ip, "", first, last, 0)):
+            dns = blacknet_gethostbyaddr(ip)
+            if dns:
+                cursor.update_attacker_dns(atk_id, dns)
 
+        if cached is None:
+            self.__atk_cache[atk_id] = (first, last)
+        else:
+            self.__atk_cache[atk_id] = (min(cached[0], first), max(cached[1], last))
         return atk_id
 
     def __add_ssh_session(self, data: dict[str, Any], atk_id: int) -> int:
         cursor = self.cursor
         sensor = self.name
-        time = data["time"]
+        first = data["time"]
+        last = data.get("last", first)
 
         if atk_id not in self.__ses_cache:
             res = cursor.check_session(atk_id, sensor)
@@ -339,15 +386,34 @@ class BlacknetServerThread(BlacknetThread):
             ses_id, last_seen = self.__ses_cache[atk_id]
 
         session_limit = last_seen + self.__session_interval
-        if time > session_limit:
-            args = (atk_id, time, time, sensor)
+        if first > session_limit:
+            args = (atk_id, first, last, sensor)
             ses_id = cursor.insert_session(args)
         else:
-            cursor.update_session_last_seen(ses_id, time)
-        self.__ses_cache[atk_id] = (ses_id, time)
+            cursor.update_session_last_seen(ses_id, last)
+        # Attempts received out of order never move the session back in time.
+        self.__ses_cache[atk_id] = (ses_id, max(last_seen, last))
 
         return ses_id
 
+    def __intern(self, table: str, value: str | None) -> int | None:
+        """Get the lookup identifier of a string, recently used ones being cached."""
+        if value is None:
+            return None
+
+        cache = self.__lookup_cache
+        key = (table, value)
+        lookup_id = cache.get(key)
+        if lookup_id is not None:
+            cache.move_to_end(key)
+            return lookup_id
+
+        lookup_id = self.cursor.intern_value(table, value)
+        cache[key] = lookup_id
+        if len(cache) > BLACKNET_LOOKUP_CACHE_SIZE:
+            cache.popitem(last=False)
+        return lookup_id
+
     def __add_ssh_attempt(self, data: dict[str, Any], atk_id: int, ses_id: int) -> int:
         cursor = self.cursor
         # This happen while registering a pubkey authentication
@@ -355,14 +421,49 @@ class BlacknetServerThread(BlacknetThread):
         args = (
             atk_id,
             ses_id,
-            data["user"],
-            password,
+            self.__intern("users", data["user"]),
+            self.__intern("passwords", password),
             self.name,
             data["time"],
-            data["version"],
+            self.__intern("clients", data["version"]),
         )
         return cursor.insert_attempt(args)
 
+    def __add_ssh_attempts(self, data: dict[str, Any], atk_id: int, ses_id: int) -> None:
+        """Record aggregated credentials, only their first and last attempts being dated."""
+        cursor = self.cursor
+        count = data["count"]
+        first = data["time"]
+        last = data["last"]
+        user_id = self.__intern("users", data["user"])
+        password_id = self.__intern("passwords", data["passwd"])
+        client_id = self.__intern("clients", data["version"])
+
+        row = [atk_id, ses_id, user_id, password_id, self.name, first, client_id]
+        rows = [row]
+        if count > 1:
+            rows.append(row[:5] + [last, client_id])
+        cursor.insert_attempts(rows)
+
+        # Other attempts are only counted (without any row nor date).
+        others = count - len(rows)
+        if others:
+            cursor.insert_aggregated_attempts(
+                [(ses_id, atk_id, user_id, password_id or 0, others)]
+            )
+
+    @staticmethod
+    def __aggregate_count(item: Any) -> int | None:
+        """Get the count of aggregated credentials (None when invalid)."""
+        if not isinstance(item, dict):
+            return None
+        count, first, last = item.get("count"), item.get("time"), item.get("last")
+        if not (isinstance(count, int) and isinstance(first, int) and isinstance(last, int)):
+            return None
+        if not 0 < count <= BLACKNET_CREDENTIALS_MAX_COUNT or first > last:
+            return None
+        return count
+
     def __add_ssh_pubkey(self, data: dict[str, Any], att_id: int) -> int:
         cursor = self.cursor
         fingerprint = data["kfp"]
@@ -381,6 +482,17 @@ class BlacknetServerThread(BlacknetThread):
         cursor.insert_attempts_pubkeys(att_id, key_id)
         return key_id
 
+    def __add_ssh_banners(self, data: list[dict[str, Any]]) -> None:
+        cursor = self.cursor
+        sensor = self.name
+
+        rows = []
+        for item in data:
+            ip = "1.0.204.42" if self.__test_mode else item["client"]
+            version = item["version"][:BLACKNET_BANNER_CLIENT_MAXLEN]
+            rows.append((blacknet_ip_to_int(ip), sensor, item["time"], version))
+        cursor.insert_banners(rows)
+
     def check_blacklist(self, data: dict[str, str]) -> None:
         """Check provided data against the configured blacklist."""
         user = data["user"]
@@ -401,10 +513,27 @@ class BlacknetServerThread(BlacknetThread):
         att_id = self.__mysql_retry(self.__add_ssh_attempt, data, atk_id, ses_id)
         return (atk_id, ses_id, att_id)
 
+    def __handle_ssh_aggregate(self, data: dict[str, Any]) -> None:
+        if self.__test_mode:
+            data["client"] = "1.0.204.42"
+
+        self.check_blacklist(data)
+        # Attacker and session are registered once over the whole aggregated period.
+        atk_id = self.__mysql_retry(self.__add_ssh_attacker, data)
+        ses_id = self.__mysql_retry(self.__add_ssh_session, data, atk_id)
+        self.__mysql_retry(self.__add_ssh_attempts, data, atk_id, ses_id)
+
+    def __shed(self, count: int) -> None:
+        """Drop attempts without further ado while the database is unavailable."""
+        self.__dropped_count += count
+        self.__shed_count.inc(count)
+
     def handle_ssh_credential(self, data: dict[str, Any]) -> bool:
         """Handle received SSH credentials."""
         try:
             atk_id, ses_id, att_id = self.__handle_ssh_common(data)
+        except BlacknetDatabaseUnavailableError:
+            self.__shed(1)
         except Exception as e:
             self.log_info("credential error: %s" % e)
             self.__dropped_count += 1
@@ -417,9 +546,50 @@ class BlacknetServerThread(BlacknetThread):
         try:
             atk_id, ses_id, att_id = self.__handle_ssh_common(data)
             self.__mysql_retry(self.__add_ssh_pubkey, data, att_id)
+        except BlacknetDatabaseUnavailableError:
+            self.__shed(1)
         except Exception as e:
             self.log_info("pubkey error: %s" % e)
             self.__dropped_count += 1
         else:
             self.__attempt_count += 1
         return True
+
+    def handle_ssh_credentials(self, data: Any) -> bool:
+        """Handle SSH credentials aggregated by the sensor over a session."""
+        if not isinstance(data, list):
+            self.log_error("bad payload type received in SSH_CREDENTIALS.")
+            return False
+
+        for item in data:
+            count = self.__aggregate_count(item)
+            if count is None:
+                self.log_info("credentials error: invalid aggregated credentials")
+                self.__dropped_count += 1
+                continue
+
+            try:
+                self.__handle_ssh_aggregate(item)
+            except BlacknetDatabaseUnavailableError:
+                self.__shed(count)
+            except Exception as e:
+                self.log_info("credentials error: %s" % e)
+                self.__dropped_count += count
+            else:
+                self.__attempt_count += count
+        return True
+
+    def handle_ssh_banners(self, data: Any) -> bool:
+        """Handle a batch of client versions from banner-only connections."""
+        if not isinstance(data, list):
+            self.log_error("bad payload type received in SSH_BANNERS.")
+            return False
+
+        try:
+            self.__mysql_retry(self.__add_ssh_banners, data)
+        except BlacknetDatabaseUnavailableError:
+            self.__shed(len(data))
+        except Exception as e:
+            self.log_info("banners error: %s" % e)
+            self.__dropped_count += len(data)
+        return True
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import math
+from threading import Lock
+
+
+class BlacknetCounter:
+    """Monotonic counter."""
+
+    def __init__(self, name: str) -> None:
+        """Create a new counter starting at zero."""
+        self.name = name
+        self.value = 0
+        self.__lock = Lock()
+
+    def inc(self, count: int = 1) -> None:
+        """Increment the counter."""
+        with self.__lock:
+            self.value += count
+
+    def summary(self) -> str:
+        """Get a printable summary of this counter."""
+        return f"{self.name} {self.value}"
+
+
+class BlacknetGauge:
+    """Value going up and down, also keeping track of its maximum."""
+
+    def __init__(self, name: str) -> None:
+        """Create a new gauge starting at zero."""
+        self.name = name
+        self.value = 0
+        self.max = 0
+        self.__lock = Lock()
+
+    def inc(self, count: int = 1) -> None:
+        """Increment the gauge."""
+        with self.__lock:
+            self.value += count
+            self.max = max(self.max, self.value)
+
+    def dec(self, count: int = 1) -> None:
+        """Decrement the gauge."""
+        with self.__lock:
+            self.value -= count
+
+    def summary(self) -> str:
+        """Get a printable summary of this gauge."""
+        return f"{self.name} {self.value} (max {self.max})"
+
+
+class BlacknetHistogram:
+    """Distribution of observed values using power of two buckets.
+
+    Percentiles are approximated by the upper bound of their bucket, which is
+    precise enough to spot trends and keeps each observation cheap.
+    """
+
+    def __init__(self, name: str) -> None:
+        """Create a new empty histogram."""
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.__buckets = {}  # type: dict[int, int]
+        self.__lock = Lock()
+
+    def observe(self, value: float) -> None:
+        """Add a new value to the histogram."""
+        # Bucket N holds values in ]2^(N-1), 2^N], zero and below go to a dedicated one.
+        bucket = math.frexp(value)[1] if value > 0 else -1075
+        with self.__lock:
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+            self.__buckets[bucket] = self.__buckets.get(bucket, 0) + 1
+
+    def percentile(self, pct: float) -> float:
+        """Get an upper bound of the provided percentile."""
+        with self.__lock:
+            buckets = sorted(self.__buckets.items())
+            count = self.count
+            vmax = self.max
+
+        rank = pct * count / 100.0
+        seen = 0
+        for bucket, bcount in buckets:
+            seen += bcount
+            if seen >= rank:
+                return min(math.ldexp(1.0, bucket), vmax)
+        return vmax
+
+    @property
+    def mean(self) -> float:
+        """Get the average of all observed values."""
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> str:
+        """Get a printable summary of this histogram."""
+        return (
+            f"{self.name} count={self.count} total={self.total:.4g} mean={self.mean:.4g} "
+            f"p50={self.percentile(50):.4g} p90={self.percentile(90):.4g} "
+            f"p99={self.percentile(99):.4g} max={self.max:.4g}"
+        )
+
+
+class BlacknetMetrics:
+    """Registry of all metrics for a blacknet instance."""
+
+    def __init__(self) -> None:
+        """Create an empty metrics registry."""
+        self.__lock = Lock()
+        self.__counters = {}  # type: dict[str, BlacknetCounter]
+        self.__gauges = {}  # type: dict[str, BlacknetGauge]
+        self.__histograms = {}  # type: dict[str, BlacknetHistogram]
+
+    def counter(self, name: str) -> BlacknetCounter:
+        """Get or create the counter with the provided name."""
+        with self.__lock:
+            if name not in self.__counters:
+                self.__counters[name] = BlacknetCounter(name)
+            return self.__counters[name]
+
+    def gauge(self, name: str) -> BlacknetGauge:
+        """Get or create the gauge with the provided name."""
+        with self.__lock:
+            if name not in self.__gauges:
+                self.__gauges[name] = BlacknetGauge(name)
+            return self.__gauges[name]
+
+    def histogram(self, name: str) -> BlacknetHistogram:
+        """Get or create the histogram with the provided name."""
+        with self.__lock:
+            if name not in self.__histograms:
+                self.__histograms[name] = BlacknetHistogram(name)
+            return self.__histograms[name]
+
+    def summary(self) -> list[str]:
+        """Get a printable summary line for each registered metric."""
+        with self.__lock:
+            lines = [counter.summary() for counter in self.__counters.values()]
+            lines += [gauge.summary() for gauge in self.__gauges.values()]
+            lines += [histogram.summary() for histogram in self.__histograms.values()]
+        return sorted(lines)
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import sys
+from datetime import date
+from typing import Callable
+
+from .common import BLACKNET_MIGRATION_BATCH, BLACKNET_PARTITIONS_AHEAD
+from .config import BlacknetConfig, BlacknetConfigurationInterface
+from .database import BLACKNET_LOOKUPS, BlacknetDatabaseCursor, blacknet_database
+
+Month = tuple[int, int]
+
+
+def blacknet_month_next(month: Month) -> Month:
+    """Get the month following the provided (year, month) tuple."""
+    year, mon = month
+    return (year + 1, 1) if mon == 12 else (year, mon + 1)
+
+
+def blacknet_month_parse(value: str) -> Month:
+    """Parse a month written as YYYY-MM."""
+    year, mon = value.split("-", 1)
+    month = (int(year), int(mon))
+    if not 1 <= month[1] <= 12:
+        raise ValueError("invalid month: %s" % value)
+    return month
+
+
+def blacknet_partition_name(month: Month) -> str:
+    """Name of the partition holding attempts from the provided month."""
+    return "p%04u%02u" % month
+
+
+def blacknet_partition_month(name: str) -> Month | None:
+    """Get back the month held by a partition (None for other partitions)."""
+    if len(name) != 7 or not name.startswith("p") or not name[1:].isdigit():
+        return None
+    return (int(name[1:5]), int(name[5:7]))
+
+
+def blacknet_partitions(first: Month, last: Month) -> list[tuple[str, str]]:
+    """Build monthly partitions definitions from first to last month (included)."""
+    partitions = []
+    month = first
+    while month <= last:
+        following = blacknet_month_next(month)
+        partitions.append((blacknet_partition_name(month), "%04u-%02u-01" % following))
+        month = following
+    return partitions
+
+
+MigrationFunc = Callable[[BlacknetDatabaseCursor], None]
+
+
+class BlacknetMigrator(BlacknetConfigurationInterface):
+    """Blacknet database schema migration tool.
+
+    Each migration is applied in order and recorded in the `schema_version`
+    table, so running the tool again only applies missing migrations.
+    Databases created before versioning (version 0) are upgraded in place.
+    """
+
+    def __init__(self, cfg_file: str | None = None) -> None:
+        """Load configuration file and database parameters."""
+        config = BlacknetConfig()
+        config.load(cfg_file)
+        super().__init__(config, "mysql")
+
+        self.__database = blacknet_database(config)
+        self.__dry_run = False
+
+    @property
+    def dry_run(self) -> bool:
+        """Tell whether changes are only displayed."""
+        return self.__dry_run
+
+    @dry_run.setter
+    def dry_run(self, val: bool) -> None:
+        """Set whether changes are only displayed."""
+        self.__dry_run = val
+
+    @property
+    def migrations(self) -> list[tuple[int, str, MigrationFunc]]:
+        """All known migrations as (version, description, function)."""
+        return [
+            (1, "Convert all tables to InnoDB", self.__migrate_innodb),
+            (2, "Partition attempts by month", self.__migrate_partitions),
+            (3, "Intern users, passwords and clients of attempts", self.__migrate_lookups),
+            (4, "Add composite indexes for sessions and attempts", self.__migrate_indexes),
+            (5, "Add counters of archived attempts", self.__migrate_archives),
+            (6, "Add state of geolocation imports", self.__migrate_geolocation_sources),
+            (7, "Add client versions of banner-only connections", self.__migrate_banners),
+            (8, "Compare interned strings without padding", self.__migrate_lookups_binary),
+            (9, "Add counters of attempts aggregated by sensors", self.__migrate_aggregates),
+        ]
+
+    @property
+    def latest_version(self) -> int:
+        """Schema version reached once all migrations are applied."""
+        return self.migrations[-1][0]
+
+    def log(self, message: str) -> None:
+        """Write something stdout."""
+        suffix = " (DRY-RUN)" if self.__dry_run else ""
+        sys.stdout.write(f"{message}{suffix}\n")
+
+    def __migrate_innodb(self, cursor: BlacknetDatabaseCursor) -> None:
+        for table, engine in cursor.table_engines():
+            if engine != "InnoDB":
+                cursor.alter_engine(table, "InnoDB")
+                self.log(f"[+] Converted table {table} from {engine} to InnoDB")
+
+    def __migrate_partitions(self, cursor: BlacknetDatabaseCursor) -> None:
+        today = date.today()
+        oldest = cursor.attempts_oldest()
+        if oldest is not None:
+            first = (oldest.year, oldest.month)
+        else:
+            first = (today.year, today.month)
+
+        last = (today.year, today.month)
+        for _ in range(BLACKNET_PARTITIONS_AHEAD):
+            last = blacknet_month_next(last)
+
+        # Older and undated attempts all go to the first partition.
+        partitions = blacknet_partitions(first, last)
+        cursor.attempts_partition_by(partitions)
+        self.log(f"[+] Partitioned attempts in {len(partitions)} monthly partitions")
+
+    def __migrate_lookups(self, cursor: BlacknetDatabaseCursor) -> None:
+        cursor.lookups_create()
+        for column, table, _ in BLACKNET_LOOKUPS:
+            cursor.lookups_fill(column, table)
+            self.log(f"[+] Interned attempts {column}s in table {table}")
+        cursor.attempts_add_lookups()
+
+        # Attempts are updated by batches to keep transactions reasonably small.
+        ids = cursor.attempts_ids()
+        if ids is not None:
+            first, last = ids
+            for start in range(first, last + 1, BLACKNET_MIGRATION_BATCH):
+                cursor.attempts_set_lookups(start, start + BLACKNET_MIGRATION_BATCH - 1)
+                self.__database.commit()
+            self.log(f"[+] Updated attempts {first} to {last} with lookup identifiers")
+
+        cursor.attempts_drop_strings()
+        self.log("[+] Dropped strings from attempts")
+
+    def __migrate_indexes(self, cursor: BlacknetDatabaseCursor) -> None:
+        # Sessions of an attacker on a target (master), attackers of a target and
+        # recent targets (scrubber): single column indexes are their prefixes.
+        cursor.replace_indexes(
+            "sessions",
+            ["attacker_id", "target"],
+            [
+                ("attacker_target", "`attacker_id`, `target`, `last_attempt`"),
+                ("target_attacker", "`target`, `attacker_id`"),
+                ("target_last_attempt", "`target`, `last_attempt`"),
+            ],
+        )
+        self.log("[+] Replaced indexes of sessions")
+
+        # Recent attempts on a target (scrubber weekdays and hours).
+        cursor.replace_indexes("attempts", ["target"], [("target_date", "`target`, `date`")])
+        self.log("[+] Replaced indexes of attempts")
+
+    def __migrate_archives(self, cursor: BlacknetDatabaseCursor) -> None:
+        cursor.archives_create()
+        self.log("[+] Created tables of archived attempts counters")
+
+    def __migrate_geolocation_sources(self, cursor: BlacknetDatabaseCursor) -> None:
+        cursor.geolocation_sources_create()
+        self.log("[+] Created table of geolocation imports state")
+
+    def __migrate_banners(self, cursor: BlacknetDatabaseCursor) -> None:
+        cursor.banners_create()
+        self.log("[+] Created table of banner-only connections")
+
+    def __migrate_lookups_binary(self, cursor: BlacknetDatabaseCursor) -> None:
+        cursor.lookups_binary()
+        self.log("[+] Converted values of lookup tables to binary strings")
+
+    def __migrate_aggregates(self, cursor: BlacknetDatabaseCursor) -> None:
+        cursor.aggregates_create()
+        self.log("[+] Created table of aggregated attempts counters")
+
+    def version(self) -> int:
+        """Get the current schema version."""
+        cursor = self.__database.cursor()
+        return cursor.schema_version()
+
+    def pending(self) -> list[tuple[int, str, MigrationFunc]]:
+        """List all migrations that have not been applied yet."""
+        current = self.version()
+        return [m for m in self.migrations if m[0] > current]
+
+    def status(self) -> None:
+        """Display the current schema version and pending migrations."""
+        sys.stdout.write(
+            "Schema version: %u (latest is %u)\n" % (self.version(), self.latest_version)
+        )
+        for version, description, _ in self.pending():
+            sys.stdout.write(f"Pending migration {version}: {description}\n")
+
+    def migrate(self) -> None:
+        """Apply all pending migrations in order."""
+        pending = self.pending()
+        if not pending:
+            self.log("[+] Database schema is up to date (version %u)" % self.version())
+            return
+
+        cursor = self.__database.cursor()
+        if not self.__dry_run:
+            cursor.create_schema_version()
+
+        for version, description, function in pending:
+            self.log(f"[+] Applying migration {version}: {description}")
+            if not self.__dry_run:
+                function(cursor)
+                cursor.insert_schema_version(version, description)
+                self.__database.commit()
+        self.log("[+] Migration complete (version %u)" % self.latest_version)
+
+    def __partitioned_months(self, cursor: BlacknetDatabaseCursor) -> list[Month] | None:
+        partitions = cursor.attempts_partitions()
+        if "pmax" not in partitions:
+            self.log("[-] Table attempts is not partitioned (run migrations first)")
+            return None
+        months = [blacknet_partition_month(name) for name in partitions]
+        return [m for m in months if m is not None]
+
+    def partitions_add(self, ahead: int = BLACKNET_PARTITIONS_AHEAD) -> None:
+        """Create monthly partitions up to ahead months after the current one."""
+        cursor = self.__database.cursor()
+        months = self.__partitioned_months(cursor)
+        if months is None:
+            return
+
+        today = date.today()
+        first = (today.year, today.month)
+        if months:
+            first = max(first, blacknet_month_next(months[-1]))
+
+        last = (today.year, today.month)
+        for _ in range(ahead):
+            last = blacknet_month_next(last)
+
+        partitions = blacknet_partitions(first, last)
+        if partitions:
+            names = ", ".join(p[0] for p in partitions)
+            self.log(f"[+] Adding partitions {names}")
+            if not self.__dry_run:
+                cursor.attempts_partitions_split(partitions)
+        else:
+            self.log("[+] No partition to add")
+
+    def partitions_drop(self, before: Month) -> None:
+        """Drop partitions holding attempts older than the provided month."""
+        cursor = self.__database.cursor()
+        months = self.__partitioned_months(cursor)
+        if months is None:
+            return
+
+        # Undated and older attempts are held by the first monthly partition.
+        for month in [m for m in months if m < before]:
+            name = blacknet_partition_name(month)
+            self.log(f"[+] Dropping partition {name}")
+            if not self.__dry_run:
+                cursor.attempts_partition_drop(name)
+                self.__database.commit()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import time
+from threading import Condition, Thread
+from typing import Callable
+
+from .metrics import BlacknetMetrics
+
+TimeFunc = Callable[[], None]
+
+
+class BlacknetTask:
+    """Function scheduled to run once or periodically."""
+
+    def __init__(self, name: str, function: TimeFunc, interval: float, jitter: float) -> None:
+        """Create a new task (interval is zero for one-shot tasks)."""
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.jitter = jitter
+        self.deadline = 0.0
+        self.cancelled = False
+
+    def schedule(self, delay: float) -> float:
+        """Compute the next deadline of this task, delay seconds from now."""
+        self.deadline = time.monotonic() + delay + random.uniform(0.0, self.jitter)  # noqa: S311
+        return self.deadline
+
+
+class BlacknetScheduler(Thread):
+    """Run periodic and one-shot maintenance tasks from a single thread.
+
+    Tasks are kept in a heap ordered by deadline, so they run regardless of
+    the activity on the serving loop. Periodic tasks are rescheduled once
+    they are done, so a slow task never runs concurrently with itself.
+    """
+
+    def __init__(
+        self,
+        metrics: BlacknetMetrics | None = None,
+        log_error: Callable[[str], None] | None = None,
+    ) -> None:
+        """Create a new (not started) scheduler."""
+        super().__init__(name="scheduler")
+        self.daemon = True
+
+        self.__metrics = metrics
+        self.__log_error = log_error
+        self.__running = True
+        self.__condition = Condition()
+        self.__sequence = itertools.count()
+        self.__heap = []  # type: list[tuple[float, int, BlacknetTask]]
+
+    def __push(self, task: BlacknetTask, delay: float) -> None:
+        with self.__condition:
+            deadline = task.schedule(delay)
+            heapq.heappush(self.__heap, (deadline, next(self.__sequence), task))
+            self.__condition.notify()
+
+    def every(
+        self, name: str, interval: float, function: TimeFunc, jitter: float = 0.0
+    ) -> BlacknetTask:
+        """Run function every interval seconds (plus up to jitter seconds)."""
+        task = BlacknetTask(name, function, interval, jitter)
+        self.__push(task, interval)
+        return task
+
+    def once(
+        self, name: str, delay: float, function: TimeFunc, jitter: float = 0.0
+    ) -> BlacknetTask:
+        """Run function once in delay seconds (plus up to jitter seconds)."""
+        task = BlacknetTask(name, function, 0.0, jitter)
+        self.__push(task, delay)
+        return task
+
+    def cancel(self, task: BlacknetTask) -> None:
+        """Prevent any further run of the provided task."""
+        with self.__condition:
+            task.cancelled = True
+            self.__condition.notify()
+
+    def stop(self) -> None:
+        """Stop the scheduler, waiting for the running task (if any)."""
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify()
+        if self.is_alive():
+            self.join()
+
+    def __execute(self, task: BlacknetTask) -> None:
+        time_start = time.monotonic()
+        try:
+            task.function()
+        except Exception as e:
+            if self.__log_error is not None:
+                self.__log_error(f"task {task.name}: {e}")
+        duration = time.monotonic() - time_start
+
+        if self.__metrics is not None:
+            self.__metrics.histogram(f"task.{task.name}.lateness").observe(
+                time_start - task.deadline
+            )
+            self.__metrics.histogram(f"task.{task.name}.duration").observe(duration)
+
+    def run(self) -> None:
+        """Thread entry point."""
+        heap = self.__heap
+        with self.__condition:
+            while self.__running:
+                if not heap:
+                    self.__condition.wait()
+                    continue
+
+                deadline, _seq, task = heap[0]
+                if task.cancelled:
+                    heapq.heappop(heap)
+                    continue
+
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self.__condition.wait(delay)
+                    continue
+
+                heapq.heappop(heap)
+                self.__condition.release()
+                try:
+                    self.__execute(task)
+                finally:
+                    self.__condition.acquire()
+
+                if task.interval > 0 and not task.cancelled:
+                    deadline = task.schedule(task.interval)
+                    heapq.heappush(heap, (deadline, next(self.__sequence), task))
@@ -7,11 +7,20 @@ import time
 from typing import Any, Callable
 from urllib.request import urlretrieve
 
-from .common import blacknet_gethostbyaddr, blacknet_int_to_ip
+from .common import blacknet_ensure_unicode, blacknet_gethostbyaddr, blacknet_int_to_ip
 from .config import BlacknetConfig, BlacknetConfigurationInterface
-from .database import BlacknetDatabase
+from .database import BlacknetDatabase, blacknet_database
 
 WEEK_DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+# Attempts counted by credentials, including archived and aggregated ones (no password
+# is 0 there).
+BLACKNET_CREDENTIALS_COUNTS = (
+    "SELECT user_id, password_id, COUNT(*) AS n FROM attempts GROUP BY user_id, password_id "
+    "UNION ALL "
+    "SELECT user_id, NULLIF(password_id, 0), n_attempts FROM archived_credentials "
+    "UNION ALL "
+    "SELECT user_id, NULLIF(password_id, 0), n_attempts FROM aggregated_attempts"
+)
 
 
 class BlacknetScrubber(BlacknetConfigurationInterface):
@@ -23,7 +32,8 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
         config.load(cfg_file)
         super().__init__(config, "monitor")
 
-        self.__database = BlacknetDatabase(config)
+        self.__database = blacknet_database(config)
+        self.__reports_database = None  # type: BlacknetDatabase | None
         self.__verbosity = 2
         self.__do_fix = False
         self.__cache_path = None  # type: str | None
@@ -58,6 +68,16 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
         """Set the current verbosity level."""
         self.__verbosity = level
 
+    @property
+    def targets(self) -> list[tuple[str, int, int]]:
+        """Known targets as (name, recently attacked, alive) tuples."""
+        return self.__targets
+
+    @targets.setter
+    def targets(self, targets: list[tuple[str, int, int]]) -> None:
+        """Set known targets (otherwise found by generate_targets)."""
+        self.__targets = targets
+
     @property
     def do_fix(self) -> bool:
         """Tell whether we run in fix mode."""
@@ -71,19 +91,18 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
     def __timed_check(self, action: Callable[..., Any], args: list[Any], message: str) -> Any:
         time_start = time.time()
         res = action(*args)
+        # Tables are transactional, keep locks and snapshots short.
+        self.__database.commit()
         time_diff = time.time() - time_start
         self.log_progress(f"[+] Checked {message} ({time_diff:.1f}s)")
         return res
 
     def __check_attackers(self) -> None:
         cursor = self.__database.cursor()
+        batch_size = self.__database.fetch_batch_size
+        rows = []
         for atk_id in cursor.missing_attackers():
             ip = blacknet_int_to_ip(atk_id)
-            locid = cursor.get_locid(atk_id)
-            if locid is None:
-                self.log_error("[-] No match in geolocation database for IP %s." % ip)
-                continue
-
             res = cursor.recompute_attacker_info(atk_id)
             if res is None:
                 continue
@@ -91,10 +110,14 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
             (first_seen, last_seen, count) = res
             dns = blacknet_gethostbyaddr(ip)
             self.log_action(f"[+] Fixing attacker {ip} ({dns})")
-
             if self.__do_fix:
-                args = (atk_id, ip, dns, first_seen, last_seen, locid, count)
-                cursor.insert_attacker(args)
+                rows.append((atk_id, ip, dns, first_seen, last_seen, count))
+
+            # Locations are resolved by the database while inserting.
+            if len(rows) >= batch_size:
+                cursor.upsert_attackers(rows)
+                rows = []
+        cursor.upsert_attackers(rows)
 
     def check_attackers(self) -> None:
         """Check all attacker consistency."""
@@ -189,6 +212,23 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
             self.__recent_threshold = int(time.time() - 24 * 3600 * self.recent_delta)
         return self.__recent_threshold
 
+    @property
+    def database(self) -> BlacknetDatabase:
+        """Primary database, for checks and fixes."""
+        return self.__database
+
+    @property
+    def reports_database(self) -> BlacknetDatabase:
+        """Database for reports, a read replica when configured (and up to date)."""
+        if self.__reports_database is None:
+            reports = self.__database.reader()
+            if reports is not self.__database:
+                self.log_progress("[+] Reading reports from the replica")
+            elif self.__database.replica is not self.__database:
+                self.log_error("[-] Replica is unavailable or late, reading from the primary")
+            self.__reports_database = reports
+        return self.__reports_database
+
     def __timed_generation(self, action: Callable[..., Any], filepath: str) -> Any:
         time_start = time.time()
         res = action(filepath)
@@ -199,13 +239,14 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
     def __json_export(self, filepath: str, data: list[Any]) -> None:
         path = os.path.join(self.cache_path, filepath)
         with open(path, "w") as f:
-            f.write(json.dumps({"data": data}))
+            # Interned strings are binary on MySQL.
+            f.write(json.dumps({"data": data}, default=blacknet_ensure_unicode))
 
     def __generate_targets(self, filepath: str) -> None:
-        cursor = self.__database.cursor()
+        cursor = self.reports_database.cursor()
         query = (
-            "SELECT target, UNIX_TIMESTAMP(MAX(last_attempt)) > %s, "
-            "UNIX_TIMESTAMP(MAX(last_attempt)) > %s "
+            "SELECT target, MAX(last_attempt) > FROM_UNIXTIME(%s), "
+            "MAX(last_attempt) > FROM_UNIXTIME(%s) "
             "FROM sessions GROUP BY target;"
         )
         res = cursor.execute(query, [self.recent_threshold, self.alive_threshold])
@@ -218,7 +259,7 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
         self.__timed_generation(self.__generate_targets, "targets.json")
 
     def __query_wrapper(self, query: str) -> list[Any] | None:
-        cursor = self.__database.cursor()
+        cursor = self.reports_database.cursor()
         res = cursor.execute(query)
         if res:
             return cursor.fetchall()
@@ -241,36 +282,63 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
     def generate_stats(self) -> None:
         """Generate the big statistics JSON file."""
         queries = {}  # type: dict[str, str]
+        # Strings are interned: counts are grouped on identifiers, then resolved.
+        # Counters of archived attempts are added to the ones of attempts.
+        cred = f"({BLACKNET_CREDENTIALS_COUNTS}) AS CRED"
         queries["stats_logins"] = (
-            "SELECT user, COUNT(*) "
-            "FROM attempts "
-            "GROUP BY user "
-            "ORDER BY COUNT(*) DESC "
-            "LIMIT 20;"
+            "SELECT users.value, ATT.c "  # noqa: S608
+            "FROM ( "
+            "SELECT user_id, CAST(SUM(n) AS UNSIGNED) AS c "
+            f"FROM {cred} "
+            "GROUP BY user_id "
+            "ORDER BY c DESC "
+            "LIMIT 20 "
+            ") as ATT "
+            "JOIN users ON ATT.user_id = users.id "
+            "ORDER BY ATT.c DESC;"
         )
         queries["stats_passwords"] = (
-            "SELECT password, COUNT(*) "
-            "FROM attempts "
-            "GROUP BY password "
-            "ORDER BY COUNT(*) DESC "
-            "LIMIT 20;"
+            "SELECT passwords.value, ATT.c "  # noqa: S608
+            "FROM ( "
+            "SELECT password_id, CAST(SUM(n) AS UNSIGNED) AS c "
+            f"FROM {cred} "
+            "GROUP BY password_id "
+            "ORDER BY c DESC "
+            "LIMIT 20 "
+            ") as ATT "
+            "LEFT JOIN passwords ON ATT.password_id = passwords.id "
+            "ORDER BY ATT.c DESC;"
         )
         queries["stats_user_pass"] = (
-            "SELECT user, password, COUNT(*) "  # noqa: S105
-            "FROM attempts "
-            "GROUP BY user,password "
-            "ORDER BY COUNT(*) DESC "
-            "LIMIT 20;"
+            "SELECT users.value, passwords.value, ATT.c "  # noqa: S608
+            "FROM ( "
+            "SELECT user_id, password_id, CAST(SUM(n) AS UNSIGNED) AS c "
+            f"FROM {cred} "
+            "GROUP BY user_id, password_id "
+            "ORDER BY c DESC "
+            "LIMIT 20 "
+            ") as ATT "
+            "JOIN users ON ATT.user_id = users.id "
+            "LEFT JOIN passwords ON ATT.password_id = passwords.id "
+            "ORDER BY ATT.c DESC;"
         )
         queries["stats_general"] = (
-            "SELECT (SELECT COUNT(*) FROM attempts), "
+            "SELECT CAST((SELECT COUNT(*) FROM attempts) + "  # noqa: S608
+            "(SELECT COALESCE(SUM(n_attempts), 0) FROM archived_credentials) + "
+            "(SELECT COALESCE(SUM(n_attempts), 0) FROM aggregated_attempts) AS UNSIGNED), "
             "(SELECT COUNT(*) FROM attackers), "
             "(SELECT COUNT(*) FROM sessions), "
-            "(SELECT COUNT(*) FROM attempts WHERE user = password), "
-            '(SELECT COUNT(*) FROM attempts WHERE user = "root"), '
-            "(SELECT COUNT(DISTINCT user) FROM attempts), "
-            "(SELECT COUNT(DISTINCT password) FROM attempts), "
-            "(SELECT COUNT(DISTINCT user, password) FROM attempts);"
+            f"(SELECT CAST(COALESCE(SUM(n), 0) AS UNSIGNED) FROM {cred} "
+            "JOIN users ON CRED.user_id = users.id "
+            "JOIN passwords ON CRED.password_id = passwords.id "
+            "WHERE users.value = passwords.value), "
+            f"(SELECT CAST(COALESCE(SUM(n), 0) AS UNSIGNED) FROM {cred} "
+            "WHERE user_id = (SELECT id FROM users WHERE value = 'root')), "
+            f"(SELECT COUNT(DISTINCT user_id) FROM {cred}), "
+            f"(SELECT COUNT(DISTINCT password_id) FROM {cred}), "
+            "(SELECT COUNT(*) FROM ("
+            f"SELECT DISTINCT user_id, password_id FROM {cred}"
+            ") AS UP);"
         )
         queries["stats_countries"] = (
             "SELECT countries.country, CAST(SUM(n_attempts) AS UNSIGNED) AS c "
@@ -293,14 +361,14 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
                 "FROM ( "
                 "SELECT attacker_id, n_attempts "
                 "FROM sessions "
-                'WHERE target = "%s" '
+                "WHERE target = '%s' "
                 ") as SES "
                 "JOIN attackers ON SES.attacker_id = attackers.id "
                 "JOIN locations ON attackers.locId = locations.locId "
                 "JOIN countries ON locations.country = countries.code "
                 "GROUP BY countries.code "
                 "ORDER BY c DESC "
-                "LIMIT 10;" % self.__database.escape_string(str_target)
+                "LIMIT 10;" % self.reports_database.escape_string(str_target)
             )
 
         queries["stats_breakin"] = (
@@ -309,7 +377,7 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
             "SELECT DISTINCT attacker_id "
             "FROM attempts "
             "WHERE success = 1 "
-            'AND client NOT LIKE "%libssh%" '
+            "AND client_id NOT IN (SELECT id FROM clients WHERE value LIKE '%libssh%') "
             ") as ATT "
             "JOIN attackers ON ATT.attacker_id = attackers.id "
             "JOIN locations ON attackers.locId = locations.locId "
@@ -326,9 +394,11 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
         targets = [None] + [x[0] for x in self.__targets if (x[2] or self.__do_fix)]
         for target in targets:
             filename = "wdays_%s" % target if target else "wdays"
-            where = "WHERE UNIX_TIMESTAMP(date) > %s " % self.recent_threshold
+            # Compare raw dates so that only recent partitions are scanned.
+            where = "WHERE date > FROM_UNIXTIME(%s) " % self.recent_threshold
             if target is not None:
-                where = f'{where}AND target = "{self.__database.escape_string(target)}" '
+                escaped = self.reports_database.escape_string(target)
+                where = f"{where}AND target = '{escaped}' "
 
             # day of week.
             time_start = time.time()
@@ -420,12 +490,12 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
                 "FROM ("
                 "  SELECT n_attempts, attacker_id "
                 "  FROM sessions "
-                '  WHERE target = "%s"'
+                "  WHERE target = '%s'"
                 ") as SES "
                 "JOIN attackers ON SES.attacker_id  = attackers.id "
                 "JOIN locations ON attackers.locId  = locations.locId "
                 "GROUP BY country "
-                "ORDER BY C DESC;" % self.__database.escape_string(target)
+                "ORDER BY C DESC;" % self.reports_database.escape_string(target)
             )
 
         temp_cache = {}
@@ -471,7 +541,7 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
             self.__generate_minimap(target)
 
     def __generate_map_data(self, target: str | None = None) -> None:
-        self.__database.cursor()
+        self.reports_database.cursor()
         suffix = "_%s" % target if target else ""
 
         queries = {}
@@ -493,12 +563,12 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
                 "FROM ("
                 "  SELECT n_attempts, attacker_id "
                 "  FROM sessions "
-                '  WHERE target = "%s"'
+                "  WHERE target = '%s'"
                 ") as SES "
                 "JOIN attackers ON SES.attacker_id = attackers.id "
                 "JOIN locations ON attackers.locId = locations.locId "
                 "JOIN countries ON locations.country = countries.code "
-                "GROUP BY code;" % self.__database.escape_string(target)
+                "GROUP BY code;" % self.reports_database.escape_string(target)
             )
 
         if not target:
@@ -518,13 +588,13 @@ class BlacknetScrubber(BlacknetConfigurationInterface):
                 "FROM ("
                 "  SELECT n_attempts, attacker_id "
                 "  FROM sessions "
-                '  WHERE target = "%s"'
+                "  WHERE target = '%s'"
                 ") as SES "
                 "JOIN attackers ON SES.attacker_id = attackers.id "
                 "JOIN locations ON attackers.locId = locations.locId "
                 "GROUP BY locations.locId "
                 "ORDER BY C DESC "
-                "LIMIT 250;" % self.__database.escape_string(target)
+                "LIMIT 250;" % self.reports_database.escape_string(target)
             )
 
         for filepath in queries:
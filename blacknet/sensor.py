@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 import os
+import selectors
 import socket
 import time
 from binascii import hexlify
+from collections import deque
 from contextlib import suppress
-from threading import Event, Lock
-from typing import Any
+from queue import Full, Queue
+from threading import Event, Lock, Thread
+from typing import Any, Callable
 
 import paramiko
 from paramiko import RSAKey
@@ -18,24 +21,71 @@ from .common import (
     BLACKNET_LOG_DEFAULT,
     BLACKNET_LOG_INFO,
     BLACKNET_PING_INTERVAL,
+    BLACKNET_PING_JITTER,
     BLACKNET_SSH_AUTH_RETRIES,
+    BLACKNET_SSH_BANNER_BATCH,
+    BLACKNET_SSH_BANNER_FLUSH_INTERVAL,
+    BLACKNET_SSH_BANNER_MAXLEN,
+    BLACKNET_SSH_BANNER_PENDING,
+    BLACKNET_SSH_BANNER_TIMEOUT,
     BLACKNET_SSH_CLIENT_TIMEOUT,
     BLACKNET_SSH_DEFAULT_BANNER,
     BLACKNET_SSH_DEFAULT_LISTEN,
+    BLACKNET_SSH_IDLE_TIMEOUT,
+    BLACKNET_SSH_PREAUTH_TIMEOUT,
+    BLACKNET_SSH_PRESSURE_SCALE,
+    BLACKNET_SSH_REAPER_INTERVAL,
+    BLACKNET_SSH_VERSION_MAXLEN,
     blacknet_ensure_unicode,
 )
+from .config import BlacknetConfig
 from .server import BlacknetServer, BlacknetThread
 
 
+def blacknet_ssh_keys_check(prvfile: str, log: Callable[[str], None]) -> RSAKey:
+    """Load the SSH host key, generate missing private and public key files."""
+    pubfile = "%s.pub" % prvfile
+    prv = None
+
+    if not os.path.exists(prvfile):
+        log("generating %s" % prvfile)
+        prv = RSAKey.generate(bits=1024)
+        prv.write_private_key_file(prvfile)
+
+    if not os.path.exists(pubfile):
+        log("generating %s" % pubfile)
+        pub = RSAKey(filename=prvfile)
+        with open(pubfile, "w") as f:
+            f.write(f"{pub.get_name()} {pub.get_base64()}")
+
+    if not prv:
+        prv = RSAKey(filename=prvfile)
+    return prv
+
+
+def blacknet_sensor_workers(config: BlacknetConfig) -> int:
+    """Get the number of sensor processes sharing the listening interfaces."""
+    if config.has_option("honeypot", "workers"):
+        return int(config.get("honeypot", "workers"))
+    return 1
+
+
 class BlacknetSSHSession(paramiko.ServerInterface):
     """SSH session to collect data from."""
 
-    def __init__(self, transport: paramiko.Transport, blacknet: BlacknetClient) -> None:
+    def __init__(
+        self,
+        transport: paramiko.Transport,
+        blacknet: BlacknetClient,
+        aggregate: bool = False,
+    ) -> None:
         """Handle a new SSH attack session."""
         self.__transport = transport
         self.__client_version = None  # type: str | None
         self.__peer_name = None  # type: str | None
         self.__allowed_auths = ["publickey", "password"]
+        self.__aggregate = aggregate
+        self.__credentials = {}  # type: dict[tuple[str, str], dict[str, Any]]
         self.auth_failed_count = 0
         # This needs to be a user-configured value at some point.
         self.auth_failed_limit = BLACKNET_SSH_AUTH_RETRIES
@@ -78,12 +128,34 @@ class BlacknetSSHSession(paramiko.ServerInterface):
             else:
                 auth_handler.auth_fail_count = 0
 
+    def __aggregate_credential(self, obj: dict[str, Any]) -> None:
+        key = (obj["user"], obj["passwd"])
+        item = self.__credentials.get(key)
+        if item is None:
+            obj["last"] = obj["time"]
+            obj["count"] = 1
+            self.__credentials[key] = obj
+        else:
+            item["last"] = obj["time"]
+            item["count"] += 1
+
+    def flush(self) -> None:
+        """Send aggregated credentials to the blacknet server."""
+        credentials = list(self.__credentials.values())
+        self.__credentials = {}
+        if credentials:
+            with suppress(BaseException):
+                self.blacknet.send_ssh_credentials(credentials)
+
     def check_auth_password(self, username: str, password: str) -> int:
         """Handle a password authentication."""
         with suppress(BaseException):
             obj = self.__auth_common_obj(username)
             obj["passwd"] = blacknet_ensure_unicode(password)
-            self.blacknet.send_ssh_credential(obj)
+            if self.__aggregate:
+                self.__aggregate_credential(obj)
+            else:
+                self.blacknet.send_ssh_credential(obj)
 
         self.__auth_failed_inc()
         return AUTH_FAILED
@@ -105,6 +177,276 @@ class BlacknetSSHSession(paramiko.ServerInterface):
         return AUTH_FAILED
 
 
+class BlacknetSensorSocket(socket.socket):
+    """Client socket handed over to paramiko, counting exchanged bytes."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        """Take ownership of the provided client socket."""
+        sock.setblocking(True)
+        super().__init__(sock.family, sock.type, sock.proto, sock.detach())
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.last_activity = time.monotonic()
+
+    def recv(self, bufsize: int, flags: int = 0) -> bytes:
+        """Receive data from the client."""
+        data = super().recv(bufsize, flags)
+        if data:
+            self.bytes_received += len(data)
+            self.last_activity = time.monotonic()
+        return data
+
+    def send(self, data: bytes, flags: int = 0) -> int:  # type: ignore[override]
+        """Send data to the client."""
+        sent = super().send(data, flags)
+        self.bytes_sent += sent
+        return sent
+
+
+class BlacknetBannerSocket(BlacknetSensorSocket):
+    """Client socket handed over to paramiko after the version exchange.
+
+    Data already received from the client is replayed first and our own
+    version string, which was already sent, is not sent a second time.
+    """
+
+    def __init__(self, sock: socket.socket, received: bytes, sent: bytes) -> None:
+        """Take ownership of the provided client socket."""
+        super().__init__(sock)
+        self.__received = received
+        self.__sent = sent
+        self.bytes_received = len(received)
+        self.bytes_sent = len(sent)
+
+    def recv(self, bufsize: int, flags: int = 0) -> bytes:
+        """Receive data, starting with what was read during the version exchange."""
+        data = self.__received
+        if data:
+            self.__received = data[bufsize:]
+            return data[:bufsize]
+        return super().recv(bufsize, flags)
+
+    def send(self, data: bytes, flags: int = 0) -> int:  # type: ignore[override]
+        """Send data, skipping our version string when paramiko sends it."""
+        sent = self.__sent
+        if sent:
+            self.__sent = b""
+            if data.startswith(sent):
+                if len(data) == len(sent):
+                    return len(sent)
+                return len(sent) + super().send(data[len(sent) :], flags)
+        return super().send(data, flags)
+
+
+class BlacknetBannerClient:
+    """Version exchange state for a single client connection."""
+
+    def __init__(self, sock: socket.socket, sent: bytes) -> None:
+        """Start tracking a newly accepted client."""
+        peername = sock.getpeername()
+        self.peer_ip = peername[0] if peername else "local"
+        self.sock = sock
+        self.sent = sent
+        self.received = b""
+        self.offset = 0
+        self.version = None  # type: str | None
+        self.time = 0
+        self.deadline = time.monotonic() + BLACKNET_SSH_BANNER_TIMEOUT
+
+
+class BlacknetBannerThread(Thread):
+    """Exchange SSH version strings with all incoming clients from a single thread.
+
+    Clients closing the connection right after the version exchange (mostly
+    scanners) never cost a paramiko transport and a thread: their version
+    string is reported to the master server by batches (from another thread,
+    so that clients are still served while the master server is away).
+    Clients sending anything more (KEXINIT) are handed over to a regular
+    sensor thread.
+    """
+
+    def __init__(self, bns: BlacknetSensor) -> None:
+        """Create the banner exchange thread for the provided sensor."""
+        super().__init__(name="banner")
+        self.daemon = True
+
+        self.__bns = bns
+        self.__running = True
+        self.__clients = {}  # type: dict[int, BlacknetBannerClient]
+        self.__incoming = deque()  # type: deque[socket.socket]
+        self.__banners = []  # type: list[dict[str, Any]]
+        self.__flush_deadline = 0.0
+        self.__expire_next = 0.0
+        self.__reports = Queue(BLACKNET_SSH_BANNER_PENDING)  # type: Queue[list[Any] | None]
+        self.__reporter = Thread(target=self.__report, name="banner-report")
+        self.__reporter.daemon = True
+
+        self.__wakeup_r, self.__wakeup_w = socket.socketpair()
+        self.__wakeup_r.setblocking(False)
+        self.__wakeup_w.setblocking(False)
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(self.__wakeup_r, selectors.EVENT_READ)
+
+    def add(self, client: socket.socket) -> None:
+        """Queue a newly accepted client for version exchange."""
+        self.__incoming.append(client)
+        self.__wakeup()
+
+    def stop(self) -> None:
+        """Stop the thread, report pending versions and close all clients."""
+        self.__running = False
+        self.__wakeup()
+        self.join()
+
+    def __wakeup(self) -> None:
+        with suppress(OSError):
+            self.__wakeup_w.send(b"\0")
+
+    def run(self) -> None:
+        """Thread entry point."""
+        self.__reporter.start()
+        while self.__running:
+            for key, _events in self.__selector.select(1.0):
+                if key.fileobj is self.__wakeup_r:
+                    with suppress(OSError):
+                        self.__wakeup_r.recv(4096)
+                else:
+                    self.__read(key.data)
+
+            self.__accept()
+            now = time.monotonic()
+            if now >= self.__expire_next:
+                self.__expire(now)
+                self.__expire_next = now + 1.0
+            self.__flush()
+
+        for client in list(self.__clients.values()):
+            self.__close(client)
+        while self.__incoming:
+            self.__incoming.popleft().close()
+        self.__flush(force=True)
+        self.__reports.put(None)
+        self.__reporter.join()
+
+        self.__selector.close()
+        self.__wakeup_r.close()
+        self.__wakeup_w.close()
+
+    def __accept(self) -> None:
+        sent = ("%s\r\n" % self.__bns.ssh_banner).encode()
+
+        while self.__incoming:
+            sock = self.__incoming.popleft()
+            try:
+                client = BlacknetBannerClient(sock, sent)
+                sock.setblocking(False)
+                sock.send(sent)
+            except OSError:
+                sock.close()
+                continue
+            self.__clients[sock.fileno()] = client
+            self.__selector.register(sock, selectors.EVENT_READ, client)
+
+    def __read(self, client: BlacknetBannerClient) -> None:
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self.__close(client)
+            return
+
+        client.received += data
+        if client.version is None:
+            self.__parse_version(client)
+        if client.version is not None and client.offset < len(client.received):
+            self.__handoff(client)
+
+    def __parse_version(self, client: BlacknetBannerClient) -> None:
+        received = client.received
+        while client.version is None:
+            end = received.find(b"\n", client.offset)
+            if end < 0:
+                if len(received) > BLACKNET_SSH_BANNER_MAXLEN:
+                    self.__close(client)
+                return
+
+            line = received[client.offset : end]
+            client.offset = end + 1
+            # Just like paramiko, ignore any line before the version string.
+            if line.startswith(b"SSH-"):
+                if len(line) + 1 > BLACKNET_SSH_VERSION_MAXLEN:
+                    self.__close(client)
+                    return
+                client.version = blacknet_ensure_unicode(line.rstrip(b"\r"))
+                client.time = int(time.time())
+                client.deadline = time.monotonic() + BLACKNET_SSH_BANNER_TIMEOUT
+            elif client.offset > BLACKNET_SSH_BANNER_MAXLEN:
+                self.__close(client)
+                return
+
+    def __forget(self, client: BlacknetBannerClient) -> None:
+        self.__clients.pop(client.sock.fileno(), None)
+        with suppress(KeyError, ValueError):
+            self.__selector.unregister(client.sock)
+
+    def __close(self, client: BlacknetBannerClient) -> None:
+        self.__forget(client)
+        client.sock.close()
+
+        if client.version is not None:
+            self.__bns.metrics.counter("ssh.banner_only").inc()
+            if not self.__banners:
+                self.__flush_deadline = time.monotonic() + BLACKNET_SSH_BANNER_FLUSH_INTERVAL
+            self.__banners.append(
+                {"client": client.peer_ip, "version": client.version, "time": client.time}
+            )
+
+    def __handoff(self, client: BlacknetBannerClient) -> None:
+        self.__forget(client)
+        try:
+            sock = BlacknetBannerSocket(client.sock, client.received, client.sent)
+            self.__bns.spawn_thread(BlacknetSensorThread, sock)
+            self.__bns.metrics.counter("ssh.banner_handoff").inc()
+        except OSError:
+            client.sock.close()
+
+    def __expire(self, now: float) -> None:
+        for client in list(self.__clients.values()):
+            if client.deadline < now:
+                self.__close(client)
+
+    def __flush(self, force: bool = False) -> None:
+        banners = self.__banners
+        if not banners:
+            return
+
+        if (
+            not force
+            and len(banners) < BLACKNET_SSH_BANNER_BATCH
+            and time.monotonic() < self.__flush_deadline
+        ):
+            return
+
+        self.__banners = []
+        self.__bns.log(f"SSH: reporting {len(banners)} client versions", BLACKNET_LOG_DEBUG)
+        try:
+            self.__reports.put_nowait(banners)
+        except Full:
+            self.__bns.metrics.counter("ssh.banner_dropped").inc(len(banners))
+
+    def __report(self) -> None:
+        """Send batches of client versions to the master server (reporter thread)."""
+        banners = self.__reports.get()
+        while banners is not None:
+            with suppress(Exception):
+                self.__bns.blacknet.send_ssh_banners(banners)
+            banners = self.__reports.get()
+
+
 class BlacknetSensor(BlacknetServer):
     """BlacknetSensor (SSH Server) main class.
 
@@ -119,12 +461,23 @@ class BlacknetSensor(BlacknetServer):
         """Create a new SSH sensor."""
         super().__init__("honeypot", cfg_file)
         self.__ssh_banner = None  # type: str | None
+        self.__banner_capture = None  # type: bool | None
+        self.__banner_thread = None  # type: BlacknetBannerThread | None
+        self.__aggregate_credentials = None  # type: bool | None
+        self.__ssh_timeouts = None  # type: tuple[float, float, float] | None
+        self.__ssh_high_water = None  # type: int | None
 
         self.ssh_host_key = None  # type: RSAKey | None
         self.ssh_host_hash = None  # type: str | None
         self.__ssh_private_key_check()
 
-        self.blacknet = BlacknetClient(self.config, self._logger)
+        self.blacknet = BlacknetClient(self.config, self._logger, self.metrics)
+        self.__banner_thread_update()
+
+        self.scheduler.every("reaper", BLACKNET_SSH_REAPER_INTERVAL, self.reap)
+        self.scheduler.every(
+            "ping", BLACKNET_PING_INTERVAL, self.do_ping, jitter=BLACKNET_PING_JITTER
+        )
 
     @property
     def ssh_banner(self) -> str:
@@ -136,32 +489,96 @@ class BlacknetSensor(BlacknetServer):
                 self.__ssh_banner = BLACKNET_SSH_DEFAULT_BANNER
         return self.__ssh_banner
 
+    @property
+    def workers(self) -> int:
+        """Number of sensor processes sharing the listening interfaces."""
+        return blacknet_sensor_workers(self.config)
+
+    @property
+    def reuse_port(self) -> bool:
+        """Share listening interfaces when running multiple workers."""
+        return self.workers > 1
+
+    @property
+    def banner_capture(self) -> bool:
+        """Whether version strings are exchanged before spawning SSH sessions."""
+        if self.__banner_capture is None:
+            if self.has_config("banner_capture"):
+                self.__banner_capture = self.get_config_bool("banner_capture")
+            else:
+                self.__banner_capture = False
+        return self.__banner_capture
+
+    @property
+    def aggregate_credentials(self) -> bool:
+        """Whether identical credentials are sent once per SSH session."""
+        if self.__aggregate_credentials is None:
+            if self.has_config("aggregate_credentials"):
+                self.__aggregate_credentials = self.get_config_bool("aggregate_credentials")
+            else:
+                self.__aggregate_credentials = False
+        return self.__aggregate_credentials
+
+    @property
+    def ssh_timeouts(self) -> tuple[float, float, float]:
+        """Get SSH pre-authentication, idle and whole session timeouts."""
+        if self.__ssh_timeouts is None:
+            preauth = float(BLACKNET_SSH_PREAUTH_TIMEOUT)
+            idle = float(BLACKNET_SSH_IDLE_TIMEOUT)
+            session = float(BLACKNET_SSH_CLIENT_TIMEOUT)
+
+            if self.has_config("ssh_preauth_timeout"):
+                preauth = float(self.get_config("ssh_preauth_timeout"))
+            if self.has_config("ssh_idle_timeout"):
+                idle = float(self.get_config("ssh_idle_timeout"))
+            if self.has_config("ssh_session_timeout"):
+                session = float(self.get_config("ssh_session_timeout"))
+            self.__ssh_timeouts = (preauth, idle, session)
+        return self.__ssh_timeouts
+
+    @property
+    def ssh_high_water(self) -> int:
+        """Number of concurrent SSH sessions above which timeouts are tightened."""
+        if self.__ssh_high_water is None:
+            if self.has_config("ssh_high_water"):
+                self.__ssh_high_water = int(self.get_config("ssh_high_water"))
+            else:
+                self.__ssh_high_water = 0
+        return self.__ssh_high_water
+
+    def reap(self) -> None:
+        """Close SSH sessions that exceeded their timeouts."""
+        scale = 1.0
+        high_water = self.ssh_high_water
+        if high_water and self.metrics.gauge("ssh.sessions").value > high_water:
+            scale = BLACKNET_SSH_PRESSURE_SCALE
+
+        now = time.monotonic()
+        for thr in self.threads:
+            if isinstance(thr, BlacknetSensorThread) and thr.is_stalled(now, scale):
+                thr.log_debug("SSH: closing stalled session")
+                thr.disconnect()
+                self.metrics.counter("ssh.reaped").inc()
+
+    def __banner_thread_update(self) -> None:
+        thread = self.__banner_thread
+        if self.banner_capture and thread is None:
+            self.log_info("starting SSH banner capture")
+            thread = BlacknetBannerThread(self)
+            thread.start()
+            self.__banner_thread = thread
+        elif not self.banner_capture and thread is not None:
+            self.log_info("stopping SSH banner capture")
+            thread.stop()
+            self.__banner_thread = None
+
     def __ssh_private_key_check(self) -> None:
-        prvfile = self.get_config("ssh_keys")
-        pubfile = "%s.pub" % prvfile
-        prv = None
+        try:
+            prv = blacknet_ssh_keys_check(self.get_config("ssh_keys"), self.log_info)
+        except Exception as e:
+            self.log_critical("error: %s" % e)
+            raise
 
-        if not os.path.exists(prvfile):
-            try:
-                self.log_info("generating %s" % prvfile)
-                prv = RSAKey.generate(bits=1024)
-                prv.write_private_key_file(prvfile)
-            except Exception as e:
-                self.log_critical("error: %s" % e)
-                raise
-
-        if not os.path.exists(pubfile):
-            try:
-                self.log_info("generating %s" % pubfile)
-                pub = RSAKey(filename=prvfile)
-                with open(pubfile, "w") as f:
-                    f.write(f"{pub.get_name()} {pub.get_base64()}")
-            except Exception as e:
-                self.log_critical("error: %s" % e)
-                raise
-
-        if not prv:
-            prv = RSAKey(filename=prvfile)
         self.ssh_host_key = prv
         self.ssh_host_hash = hexlify(prv.get_fingerprint()).decode("ascii")
         self.log_info("SSH fingerprint: %s" % self.ssh_host_hash)
@@ -171,6 +588,11 @@ class BlacknetSensor(BlacknetServer):
         super().reload()
         self.__ssh_private_key_check()
         self.blacknet.reload()
+        self.__banner_capture = None
+        self.__banner_thread_update()
+        self.__aggregate_credentials = None
+        self.__ssh_timeouts = None
+        self.__ssh_high_water = None
 
     def do_ping(self) -> None:
         """Send a ping request to the server."""
@@ -178,12 +600,23 @@ class BlacknetSensor(BlacknetServer):
         if not self.blacknet.server_is_sockfile:
             self.blacknet.send_ping()
 
+    def _dispatch(self, threadclass: type[BlacknetThread], client: socket.socket) -> None:
+        """Perform the version exchange first when banner capture is enabled."""
+        thread = self.__banner_thread
+        if thread is not None:
+            thread.add(client)
+        else:
+            super()._dispatch(threadclass, client)
+
     def serve(self) -> None:  # type: ignore[override]
         """Serve new connections into new threads."""
-        super().serve(BlacknetSensorThread, BLACKNET_PING_INTERVAL, self.do_ping)
+        super().serve(BlacknetSensorThread)
 
     def shutdown(self) -> None:
         """Close the sensor, disconnect from everything."""
+        self.scheduler.stop()
+        self.__banner_capture = False
+        self.__banner_thread_update()
         self.blacknet.disconnect()
         super().shutdown()
 
@@ -195,42 +628,90 @@ class BlacknetSensorThread(BlacknetThread):
         """Spawn a new sensor thread to handle a SSH client."""
         super().__init__(bns, client)
 
-        self.started = False
         self.__connection_lock = Lock()
         self.__bns = bns
+        self.__transport = None  # type: paramiko.Transport | None
+        self.__session = None  # type: BlacknetSSHSession | None
+        self.__negotiated = Event()
+        self.__time_start = time.monotonic()
+        self.__auth_retries = 0
+
+        if not isinstance(client, BlacknetSensorSocket):
+            client = BlacknetSensorSocket(client)
+        self.__client = client  # type: BlacknetSensorSocket | None
 
         peername = client.getpeername()
         self.__peer_ip = peername[0] if peername else "local"
-        self.__client = client
-        self.__transport = None  # type: paramiko.Transport | None
-        self.__auth_retries = 0
 
     def __del__(self) -> None:
         """Disconnect on thread deletion."""
         self.disconnect()
 
-    def run(self) -> None:
-        """Thread entry point."""
-        self.started = True
+    def handle(self) -> None:
+        """Handle the SSH client connection."""
         self.log_debug("SSH: starting session")
 
-        t = paramiko.Transport(self.__client)
-        t.local_version = self.__bns.ssh_banner
+        metrics = self.__bns.metrics
+        sessions = metrics.gauge("ssh.sessions")
+        sessions.inc()
+        metrics.counter("ssh.sessions_total").inc()
+        try:
+            self.__run_session()
+        finally:
+            sessions.dec()
+
+    def __run_session(self) -> None:
+        client = self.__client
+        if client is None:
+            return
+
+        bns = self.__bns
+        metrics = bns.metrics
+        time_start = self.__time_start = time.monotonic()
+        session_timeout = bns.ssh_timeouts[2]
+
+        t = paramiko.Transport(client)
+        t.local_version = bns.ssh_banner
         with suppress(BaseException):
             t.load_server_moduli()
-        if self.__bns.ssh_host_key is not None:
-            t.add_server_key(self.__bns.ssh_host_key)
+        if bns.ssh_host_key is not None:
+            t.add_server_key(bns.ssh_host_key)
         self.__transport = t
 
-        ssh_server = BlacknetSSHSession(t, self.__bns.blacknet)
+        ssh_server = BlacknetSSHSession(t, bns.blacknet, bns.aggregate_credentials)
+        self.__session = ssh_server
+        negotiated = self.__negotiated
         try:
-            t.start_server(server=ssh_server, event=Event())
-            t.join(BLACKNET_SSH_CLIENT_TIMEOUT)
+            t.start_server(server=ssh_server, event=negotiated)
+            if negotiated.wait(session_timeout) and t.is_active():
+                handshake_time = time.monotonic() - time_start
+                metrics.histogram("ssh.handshake_time").observe(handshake_time)
+            t.join(max(0.0, time_start + session_timeout - time.monotonic()))
         except Exception as e:
             self.log_debug("SSH: %s" % e)
+        ssh_server.flush()
         self.__auth_retries = ssh_server.auth_failed_count
+
+        metrics.histogram("ssh.session_time").observe(time.monotonic() - time_start)
+        metrics.histogram("ssh.auth_rounds").observe(ssh_server.auth_failed_count)
+        metrics.histogram("ssh.bytes_received").observe(client.bytes_received)
+        metrics.histogram("ssh.bytes_sent").observe(client.bytes_sent)
         self.disconnect()
 
+    def is_stalled(self, now: float, scale: float = 1.0) -> bool:
+        """Tell whether this session exceeded one of its (scaled) timeouts."""
+        client = self.__client
+        session = self.__session
+        if client is None or session is None or self.__transport is None:
+            return False
+
+        preauth, idle, total = self.__bns.ssh_timeouts
+        timeout = idle if session.auth_failed_count else preauth
+        return (
+            now - client.last_activity > timeout * scale
+            or now - self.__time_start > total * scale
+        )
+
     def log(self, message: str, level: int = BLACKNET_LOG_DEFAULT) -> None:
         """Write something to the attached logger."""
         if self.__bns.logger:
@@ -253,6 +734,8 @@ class BlacknetSensorThread(BlacknetThread):
                 self.log_debug(f"SSH: stopping session ({auth_retries} failed retries)")
                 self.__transport.close()
                 self.__transport = None
+                # Wake up the session handler if still waiting for key exchange.
+                self.__negotiated.set()
 
             if self.__client:
                 with suppress(OSError):
@@ -4,25 +4,91 @@ import errno
 import grp
 import os
 import pwd
-import select
+import selectors
 import socket
-from threading import Thread
-from typing import Callable, Optional, Union
+import time
+from contextlib import suppress
+from datetime import datetime
+from threading import Lock, Thread
+from typing import Optional, Union
+
+from msgpack import packb, unpackb
 
 from .common import (
+    BLACKNET_DRAIN_TIMEOUT,
+    BLACKNET_HANDOFF_MAXFDS,
+    BLACKNET_HANDOFF_TIMEOUT,
+    BLACKNET_LISTEN_BACKLOG,
+    BLACKNET_LISTEN_CHECK_INTERVAL,
+    BLACKNET_LISTEN_FDS_START,
+    BLACKNET_LISTEN_NETSTAT,
     BLACKNET_LOG_CRITICAL,
     BLACKNET_LOG_DEFAULT,
     BLACKNET_LOG_ERROR,
     BLACKNET_LOG_INFO,
+    BLACKNET_LOG_WARNING,
+    BLACKNET_SERVER_SHUTDOWN_TIMEOUT,
     BLACKNET_SSL_DEFAULT_LISTEN,
     BLACKNET_SSL_DEFAULT_PORT,
 )
 from .config import BlacknetConfig, BlacknetConfigurationInterface
 from .logger import BlacknetLogger
+from .metrics import BlacknetMetrics
+from .scheduler import BlacknetScheduler, BlacknetTask
 
 SocketPermissionType = tuple[Optional[str], Optional[str], Optional[int]]
 ListenInterfaceType = Union[str, tuple[str, int]]
-TimeFunc = Callable[[], None]
+
+
+def blacknet_listen_drops() -> tuple[int, int] | None:
+    """Get system-wide accept queue overflows and dropped SYNs, when available."""
+    try:
+        with open(BLACKNET_LISTEN_NETSTAT) as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    # Lines come by pairs: a header with field names then their values.
+    for names, values in zip(lines[::2], lines[1::2]):
+        if names.startswith("TcpExt:"):
+            stats = dict(zip(names.split()[1:], values.split()[1:]))
+            with suppress(KeyError, ValueError):
+                return (int(stats["ListenOverflows"]), int(stats["ListenDrops"]))
+    return None
+
+
+def blacknet_listen_fds() -> list[socket.socket]:
+    """Get listening sockets passed by systemd socket activation (LISTEN_FDS)."""
+    try:
+        pid = int(os.environ.get("LISTEN_PID", "0"))
+        count = int(os.environ.get("LISTEN_FDS", "0"))
+    except ValueError:
+        return []
+    if pid != os.getpid():
+        return []
+
+    # These are meant for us only, not for our children.
+    for name in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(name, None)
+
+    sockets = []
+    for fd in range(BLACKNET_LISTEN_FDS_START, BLACKNET_LISTEN_FDS_START + count):
+        os.set_inheritable(fd, False)
+        sockets.append(socket.socket(fileno=fd))
+    return sockets
+
+
+def blacknet_socket_interface(sock: socket.socket) -> ListenInterfaceType:
+    """Get the listening interface a socket is bound to."""
+    name = sock.getsockname()
+    if sock.family == socket.AF_UNIX:
+        return str(name)
+    return (name[0], name[1])
+
+
+def blacknet_interface_name(interface: ListenInterfaceType) -> str:
+    """Get a printable name for the provided interface."""
+    return interface if isinstance(interface, str) else "%s:%u" % interface
 
 
 class BlacknetThread(Thread):
@@ -32,6 +98,19 @@ class BlacknetThread(Thread):
         """Initialize a new worker thread."""
         super().__init__()
         self.started = False
+        self.__server = server
+
+    def run(self) -> None:
+        """Thread entry point, unregisters the thread from its server when done."""
+        self.started = True
+        try:
+            self.handle()
+        finally:
+            self.__server.unregister_thread(self)
+
+    def handle(self) -> None:
+        """Handle the client connection."""
+        return
 
     def disconnect(self) -> None:
         """Disconnect from the client."""
@@ -48,9 +127,33 @@ class BlacknetServer(BlacknetConfigurationInterface):
         """Instanciate a new blacknet server."""
         self.__listen_interfaces = None  # type: Optional[list[ListenInterfaceType]]
         self.__socket_permissions = None  # type: Optional[SocketPermissionType]
+        self.__listen_backlog = None  # type: Optional[int]
+        self.__listen_drops = blacknet_listen_drops()
+        self.__stats_interval = None  # type: Optional[float]
+        self.__stats_file = None  # type: Optional[str]
+        self.__stats_task: BlacknetTask | None = None
+        self.metrics = BlacknetMetrics()
 
         self._interfaces = {}  # type: dict[ListenInterfaceType, socket.socket]
-        self._threads = []  # type: list[BlacknetThread]
+        # Sockets inherited from systemd or from a previous instance, waiting to be used.
+        self.__inherited = {}  # type: dict[ListenInterfaceType, socket.socket]
+        # Interfaces whose sockets belong to systemd (never shut down nor removed).
+        self.__foreign = set()  # type: set[ListenInterfaceType]
+        self.__handoff_path = None  # type: Optional[str]
+        self.__handoff_listener = None  # type: Optional[socket.socket]
+        self.handed_off = False
+        # Running connection threads, they remove themselves when done.
+        self._threads = set()  # type: set[BlacknetThread]
+        self._threads_lock = Lock()
+
+        # Listening sockets stay registered here for as long as they are open.
+        self._selector = selectors.DefaultSelector()
+
+        # Writing to this socket pair wakes the serving loop up (see wakeup_fd).
+        self.__wakeup_r, self.__wakeup_w = socket.socketpair()
+        self.__wakeup_r.setblocking(False)
+        self.__wakeup_w.setblocking(False)
+        self._selector.register(self.__wakeup_r, selectors.EVENT_READ)
 
         config = BlacknetConfig()
         config.load(cfg_file)
@@ -60,7 +163,18 @@ class BlacknetServer(BlacknetConfigurationInterface):
         self._logger = BlacknetLogger(role, config)
         self.log_info("== %s is starting" % self.__class__.__name__)
 
+        # Periodic maintenance runs here, regardless of connection activity.
+        self.scheduler = BlacknetScheduler(self.metrics, self.log_error)
+        self.scheduler.start()
+
+        self.__inherit_sockets()
         self._listen_start_stop()
+        self.__inherited_cleanup()
+        self.__handoff_start()
+        self._stats_task_update()
+        self.scheduler.every(
+            "listen_check", BLACKNET_LISTEN_CHECK_INTERVAL, self.listen_drops_check
+        )
 
     @property
     def logger(self) -> BlacknetLogger:
@@ -116,6 +230,100 @@ class BlacknetServer(BlacknetConfigurationInterface):
             self.__listen_interfaces = listen
         return self.__listen_interfaces
 
+    @property
+    def listen_backlog(self) -> int:
+        """Length of the accept queue on listening sockets."""
+        if self.__listen_backlog is None:
+            if self.has_config("listen_backlog"):
+                self.__listen_backlog = int(self.get_config("listen_backlog"))
+            else:
+                self.__listen_backlog = BLACKNET_LISTEN_BACKLOG
+        return self.__listen_backlog
+
+    def listen_drops_check(self) -> None:
+        """Report connections dropped by the kernel since the last check."""
+        previous = self.__listen_drops
+        current = blacknet_listen_drops()
+        if previous is None or current is None:
+            return
+        self.__listen_drops = current
+
+        overflows = current[0] - previous[0]
+        drops = current[1] - previous[1]
+        if overflows > 0 or drops > 0:
+            self.metrics.counter("listen.overflows").inc(overflows)
+            self.metrics.counter("listen.drops").inc(drops)
+            self.log(
+                f"accept queue overflowed {overflows} times, {drops} connections dropped",
+                BLACKNET_LOG_WARNING,
+            )
+
+    @property
+    def stats_interval(self) -> float:
+        """Interval between two metrics summaries (0 to disable)."""
+        if self.__stats_interval is None:
+            if self.has_config("stats_interval"):
+                self.__stats_interval = float(self.get_config("stats_interval"))
+            else:
+                self.__stats_interval = 0.0
+        return self.__stats_interval
+
+    @property
+    def stats_file(self) -> str | None:
+        """File to write metrics summaries to, instead of the log file."""
+        if self.__stats_file is None and self.has_config("stats_file"):
+            self.__stats_file = self.get_config("stats_file")
+        return self.__stats_file
+
+    def _stats_task_update(self) -> None:
+        task = self.__stats_task
+        if task is not None:
+            self.scheduler.cancel(task)
+            self.__stats_task = None
+        if self.stats_interval > 0:
+            self.__stats_task = self.scheduler.every(
+                "stats", self.stats_interval, self.stats_dump
+            )
+
+    def stats_dump(self) -> None:
+        """Write a summary of all metrics to the statistics file or to the log."""
+        lines = self.metrics.summary()
+        stats_file = self.stats_file
+        if stats_file:
+            date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                with open(f"{stats_file}.tmp", "w") as f:
+                    f.write(f"# {date}\n")
+                    f.writelines(f"{line}\n" for line in lines)
+                os.replace(f"{stats_file}.tmp", stats_file)
+            except OSError as e:
+                self.log_error("stats file: %s" % e)
+        else:
+            for line in lines:
+                self.log_info("stats: %s" % line)
+
+    @property
+    def wakeup_fd(self) -> int:
+        """File descriptor waking up the serving loop, suitable for signal.set_wakeup_fd."""
+        return self.__wakeup_w.fileno()
+
+    def wakeup(self) -> None:
+        """Make the serving loop return as soon as possible."""
+        with suppress(OSError):
+            self.__wakeup_w.send(b"\0")
+
+    @property
+    def drain_timeout(self) -> float:
+        """How long connections may go on after listening sockets were handed over."""
+        if self.has_config("drain_timeout"):
+            return float(self.get_config("drain_timeout"))
+        return BLACKNET_DRAIN_TIMEOUT
+
+    @property
+    def reuse_port(self) -> bool:
+        """Whether TCP listening interfaces are shared with other processes."""
+        return False
+
     def log(self, message: str, level: int = BLACKNET_LOG_DEFAULT) -> None:
         """Write something to the attached logger."""
         if self._logger:
@@ -129,6 +337,10 @@ class BlacknetServer(BlacknetConfigurationInterface):
         """Write an error message to the logger."""
         self.log(message, BLACKNET_LOG_ERROR)
 
+    def log_warning(self, message: str) -> None:
+        """Write a warning message to the logger."""
+        self.log(message, BLACKNET_LOG_WARNING)
+
     def log_info(self, message: str) -> None:
         """Write an informational message to the logger."""
         self.log(message, BLACKNET_LOG_INFO)
@@ -142,8 +354,17 @@ class BlacknetServer(BlacknetConfigurationInterface):
             self._logger.reload()
         self.__listen_interfaces = None
         self.__socket_permissions = None
+        self.__listen_backlog = None
         self._listen_start_stop()
 
+        # Running listen() again on a listening socket updates its backlog.
+        for sock in self._interfaces.values():
+            sock.listen(self.listen_backlog)
+
+        self.__stats_interval = None
+        self.__stats_file = None
+        self._stats_task_update()
+
     def _listen_start_stop(self) -> None:
         interfaces = self.listen_interfaces
 
@@ -163,6 +384,8 @@ class BlacknetServer(BlacknetConfigurationInterface):
 
         # Change permissions on UNIX sockets to apply new ones.
         for itf3 in interfaces:
+            if itf3 in self.__foreign:
+                continue
             if not isinstance(itf3, tuple) and (itf3 in current_interfaces):
                 self._permissions_apply(itf3)
 
@@ -175,35 +398,177 @@ class BlacknetServer(BlacknetConfigurationInterface):
             self._listen_start(itf5)
 
     def _listen_start(self, interface: ListenInterfaceType) -> None:
-        if isinstance(interface, str):
+        name = blacknet_interface_name(interface)
+        sock = self.__inherited.pop(interface, None)
+        if sock is not None:
+            self.log_info("inheriting interface %s" % name)
+        elif isinstance(interface, str):
+            if self.reuse_port:
+                self.log_error(f"interface {interface} cannot be shared between processes")
+                return
             if os.path.exists(interface):
                 os.remove(interface)
             sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             sock.bind(interface)
             self._permissions_apply(interface)
-            name = interface
         else:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             sock.bind(interface)
-            name = "%s:%u" % interface
-        sock.listen(5)
+        sock.setblocking(False)
+        sock.listen(self.listen_backlog)
 
         self._interfaces[interface] = sock
+        self._selector.register(sock, selectors.EVENT_READ, interface)
         self.log_info("starting interface %s" % name)
 
     def _listen_stop(self, interface: ListenInterfaceType) -> None:
         sock = self._interfaces.pop(interface, None)
         if sock:
-            name = interface if isinstance(interface, str) else "%s:%u" % interface
-            self.log_info(f"stopping interface {name}")
-            sock.shutdown(socket.SHUT_RDWR)
+            self.log_info("stopping interface %s" % blacknet_interface_name(interface))
+            self._selector.unregister(sock)
+
+            # Shutting down a socket held by systemd would also break it there.
+            foreign = interface in self.__foreign
+            self.__foreign.discard(interface)
+            if not foreign:
+                sock.shutdown(socket.SHUT_RDWR)
             sock.close()
 
-            if isinstance(interface, str):
+            if isinstance(interface, str) and not foreign:
                 os.remove(interface)
 
+    def __listen_release(self) -> None:
+        """Close all listening sockets, leaving them alive for other processes."""
+        for sock in self._interfaces.values():
+            self._selector.unregister(sock)
+            sock.close()
+        self._interfaces.clear()
+
+    def __inherit_sockets(self) -> None:
+        for sock in blacknet_listen_fds():
+            interface = blacknet_socket_interface(sock)
+            self.__inherited[interface] = sock
+            self.__foreign.add(interface)
+
+        if self.has_config("handoff_socket"):
+            if self.reuse_port:
+                self.log_info("handoff socket is not used with shared interfaces")
+            else:
+                self.__handoff_path = self.get_config("handoff_socket")
+                if not self.__inherited:
+                    self.__inherited = self.__takeover()
+
+    def __inherited_cleanup(self) -> None:
+        for interface, sock in self.__inherited.items():
+            name = blacknet_interface_name(interface)
+            self.log_error("inherited interface %s is not configured, closing" % name)
+            self.__foreign.discard(interface)
+            sock.close()
+        self.__inherited.clear()
+
+    def __takeover(self) -> dict[ListenInterfaceType, socket.socket]:
+        """Get listening sockets from a running instance through the handoff socket."""
+        inherited = {}  # type: dict[ListenInterfaceType, socket.socket]
+        path = self.__handoff_path
+        if not path or not os.path.exists(path):
+            return inherited
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(BLACKNET_HANDOFF_TIMEOUT)
+            try:
+                conn.connect(path)
+            except OSError:
+                # Nothing is running there anymore.
+                return inherited
+
+            try:
+                data, fds, _flags, _addr = socket.recv_fds(
+                    conn, 65536, BLACKNET_HANDOFF_MAXFDS
+                )
+            except OSError as e:
+                self.log_error("takeover: %s" % e)
+                return inherited
+
+            sockets = []
+            for fd in fds:
+                os.set_inheritable(fd, False)
+                sockets.append(socket.socket(fileno=fd))
+            try:
+                names = unpackb(data)
+                if len(names) != len(sockets):
+                    raise ValueError("%u names for %u sockets" % (len(names), len(sockets)))
+                conn.sendall(b"\0")
+            except (OSError, ValueError) as e:
+                self.log_error("takeover: %s" % e)
+                for sock in sockets:
+                    sock.close()
+                return inherited
+
+        for name, sock in zip(names, sockets):
+            interface = tuple(name) if isinstance(name, list) else name
+            inherited[interface] = sock
+        self.log_info("took over %u interfaces from a running instance" % len(inherited))
+        return inherited
+
+    def __handoff_start(self) -> None:
+        path = self.__handoff_path
+        if not path:
+            return
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            sock.bind(path)
+            os.chmod(path, 0o600)
+            sock.listen(1)
+        except OSError as e:
+            self.log_error("handoff socket: %s" % e)
+            sock.close()
+            return
+        sock.setblocking(False)
+        self._selector.register(sock, selectors.EVENT_READ)
+        self.__handoff_listener = sock
+
+    def __handoff_stop(self) -> None:
+        sock = self.__handoff_listener
+        if sock is not None:
+            self._selector.unregister(sock)
+            sock.close()
+            self.__handoff_listener = None
+            # Our successor owns this path once the handoff is done.
+            if self.__handoff_path and not self.handed_off:
+                with suppress(OSError):
+                    os.remove(self.__handoff_path)
+
+    def __handoff(self, listener: socket.socket) -> None:
+        """Pass all listening sockets to the new instance connected to the handoff socket."""
+        try:
+            conn, _ = listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+
+        interfaces = list(self._interfaces.items())
+        with conn:
+            conn.settimeout(BLACKNET_HANDOFF_TIMEOUT)
+            try:
+                names = packb([interface for interface, _ in interfaces])
+                socket.send_fds(conn, [names], [sock.fileno() for _, sock in interfaces])
+                if conn.recv(1) != b"\0":
+                    raise OSError("handoff was not acknowledged")
+            except OSError as e:
+                self.log_error("handoff: %s" % e)
+                return
+
+        self.log_info("listening interfaces handed over to a new instance")
+        self.handed_off = True
+        self.__listen_release()
+        self.__handoff_stop()
+
     def _permissions_apply(self, filepath: str) -> None:
         owner, group, mode = self.socket_permissions
         if owner or group:
@@ -218,39 +583,84 @@ class BlacknetServer(BlacknetConfigurationInterface):
         if mode:
             os.chmod(filepath, mode)
 
-    def _threads_cleanup(self) -> None:
-        for thr in self._threads:
-            if not thr.started and not thr.is_alive():
-                thr.join()
-                self._threads.remove(thr)
+    @property
+    def threads(self) -> list[BlacknetThread]:
+        """Get a snapshot of running connection threads."""
+        with self._threads_lock:
+            return list(self._threads)
+
+    def unregister_thread(self, thr: BlacknetThread) -> None:
+        """Forget about a terminated connection thread."""
+        with self._threads_lock:
+            self._threads.discard(thr)
+
+    def _threads_drain(self) -> None:
+        threads = self.threads
+        self.log_info("waiting for %u connections to terminate" % len(threads))
+        deadline = time.monotonic() + self.drain_timeout
+        for thr in threads:
+            with suppress(RuntimeError):
+                thr.join(max(0.0, deadline - time.monotonic()))
 
     def _threads_killer(self) -> None:
-        for thr in self._threads:
-            if thr.is_alive():
-                thr.disconnect()
-            if thr.started:
-                thr.join()
-            self._threads.remove(thr)
+        threads = self.threads
+        for thr in threads:
+            thr.disconnect()
+
+        deadline = time.monotonic() + BLACKNET_SERVER_SHUTDOWN_TIMEOUT
+        for thr in threads:
+            with suppress(RuntimeError):
+                thr.join(max(0.0, deadline - time.monotonic()))
+
+        remaining = len(self.threads)
+        if remaining:
+            self.log_error(f"{remaining} threads still running after shutdown")
+
+    def _dispatch(self, threadclass: type[BlacknetThread], client: socket.socket) -> None:
+        """Handle a newly accepted client connection."""
+        self.spawn_thread(threadclass, client)
+
+    def spawn_thread(self, threadclass: type[BlacknetThread], client: socket.socket) -> None:
+        """Serve the provided client connection in a new thread."""
+        t = threadclass(self, client)
+        with self._threads_lock:
+            self._threads.add(t)
+        try:
+            t.start()
+        except BaseException:
+            self.unregister_thread(t)
+            raise
+
+    def _accept_all(self, sock: socket.socket, threadclass: type[BlacknetThread]) -> None:
+        """Accept all pending connections on a (non-blocking) listening socket."""
+        while True:
+            try:
+                client, address = sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionAbortedError:
+                continue
+            # Accepted sockets do not inherit the non-blocking flag.
+            self._dispatch(threadclass, client)
 
     def serve(
-        self,
-        threadclass: type[BlacknetThread] = BlacknetThread,
-        timeout: float | None = None,
-        timefunc: TimeFunc | None = None,
+        self, threadclass: type[BlacknetThread] = BlacknetThread, timeout: float | None = None
     ) -> None:
-        """Serve new connections into new threads."""
-        self._threads_cleanup()
+        """Serve new connections into new threads.
 
-        sockets = self._interfaces.values()
+        Only one batch of events is handled before returning to the caller.
+        """
         try:
-            acceptable = select.select(sockets, [], [], timeout)
-            if timefunc is not None and not len(acceptable[0]):
-                timefunc()
-            for sock in acceptable[0]:
-                client, address = sock.accept()
-                t = threadclass(self, client)
-                self._threads.append(t)
-                t.start()
+            events = self._selector.select(timeout)
+            for key, _mask in events:
+                if key.fileobj is self.__wakeup_r:
+                    with suppress(BlockingIOError):
+                        self.__wakeup_r.recv(4096)
+                    continue
+                if key.fileobj is self.__handoff_listener:
+                    self.__handoff(self.__handoff_listener)
+                    continue
+                self._accept_all(self._interfaces[key.data], threadclass)
         except InterruptedError:
             pass
         except OSError as e:
@@ -262,10 +672,21 @@ class BlacknetServer(BlacknetConfigurationInterface):
 
     def shutdown(self) -> None:
         """Stop all interfaces and shutdown the server."""
+        self.scheduler.stop()
+
         # Force expected interfaces to be an empty list.
         self.__listen_interfaces = []
         self._listen_start_stop()
+        self.__handoff_stop()
+        if self.handed_off:
+            self._threads_drain()
         self._threads_killer()
+        self._selector.close()
+        self.__wakeup_r.close()
+        self.__wakeup_w.close()
+
+        if self.stats_interval > 0:
+            self.stats_dump()
         self.log_info("== %s stopped" % self.__class__.__name__)
         logger = self._logger
         if logger is not None:
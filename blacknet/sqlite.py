@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import time
+from collections.abc import Collection, Iterable
+from contextlib import suppress
+from datetime import datetime
+from functools import lru_cache
+from typing import Any
+
+from .common import BLACKNET_SQLITE_TIMEOUT
+
+# Schema applied to new (empty) SQLite databases.
+BLACKNET_SQLITE_SCHEMA = os.path.join(os.path.dirname(__file__), "sqlite.sql")
+# Format of dates stored in SQLite databases (local time, like MySQL DATETIME).
+BLACKNET_SQLITE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def sqlite_from_unixtime(timestamp: float | None) -> str | None:
+    """SQLite equivalent of MySQL's FROM_UNIXTIME()."""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(float(timestamp)).strftime(BLACKNET_SQLITE_DATE_FORMAT)
+
+
+def sqlite_date_parse(value: str) -> datetime:
+    """Parse a date as stored in SQLite databases."""
+    return datetime.strptime(value[:19], BLACKNET_SQLITE_DATE_FORMAT)
+
+
+def sqlite_unix_timestamp(value: str | None = None) -> int | None:
+    """SQLite equivalent of MySQL's UNIX_TIMESTAMP()."""
+    if value is None:
+        return None
+    return int(sqlite_date_parse(value).timestamp())
+
+
+def sqlite_now() -> str:
+    """SQLite equivalent of MySQL's NOW()."""
+    return time.strftime(BLACKNET_SQLITE_DATE_FORMAT)
+
+
+def sqlite_weekday(value: str | None) -> int | None:
+    """SQLite equivalent of MySQL's WEEKDAY() (0 is monday)."""
+    if value is None:
+        return None
+    return sqlite_date_parse(value).weekday()
+
+
+def sqlite_hour(value: str | None) -> int | None:
+    """SQLite equivalent of MySQL's HOUR()."""
+    if value is None:
+        return None
+    return sqlite_date_parse(value).hour
+
+
+@lru_cache(maxsize=256)
+def sqlite_query(query: str) -> str:
+    """Convert a query using pymysql placeholders to SQLite ones."""
+    return re.sub("%([s%])", lambda m: "?" if m.group(1) == "s" else "%", query)
+
+
+class BlacknetSQLiteCursor:
+    """SQLite cursor behaving like pymysql cursors.
+
+    Placeholders use the pymysql format and execute() returns the number of
+    rows, which are buffered unless the cursor is unbuffered (streaming).
+    """
+
+    def __init__(self, connection: sqlite3.Connection, buffered: bool = True) -> None:
+        """Create a new cursor on the provided SQLite connection."""
+        self.__cursor = connection.cursor()
+        self.__buffered = buffered
+        self.__rows = []  # type: list[Any]
+
+    @property
+    def lastrowid(self) -> int:
+        """Identifier of the last inserted row."""
+        return self.__cursor.lastrowid or 0
+
+    @property
+    def description(self) -> Any:
+        """Description of columns returned by the last query."""
+        return self.__cursor.description
+
+    @property
+    def rowcount(self) -> int:
+        """Number of rows affected by the last query."""
+        return self.__cursor.rowcount
+
+    def execute(self, query: str, args: Iterable[Any] | None = None) -> int:
+        """Execute a query, returning the number of rows (or affected rows)."""
+        if args is None:
+            self.__cursor.execute(query)
+        else:
+            self.__cursor.execute(sqlite_query(query), tuple(args))
+
+        self.__rows = []
+        if self.__cursor.description is None:
+            return self.__cursor.rowcount
+        if not self.__buffered:
+            return 0
+        self.__rows = self.__cursor.fetchall()
+        return len(self.__rows)
+
+    def executemany(self, query: str, rows: Iterable[Collection[Any]]) -> int:
+        """Execute the same query for each provided row."""
+        self.__cursor.executemany(sqlite_query(query), (tuple(row) for row in rows))
+        self.__rows = []
+        return self.__cursor.rowcount
+
+    def fetchone(self) -> Any:
+        """Fetch a single row."""
+        if not self.__buffered:
+            return self.__cursor.fetchone()
+        return self.__rows.pop(0) if self.__rows else None
+
+    def fetchmany(self, size: int) -> list[Any]:
+        """Fetch up to size rows."""
+        if not self.__buffered:
+            return self.__cursor.fetchmany(size)
+        rows, self.__rows = self.__rows[:size], self.__rows[size:]
+        return rows
+
+    def fetchall(self) -> list[Any]:
+        """Fetch all remaining rows."""
+        if not self.__buffered:
+            return self.__cursor.fetchall()
+        rows, self.__rows = self.__rows, []
+        return rows
+
+    def close(self) -> None:
+        """Close this cursor."""
+        self.__rows = []
+        # Like pymysql, closing cursors of closed connections is harmless.
+        with suppress(sqlite3.ProgrammingError):
+            self.__cursor.close()
+
+
+class BlacknetSQLiteConnection:
+    """SQLite database connection behaving like pymysql connections.
+
+    Databases use write-ahead logging so that readers never block writers,
+    MySQL functions in use by blacknet queries are provided as user functions
+    and the schema is created on new databases.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open (and initialize if needed) the SQLite database at path."""
+        # Connections are guarded by the database lock, not by their thread.
+        connection = sqlite3.connect(
+            path, timeout=BLACKNET_SQLITE_TIMEOUT, check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL;")
+        connection.execute("PRAGMA synchronous=NORMAL;")
+
+        connection.create_function("FROM_UNIXTIME", 1, sqlite_from_unixtime)
+        connection.create_function("UNIX_TIMESTAMP", 1, sqlite_unix_timestamp)
+        connection.create_function("NOW", 0, sqlite_now)
+        connection.create_function("WEEKDAY", 1, sqlite_weekday)
+        connection.create_function("HOUR", 1, sqlite_hour)
+        self.__connection = connection
+
+        query = "SELECT COUNT(*) FROM sqlite_master WHERE name = 'schema_version';"
+        if not connection.execute(query).fetchone()[0]:
+            with open(BLACKNET_SQLITE_SCHEMA) as f:
+                connection.executescript(f.read())
+
+    def cursor(self, cursorclass: Any = None) -> BlacknetSQLiteCursor:
+        """Get a new cursor, unbuffered when any cursor class is requested."""
+        return BlacknetSQLiteCursor(self.__connection, cursorclass is None)
+
+    def escape_string(self, value: str) -> str:
+        """Escape a string to be used within single quotes."""
+        return value.replace("'", "''")
+
+    def commit(self) -> None:
+        """Commit the current transaction."""
+        self.__connection.commit()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.__connection.close()
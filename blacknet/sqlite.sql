@@ -0,0 +1,222 @@
+--
+-- Blacknet SQLite database schema (see blacknet-install.sql for MySQL).
+--
+-- Applied automatically to new databases, dates are stored as local time
+-- strings ('YYYY-MM-DD HH:MM:SS') as produced by FROM_UNIXTIME().
+--
+BEGIN IMMEDIATE;
+
+
+CREATE TABLE IF NOT EXISTS `locations` (
+  `locId` INTEGER PRIMARY KEY,
+  `country` TEXT NOT NULL,
+  `region` TEXT DEFAULT NULL,
+  `city` TEXT DEFAULT NULL,
+  `postalCode` TEXT DEFAULT NULL,
+  `latitude` REAL NOT NULL,
+  `longitude` REAL NOT NULL,
+  `metroCode` INTEGER DEFAULT NULL,
+  `areaCode` INTEGER DEFAULT NULL
+);
+CREATE INDEX IF NOT EXISTS `locations_country` ON `locations` (`country`);
+
+
+CREATE TABLE IF NOT EXISTS `blocks` (
+  `startIpNum` INTEGER NOT NULL,
+  `endIpNum` INTEGER NOT NULL,
+  `locId` INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS `blocks_startIpNum` ON `blocks` (`startIpNum`);
+CREATE INDEX IF NOT EXISTS `blocks_endIpNum` ON `blocks` (`endIpNum`);
+
+
+CREATE TABLE IF NOT EXISTS `countries` (
+  `code` TEXT PRIMARY KEY,
+  `country` TEXT NOT NULL
+);
+
+INSERT OR IGNORE INTO `countries` VALUES ('BD','Bangladesh'),('BE','Belgium'),('BF','Burkina Faso'),('BG','Bulgaria'),('BA','Bosnia and Herzegovina'),('BB','Barbados'),('WF','Wallis and Futuna'),('BL','Saint Barthélemy'),('BM','Bermuda'),('BN','Brunei Darussalam'),('BO','Bolivia'),('BH','Bahrain'),('BI','Burundi'),('BJ','Benin'),('BT','Bhutan'),('JM','Jamaica'),('BV','Bouvet Island'),('BW','Botswana'),('WS','Samoa'),('BQ','Caribbean Netherlands '),('BR','Brazil'),('BS','Bahamas'),('JE','Jersey'),('BY','Belarus'),('O1','Other Country'),('LV','Latvia'),('RW','Rwanda'),('RS','Serbia'),('TL','Timor-Leste'),('RE','Reunion'),('LU','Luxembourg'),('TJ','Tajikistan'),('RO','Romania'),('PG','Papua New Guinea'),('GW','Guinea-Bissau'),('GU','Guam'),('GT','Guatemala'),('GS','South Georgia and the South Sandwich Islands'),('GR','Greece'),('GQ','Equatorial Guinea'),('GP','Guadeloupe'),('JP','Japan'),('GY','Guyana'),('GG','Guernsey'),('GF','French Guiana'),('GE','Georgia'),('GD','Grenada'),('GB','United Kingdom'),('GA','Gabon'),('SV','El Salvador'),('GN','Guinea'),('GM','Gambia'),('GL','Greenland'),('GI','Gibraltar'),('GH','Ghana'),('OM','Oman'),('TN','Tunisia'),('JO','Jordan'),('HR','Croatia'),('HT','Haiti'),('HU','Hungary'),('HK','Hong Kong'),('HN','Honduras'),('HM','Heard Island and McDonald Islands'),('VE','Venezuela'),('PR','Puerto Rico'),('PS','Palestinian Territory'),('PW','Palau'),('PT','Portugal'),('SJ','Svalbard and Jan Mayen'),('PY','Paraguay'),('IQ','Iraq'),('PA','Panama'),('PF','French Polynesia'),('BZ','Belize'),('PE','Peru'),('PK','Pakistan'),('PH','Philippines'),('PN','Pitcairn'),('TM','Turkmenistan'),('PL','Poland'),('PM','Saint Pierre and Miquelon'),('ZM','Zambia'),('EH','Western Sahara'),('RU','Russian Federation'),('EE','Estonia'),('EG','Egypt'),('TK','Tokelau'),('ZA','South Africa'),('EC','Ecuador'),('IT','Italy'),('VN','Vietnam'),('SB','Solomon Islands'),('EU','Europe'),('ET','Ethiopia'),('SO','Somalia'),('ZW','Zimbabwe'),('SA','Saudi Arabia'),('ES','Spain'),('ER','Eritrea'),('ME','Montenegro'),('MD','Moldova, Republic of'),('MG','Madagascar'),('MF','Saint-Martin (France)'),('MA','Morocco'),('MC','Monaco'),('UZ','Uzbekistan'),('MM','Myanmar'),('ML','Mali'),('MO','Macao'),('MN','Mongolia'),('MH','Marshall Islands'),('MK','Macedonia'),('MU','Mauritius'),('MT','Malta'),('MW','Malawi'),('MV','Maldives'),('MQ','Martinique'),('MP','Northern Mariana Islands'),('MS','Montserrat'),('MR','Mauritania'),('IM','Isle of Man'),('UG','Uganda'),('TZ','Tanzania, United Republic of'),('MY','Malaysia'),('MX','Mexico'),('IL','Israel'),('FR','France'),('IO','British Indian Ocean Territory'),('SH','Saint Helena'),('FI','Finland'),('FJ','Fiji'),('FK','Falkland Islands (Malvinas)'),('FM','Micronesia, Federated States of'),('FO','Faroe Islands'),('NI','Nicaragua'),('NL','Netherlands'),('NO','Norway'),('NA','Namibia'),('VU','Vanuatu'),('NC','New Caledonia'),('NE','Niger'),('NF','Norfolk Island'),('NG','Nigeria'),('NZ','New Zealand'),('NP','Nepal'),('NR','Nauru'),('NU','Niue'),('CK','Cook Islands'),('CI','Cote d''Ivoire'),('CH','Switzerland'),('CO','Colombia'),('CN','China'),('CM','Cameroon'),('CL','Chile'),('CC','Cocos (Keeling) Islands'),('CA','Canada'),('CG','Congo'),('CF','Central African Republic'),('CD','Congo, The Democratic Republic of the'),('CZ','Czech Republic'),('CY','Cyprus'),('CX','Christmas Island'),('CR','Costa Rica'),('CW','Curaçao'),('CV','Cape Verde'),('CU','Cuba'),('SZ','Swaziland'),('SY','Syrian Arab Republic'),('SX','Sint Maarten (Dutch part)'),('KG','Kyrgyzstan'),('KE','Kenya'),('SS','South Sudan'),('SR','Suriname'),('KI','Kiribati'),('KH','Cambodia'),('KN','Saint Kitts and Nevis'),('KM','Comoros'),('ST','Sao Tome and Principe'),('SK','Slovakia'),('KR','Korea, Republic of'),('SI','Slovenia'),('KP','Korea, Democratic People''s Republic of'),('KW','Kuwait'),('SN','Senegal'),('SM','San Marino'),('SL','Sierra Leone'),('SC','Seychelles'),('KZ','Kazakhstan'),('KY','Cayman Islands'),('SG','Singapore'),('SE','Sweden'),('SD','Sudan'),('DO','Dominican Republic'),('DM','Dominica'),('DJ','Djibouti'),('DK','Denmark'),('VG','Virgin Islands, British'),('DE','Germany'),('YE','Yemen'),('DZ','Algeria'),('US','United States'),('UY','Uruguay'),('YT','Mayotte'),('UM','United States Minor Outlying Islands'),('LB','Lebanon'),('LC','Saint Lucia'),('LA','Lao People''s Democratic Republic'),('TV','Tuvalu'),('TW','Taiwan'),('TT','Trinidad and Tobago'),('TR','Turkey'),('LK','Sri Lanka'),('LI','Liechtenstein'),('A1','Anonymous Proxy'),('TO','Tonga'),('LT','Lithuania'),('A2','Satellite Provider'),('LR','Liberia'),('LS','Lesotho'),('TH','Thailand'),('TF','French Southern Territories'),('TG','Togo'),('TD','Chad'),('TC','Turks and Caicos Islands'),('LY','Libyan Arab Jamahiriya'),('VA','Holy See (Vatican City State)'),('VC','Saint Vincent and the Grenadines'),('AE','United Arab Emirates'),('AD','Andorra'),('AG','Antigua and Barbuda'),('AF','Afghanistan'),('AI','Anguilla'),('VI','Virgin Islands, U.S.'),('IS','Iceland'),('IR','Iran, Islamic Republic of'),('AM','Armenia'),('AL','Albania'),('AO','Angola'),('AN','Netherlands Antilles'),('AQ','Antarctica'),('AP','Asia/Pacific Region'),('AS','American Samoa'),('AR','Argentina'),('AU','Australia'),('AT','Austria'),('AW','Aruba'),('IN','India'),('AX','Aland Islands'),('AZ','Azerbaijan'),('IE','Ireland'),('ID','Indonesia'),('UA','Ukraine'),('QA','Qatar'),('MZ','Mozambique');
+
+
+CREATE TABLE IF NOT EXISTS `attackers` (
+  `id` INTEGER PRIMARY KEY,
+  `ip` TEXT NOT NULL,
+  `first_seen` DATETIME,
+  `last_seen` DATETIME,
+  `dns` TEXT NOT NULL,
+  `notes` TEXT NOT NULL DEFAULT '',
+  `locId` INTEGER NOT NULL,
+  `n_attempts` INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS `attackers_last_seen` ON `attackers` (`last_seen`);
+
+
+-- Strings of attempts, stored once.
+CREATE TABLE IF NOT EXISTS `users` (
+  `id` INTEGER PRIMARY KEY,
+  `value` TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS `passwords` (
+  `id` INTEGER PRIMARY KEY,
+  `value` TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS `clients` (
+  `id` INTEGER PRIMARY KEY,
+  `value` TEXT NOT NULL UNIQUE
+);
+
+
+CREATE TABLE IF NOT EXISTS `attempts` (
+  `id` INTEGER PRIMARY KEY,
+  `attacker_id` INTEGER NOT NULL,
+  `session_id` INTEGER NOT NULL,
+  `user_id` INTEGER NOT NULL,
+  `password_id` INTEGER,
+  `target` TEXT NOT NULL,
+  `date` DATETIME NOT NULL,
+  `client_id` INTEGER NOT NULL,
+  `success` BOOLEAN DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS `attempts_session_id` ON `attempts` (`session_id`);
+CREATE INDEX IF NOT EXISTS `attempts_attacker_id` ON `attempts` (`attacker_id`);
+CREATE INDEX IF NOT EXISTS `attempts_date` ON `attempts` (`date`);
+CREATE INDEX IF NOT EXISTS `attempts_target_date` ON `attempts` (`target`, `date`);
+CREATE INDEX IF NOT EXISTS `attempts_user_password` ON `attempts` (`user_id`, `password_id`);
+CREATE INDEX IF NOT EXISTS `attempts_password` ON `attempts` (`password_id`);
+
+
+CREATE TABLE IF NOT EXISTS `pubkeys` (
+  `id` INTEGER PRIMARY KEY,
+  `name` TEXT NOT NULL,
+  `fingerprint` TEXT NOT NULL UNIQUE,
+  `data` TEXT NOT NULL,
+  `bits` INTEGER NOT NULL
+);
+
+
+CREATE TABLE IF NOT EXISTS `attempts_pubkeys` (
+  `attempt_id` INTEGER PRIMARY KEY,
+  `pubkey_id` INTEGER NOT NULL
+);
+
+
+CREATE TABLE IF NOT EXISTS `sessions` (
+  `id` INTEGER PRIMARY KEY,
+  `attacker_id` INTEGER NOT NULL,
+  `first_attempt` DATETIME,
+  `last_attempt` DATETIME,
+  `target` TEXT NOT NULL,
+  `n_attempts` INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS `sessions_attacker_target`
+  ON `sessions` (`attacker_id`, `target`, `last_attempt`);
+CREATE INDEX IF NOT EXISTS `sessions_last_attempt` ON `sessions` (`last_attempt`);
+CREATE INDEX IF NOT EXISTS `sessions_target_attacker` ON `sessions` (`target`, `attacker_id`);
+CREATE INDEX IF NOT EXISTS `sessions_target_last_attempt`
+  ON `sessions` (`target`, `last_attempt`);
+
+
+-- Counters of attempts moved to archive files (no password is 0).
+CREATE TABLE IF NOT EXISTS `archived_sessions` (
+  `session_id` INTEGER PRIMARY KEY,
+  `attacker_id` INTEGER NOT NULL,
+  `first_attempt` DATETIME,
+  `last_attempt` DATETIME,
+  `n_attempts` INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS `archived_sessions_attacker_id` ON `archived_sessions` (`attacker_id`);
+CREATE TABLE IF NOT EXISTS `archived_credentials` (
+  `user_id` INTEGER NOT NULL,
+  `password_id` INTEGER NOT NULL,
+  `n_attempts` INTEGER DEFAULT 0,
+  PRIMARY KEY (`user_id`, `password_id`)
+);
+CREATE INDEX IF NOT EXISTS `archived_credentials_password_id`
+  ON `archived_credentials` (`password_id`);
+
+
+-- Counters of attempts aggregated by sensors, without their own row (no password is 0).
+CREATE TABLE IF NOT EXISTS `aggregated_attempts` (
+  `session_id` INTEGER NOT NULL,
+  `attacker_id` INTEGER NOT NULL,
+  `user_id` INTEGER NOT NULL,
+  `password_id` INTEGER NOT NULL,
+  `n_attempts` INTEGER DEFAULT 0,
+  PRIMARY KEY (`session_id`, `user_id`, `password_id`)
+);
+CREATE INDEX IF NOT EXISTS `aggregated_attempts_attacker_id`
+  ON `aggregated_attempts` (`attacker_id`);
+
+
+-- State of the files geolocation tables were imported from (blacknet-updater).
+CREATE TABLE IF NOT EXISTS `geolocation_sources` (
+  `url` TEXT PRIMARY KEY,
+  `etag` TEXT DEFAULT NULL,
+  `last_modified` TEXT DEFAULT NULL,
+  `checksum` TEXT NOT NULL,
+  `imported` DATETIME NOT NULL
+);
+
+
+-- Client versions from connections closed before any key exchange.
+CREATE TABLE IF NOT EXISTS `banners` (
+  `id` INTEGER PRIMARY KEY,
+  `attacker_id` INTEGER NOT NULL,
+  `target` TEXT NOT NULL,
+  `date` DATETIME,
+  `client` TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS `banners_attacker_id` ON `banners` (`attacker_id`);
+CREATE INDEX IF NOT EXISTS `banners_date` ON `banners` (`date`);
+
+
+CREATE TABLE IF NOT EXISTS `events` (
+  `id` INTEGER PRIMARY KEY,
+  `date` DATETIME,
+  `target` TEXT NOT NULL,
+  `type` TEXT NOT NULL,
+  `content` TEXT NOT NULL DEFAULT ''
+);
+
+
+CREATE TABLE IF NOT EXISTS `commands` (
+  `id` INTEGER PRIMARY KEY,
+  `attacker_id` INTEGER NOT NULL,
+  `date` DATETIME,
+  `target` TEXT NOT NULL,
+  `login` TEXT NOT NULL,
+  `command` TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS `commands_attacker_id` ON `commands` (`attacker_id`);
+
+
+-- Trigger `add_attempt` for redundancy (and performances)
+CREATE TRIGGER IF NOT EXISTS `add_attempt`
+AFTER INSERT ON `attempts`
+FOR EACH ROW
+BEGIN
+  UPDATE attackers SET n_attempts = n_attempts + 1 WHERE id = NEW.attacker_id;
+  UPDATE sessions  SET n_attempts = n_attempts + 1 WHERE id = NEW.session_id;
+END;
+
+
+CREATE TRIGGER IF NOT EXISTS `rm_attempt`
+AFTER DELETE ON `attempts`
+FOR EACH ROW
+BEGIN
+  UPDATE attackers SET n_attempts = n_attempts - 1 WHERE id = OLD.attacker_id;
+  UPDATE sessions  SET n_attempts = n_attempts - 1 WHERE id = OLD.session_id;
+END;
+
+
+-- Created last, its presence tells that the schema is complete.
+-- Versions match the ones of blacknet-migrate for MySQL databases.
+CREATE TABLE IF NOT EXISTS `schema_version` (
+  `version` INTEGER PRIMARY KEY,
+  `description` TEXT NOT NULL,
+  `applied` DATETIME NOT NULL
+);
+INSERT OR IGNORE INTO `schema_version` VALUES (9, 'Initial SQLite schema', NOW());
+
+
+COMMIT;
@@ -1,29 +1,74 @@
 from __future__ import annotations
 
-import codecs
 import csv
+import hashlib
+import io
+import math
 import os
 import shutil
 import sys
 import tempfile
+import time
 import zipfile
-from codecs import StreamReaderWriter
-from collections.abc import Iterator
-from urllib.request import urlopen
-
+from collections.abc import Iterable, Iterator, Sequence
+from http import HTTPStatus
+from itertools import islice
+from typing import Any, Callable, Optional
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from .common import (
+    BLACKNET_BULK_INSERT_BATCH,
+    BLACKNET_DOWNLOAD_CHUNK,
+    BLACKNET_GEO_DIFF_RATIO,
+    BLACKNET_GEO_FLOAT_TOLERANCE,
+    BLACKNET_GEO_MIN_RATIO,
+)
 from .config import BlacknetConfig, BlacknetConfigurationInterface
-from .database import BlacknetDatabase
+from .database import blacknet_database
 
 GEOLITE_CSV_URL = "https://geolite.maxmind.com/download/geoip/database/GeoLiteCity_CSV/GeoLiteCity-latest.zip"
-
-
-def utf8_ensure(csv_file: StreamReaderWriter) -> Iterator[str]:
-    """Ensure these lines are UTF-8."""
-    for line in csv_file:
-        # Those lines are 'unicode' in python2
-        if not isinstance(line, str):
-            line = line.strip().encode("utf-8")
-        yield line
+# Geolocation tables and their secondary indexes, as (name, columns).
+BLACKNET_GEO_INDEXES = {
+    "blocks": [("startIpNum", "`startIpNum`"), ("endIpNum", "`endIpNum`")],
+    "locations": [("country", "`country`")],
+}
+
+# State of the last import, as (etag, last_modified, checksum).
+GeoSource = Optional[tuple[Optional[str], Optional[str], str]]
+# Changes of a geolocation table, as (inserted rows, deleted identifiers, changed rows).
+GeoDiff = tuple[list[list[Any]], list[int], list[list[Any]]]
+
+
+def blacknet_ascending(rows: Iterable[Sequence[Any]]) -> Iterator[Sequence[Any]]:
+    """Iterate over rows, checking that identifiers (first column) are strictly ascending."""
+    previous = None
+    for row in rows:
+        if previous is not None and row[0] <= previous:
+            raise ValueError(f"identifiers are not sorted ({row[0]} after {previous})")
+        previous = row[0]
+        yield row
+
+
+def blacknet_sorted_merge(
+    current: Iterable[Sequence[Any]], rows: Iterable[Sequence[Any]]
+) -> Iterator[tuple[Sequence[Any] | None, Sequence[Any] | None]]:
+    """Pair rows of both sorted iterables by identifier (None when only on one side)."""
+    current_iter = blacknet_ascending(current)
+    rows_iter = blacknet_ascending(rows)
+    old = next(current_iter, None)
+    new = next(rows_iter, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield (old, None)
+            old = next(current_iter, None)
+        elif old is None or new[0] < old[0]:
+            yield (None, new)
+            new = next(rows_iter, None)
+        else:
+            yield (old, new)
+            old = next(current_iter, None)
+            new = next(rows_iter, None)
 
 
 class BlacknetGeoUpdater(BlacknetConfigurationInterface):
@@ -32,24 +77,23 @@ class BlacknetGeoUpdater(BlacknetConfigurationInterface):
     def __init__(self, cfg_file: str | None = None):
         """Load configuration file and database parameters."""
         self.__dirname = None  # type: str | None
-        self.__filepath = {}  # type: dict[str, str]
+        self.__members = {}  # type: dict[str, str]
         self.__test_mode = None  # type: bool | None
+        self.__geolite_url = None  # type: str | None
+        self.__etag = None  # type: str | None
+        self.__last_modified = None  # type: str | None
+        self.__checksum = ""
 
         config = BlacknetConfig()
         config.load(cfg_file)
-        self.__database = BlacknetDatabase(config)
+        self.__database = blacknet_database(config)
         BlacknetConfigurationInterface.__init__(self, config, "server")
 
     def __del__(self) -> None:
         """Remove temporary directories upon deletion."""
-        if not self.test_mode:  # pragma: no cover
-            dirname = self.__dirname
-        else:
-            # That's the ZipDir (extracted)
-            dirname = os.path.join(self.dirname, "geolitecity")
-
-        if dirname:
-            shutil.rmtree(dirname)
+        # Downloads of the test mode are kept along with other generated files.
+        if not self.test_mode and self.__dirname:  # pragma: no cover
+            shutil.rmtree(self.__dirname)
         self.__dirname = None
 
     @property
@@ -67,104 +111,303 @@ class BlacknetGeoUpdater(BlacknetConfigurationInterface):
         """Current directory name (temporary)."""
         if self.__dirname is None:
             if self.test_mode:
-                self.__dirname = os.path.join("tests", "geo-updater")
+                self.__dirname = os.path.join("tests", "generated")
             else:
                 self.__dirname = tempfile.mkdtemp()
         return self.__dirname
 
+    @property
+    def geolite_url(self) -> str:
+        """URL of the GeoLite City CSV database (zip file)."""
+        if self.__geolite_url is None:
+            if self.has_config("geolite_url"):
+                self.__geolite_url = self.get_config("geolite_url")
+            else:
+                self.__geolite_url = GEOLITE_CSV_URL
+        return self.__geolite_url
+
     def log(self, message: str) -> None:
         """Write something stdout."""
         sys.stdout.write("%s\n" % message)
 
-    def fetch_zip(self) -> None:
-        """Fetch the zip file on the internets."""
-        if not self.test_mode:
-            zip_file = os.path.join(self.dirname, "geolitecity.zip")
-            zipf = open(zip_file, "wb")  # noqa: SIM115
-            res = urlopen(GEOLITE_CSV_URL)  # noqa: S310
-
-            content = res.read()
-            zipf.write(content)
-            zipf.close()
-
+    @property
+    def zip_file(self) -> str:
+        """Path to the downloaded zip file."""
+        return os.path.join(self.dirname, "geolitecity.zip")
+
+    def fetch_zip(self, source: GeoSource = None) -> bool:
+        """Fetch the zip file on the internets, unless not modified since source.
+
+        The file is written to disk by chunks, its checksum computed meanwhile.
+        """
+        request = Request(self.geolite_url)  # noqa: S310
+        if source is not None:
+            etag, last_modified, _ = source
+            if etag:
+                request.add_header("If-None-Match", etag)
+            if last_modified:
+                request.add_header("If-Modified-Since", last_modified)
+
+        digest = hashlib.sha256()
+        try:
+            with urlopen(request) as res, open(self.zip_file, "wb") as zipf:  # noqa: S310
+                chunk = res.read(BLACKNET_DOWNLOAD_CHUNK)
+                while chunk:
+                    digest.update(chunk)
+                    zipf.write(chunk)
+                    chunk = res.read(BLACKNET_DOWNLOAD_CHUNK)
+                self.__etag = res.headers.get("ETag")
+                self.__last_modified = res.headers.get("Last-Modified")
+        except HTTPError as e:
+            if e.code != HTTPStatus.NOT_MODIFIED:
+                raise
+            self.log("[+] Zipfile was not modified since the last import")
+            return False
+
+        self.__checksum = digest.hexdigest()
         self.log("[+] Fetched zipfile successfully")
-
-    def extract_zip(self) -> None:
-        """Extract the downloaded zip file."""
-        zip_dir = os.path.join(self.dirname, "geolitecity")
-        if not os.path.exists(zip_dir):
-            os.mkdir(zip_dir)
-
-        zip_file = os.path.join(self.dirname, "geolitecity.zip")
-        zip_ref = zipfile.ZipFile(zip_file, "r")
-        for item in zip_ref.namelist():
-            filepath = zip_ref.extract(item, zip_dir)
-            filename = os.path.basename(filepath)
-            if filename == "GeoLiteCity-Blocks.csv":
-                self.__filepath["blocks"] = filepath
-            elif filename == "GeoLiteCity-Location.csv":
-                self.__filepath["locations"] = filepath
-            # Unknown file?
-
-            self.log("[+] Extracted file %s" % item)
-        zip_ref.close()
-
-    def csv_blocks_import(self) -> None:
-        """Import the new block table."""
-        block_file = self.__filepath["blocks"]
-        block_f = codecs.open(block_file, "r", "latin1")
-
+        return True
+
+    def scan_zip(self) -> None:
+        """Find CSV files within the downloaded zip file (nothing is extracted)."""
+        with zipfile.ZipFile(self.zip_file, "r") as zip_ref:
+            for item in zip_ref.namelist():
+                filename = os.path.basename(item)
+                if filename == "GeoLiteCity-Blocks.csv":
+                    self.__members["blocks"] = item
+                elif filename == "GeoLiteCity-Location.csv":
+                    self.__members["locations"] = item
+                else:
+                    continue
+                self.log("[+] Found file %s" % item)
+
+    def __csv_rows(self, name: str) -> Iterator[list[str]]:
+        """Iterate over rows of a zipped CSV file (after copyright and header).
+
+        Rows are decompressed and decoded on the fly, as they are consumed.
+        """
+        zip_ref = zipfile.ZipFile(self.zip_file, "r")
+        with zip_ref, zip_ref.open(self.__members[name]) as member:
+            csv_file = io.TextIOWrapper(member, encoding="latin1", newline="")
+            yield from islice(csv.reader(csv_file), 2, None)
+
+    def __blocks_rows(self) -> Iterator[list[Any]]:
+        """Iterate over blocks of the CSV file, as stored in the database."""
+        for row in self.__csv_rows("blocks"):
+            yield [int(value) for value in row]
+
+    def __locations_rows(self) -> Iterator[list[Any]]:
+        """Iterate over locations of the CSV file, as stored in the database."""
+        for row in self.__csv_rows("locations"):
+            loc_id, country, region, city, postal_code, lat, lon, metro, area = row
+            yield [
+                int(loc_id),
+                country,
+                region,
+                city,
+                postal_code,
+                float(lat),
+                float(lon),
+                int(metro) if metro else None,
+                int(area) if area else None,
+            ]
+
+    @staticmethod
+    def __same_block(old: Sequence[Any], new: Sequence[Any]) -> bool:
+        return list(old) == list(new)
+
+    @staticmethod
+    def __same_location(old: Sequence[Any], new: Sequence[Any]) -> bool:
+        if list(old[:5]) != list(new[:5]) or list(old[7:]) != list(new[7:]):
+            return False
+        return all(
+            math.isclose(a, b, rel_tol=BLACKNET_GEO_FLOAT_TOLERANCE)
+            for a, b in zip(old[5:7], new[5:7])
+        )
+
+    def __bulk_import(
+        self,
+        table: str,
+        rows: Iterator[list[str]],
+        insert: Callable[[list[list[str]], str], None],
+    ) -> bool:
+        """Load rows into a staging copy of a table by large batches, then check it."""
         cursor = self.__database.cursor()
-        cursor.truncate("blocks")
-
-        self.log("[+] Trimmed blocks table")
-
-        line_count = 0
-        csv_data = csv.reader(utf8_ensure(block_f))
-        for row in csv_data:
-            line_count += 1
-            if line_count < 3:
-                continue
-            cursor.insert_block(row)
-        block_f.close()
-
-        self.log("[+] Updated blocks table (%u entries)" % (line_count - 2))
-
-    def csv_locations_import(self) -> None:
-        """Import the new location table."""
-        block_file = self.__filepath["locations"]
-        block_f = codecs.open(block_file, "r", "latin1")
-
+        # Indexes are built once from all rows, instead of being updated by each row.
+        shadow = cursor.shadow_create(table, BLACKNET_GEO_INDEXES[table])
+        self.log("[+] Created staging table %s" % shadow)
+
+        time_start = time.time()
+        count = 0
+        batch = list(islice(rows, BLACKNET_BULK_INSERT_BATCH))
+        while batch:
+            insert(batch, shadow)
+            count += len(batch)
+            batch = list(islice(rows, BLACKNET_BULK_INSERT_BATCH))
+        self.__database.commit()
+
+        time_diff = max(time.time() - time_start, 0.001)
+        self.log(
+            "[+] Loaded %s table (%u entries, %.1fs, %u rows/s)"
+            % (shadow, count, time_diff, count / time_diff)
+        )
+        return self.__validate(table, shadow, count)
+
+    def __validate(self, table: str, shadow: str, count: int) -> bool:
+        """Check that a staging table holds all read rows and is not much smaller."""
         cursor = self.__database.cursor()
-        cursor.truncate("locations")
-
-        self.log("[+] Trimmed locations table")
-
-        line_count = 0
-        csv_data = csv.reader(utf8_ensure(block_f))
-        for row in csv_data:
-            line_count += 1
-            if line_count < 3:
-                continue
-            cursor.insert_location(row)
-        block_f.close()
-
-        self.log("[+] Updated locations table (%u entries)" % (line_count - 2))
+        loaded = cursor.count_rows(shadow)
+        current = cursor.count_rows(table)
+        if not loaded or loaded != count:
+            self.log(f"[-] Table {shadow} holds {loaded} entries out of {count}")
+            return False
+        if loaded < current * BLACKNET_GEO_MIN_RATIO:
+            self.log(f"[-] Table {shadow} is too small ({loaded} entries, {current} now)")
+            return False
+        return True
+
+    def csv_blocks_import(self) -> bool:
+        """Import the new block table (to its staging table)."""
+        cursor = self.__database.cursor()
+        return self.__bulk_import("blocks", self.__csv_rows("blocks"), cursor.insert_blocks)
 
-    def csv_to_database(self) -> None:
-        """Import CSV files to the database."""
-        self.csv_blocks_import()
-        self.csv_locations_import()
+    def csv_locations_import(self) -> bool:
+        """Import the new location table (to its staging table)."""
+        cursor = self.__database.cursor()
+        rows = self.__csv_rows("locations")
+        return self.__bulk_import("locations", rows, cursor.insert_locations)
+
+    def __diff(
+        self,
+        table: str,
+        current: Iterable[Sequence[Any]],
+        rows: Iterable[Sequence[Any]],
+        same: Callable[[Sequence[Any], Sequence[Any]], bool],
+    ) -> GeoDiff | None:
+        """Compute changes from current rows to new ones (None when there are too many)."""
+        limit = self.__database.cursor().count_rows(table) * BLACKNET_GEO_DIFF_RATIO
+        inserts, deletes, updates = [], [], []  # type: GeoDiff
+        changes = 0
+        time_start = time.time()
+        try:
+            for old, new in blacknet_sorted_merge(current, rows):
+                if old is not None and new is not None and same(old, new):
+                    continue
+                # Keep reading all rows (and streams) but stop holding changes.
+                changes += 1
+                if changes > limit:
+                    continue
+                if old is None:
+                    inserts.append(list(new or []))
+                elif new is None:
+                    deletes.append(old[0])
+                else:
+                    updates.append(list(new))
+        except ValueError as e:
+            self.log(f"[-] Cannot compare {table} table: {e}")
+            return None
+
+        time_diff = time.time() - time_start
+        if changes > limit:
+            self.log(f"[-] Too many changes in {table} table ({changes} rows)")
+            return None
+        self.log(
+            "[+] Found changes in %s table (%u inserted, %u deleted, %u changed, %.1fs)"
+            % (table, len(inserts), len(deletes), len(updates), time_diff)
+        )
+        return (inserts, deletes, updates)
+
+    def csv_diff_to_database(self) -> bool:
+        """Apply changes between CSV files and current tables, by a single transaction.
+
+        CSV files and tables are read sorted by identifier and merged, so that
+        only inserted, deleted and changed rows are written. Nothing is written
+        when CSV files are not sorted or when too many rows changed.
+        """
+        cursor = self.__database.cursor()
+        blocks = self.__diff(
+            "blocks", cursor.blocks_sorted(), self.__blocks_rows(), self.__same_block
+        )
+        if blocks is None:
+            return False
+        locations = self.__diff(
+            "locations",
+            cursor.locations_sorted(),
+            self.__locations_rows(),
+            self.__same_location,
+        )
+        if locations is None:
+            return False
+
+        inserts, deletes, updates = blocks
+        cursor.delete_blocks(deletes)
+        cursor.update_blocks(updates)
+        cursor.insert_blocks(inserts)
+        inserts, deletes, updates = locations
+        cursor.delete_locations(deletes)
+        cursor.update_locations(updates)
+        cursor.insert_locations(inserts)
+        self.log("[+] Applied changes to geolocation tables")
+        return True
+
+    def csv_to_database(self) -> bool:
+        """Import CSV files to the database, swapping all tables once loaded."""
+        valid = self.csv_blocks_import()
+        valid = self.csv_locations_import() and valid
+        if not valid:
+            self.log("[-] Kept current geolocation tables")
+            return False
 
-    def update(self) -> None:
-        """Perform the whole update process."""
-        self.fetch_zip()
-        self.extract_zip()
-        self.csv_to_database()
+        cursor = self.__database.cursor()
+        cursor.shadow_swap(BLACKNET_GEO_INDEXES)
+        self.__database.commit()
+        self.log("[+] Swapped in new geolocation tables (previous ones are kept as _old)")
+        return True
 
+    def rollback(self) -> bool:
+        """Restore the previous generation of geolocation tables."""
+        cursor = self.__database.cursor()
+        for table in BLACKNET_GEO_INDEXES:
+            if not cursor.table_exists(f"{table}_old"):
+                self.log(f"[-] No previous generation of table {table}")
+                return False
+
+        cursor.shadow_rollback(BLACKNET_GEO_INDEXES)
+        # Tables do not match the last imported file anymore, next import is a full one.
+        cursor.clear_geolocation_sources()
+        self.__database.commit()
+        self.log("[+] Restored previous geolocation tables")
+        return True
+
+    def update(self, full: bool = False) -> bool:
+        """Perform the whole update process, unless nothing changed since the last import.
+
+        Only changes are applied to current tables when possible, unless a
+        full import is requested (which is also done on first import).
+        """
+        cursor = self.__database.cursor()
+        source = None if full else cursor.geolocation_source(self.geolite_url)
+        if not self.fetch_zip(source):
+            return True
+        if source is not None and source[2] == self.__checksum:
+            self.log("[+] Zipfile is identical to the last imported one")
+            return True
+
+        self.scan_zip()
+        # Tables are replaced as a whole when changes cannot be applied.
+        imported = source is not None and self.csv_diff_to_database()
+        if not imported and not self.csv_to_database():
+            self.log("[-] Update Failed")
+            return False
+
+        cursor.update_geolocation_source(
+            self.geolite_url, self.__etag, self.__last_modified, self.__checksum
+        )
+        self.__database.commit()
         self.log("[+] Update Complete")
         if not self.test_mode:  # pragma: no cover
             self.log(
                 "[!] We *STRONGLY* suggest running "
                 '"blacknet-scrubber --full-check --fix" to update gelocation positions.'
             )
+        return True
@@ -1,32 +1,52 @@
 #!/usr/bin/env python
 
+import glob
 import json
 import logging
 import os
 import socket
 import sys
+import time
+import zipfile
 from contextlib import suppress
-from threading import Thread
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from typing import Any
 
 import paramiko
 
 import blacknet.console  # noqa: F401
+from blacknet.archive import BlacknetArchiver, blacknet_archive_read
+from blacknet.config import BlacknetConfig
+from blacknet.database import blacknet_database
 from blacknet.master import BlacknetMasterServer
+from blacknet.migration import BlacknetMigrator
 from blacknet.scrubber import BlacknetScrubber
 from blacknet.sensor import BlacknetSensor
 from blacknet.server import BlacknetServer  # noqa: F401
 from blacknet.updater import BlacknetGeoUpdater
 
 SCRUBBER_STATS_FILE = "tests/generated/stats_general.json"
+SCRUBBER_COUNTRIES_FILE = "tests/generated/stats_countries.json"
+ARCHIVE_FILES = "tests/generated/attempts-*.bna"
 HONEYPOT_CONFIG_FILE = "tests/blacknet-honeypot.cfg"
 MASTER_CONFIG_FILE = "tests/blacknet.cfg"
+SQLITE_CONFIG_FILE = "tests/blacknet-sqlite.cfg"
+SQLITE_DATABASE_FILE = "tests/generated/blacknet.db"
 CLIENT_SSH_KEY = "tests/ssh_key"
+GEOLITE_SAMPLE_FILE = "tests/geo-updater/geolitecity.zip"
+GEOLITE_SERVED_FILE = "tests/generated/GeoLiteCity-latest.zip"
+GEOLITE_SERVER_ADDRESS = ("127.0.0.1", 10080)
+RUNTESTS_SERVING = Event()
 
 
 def runtests_ssh_serve(bns: BlacknetSensor) -> None:
     """Thread entry point, runs the sensor."""
     bns.do_ping()
-    bns.serve()
+    # Both the SSH client and the scanner connect to the sensor.
+    while RUNTESTS_SERVING.is_set():
+        bns.serve()
 
 
 def runtests_main_serve(bns: BlacknetMasterServer) -> None:
@@ -46,17 +66,111 @@ def runtests_ssh_client() -> None:
         ssh_key = paramiko.RSAKey(filename=CLIENT_SSH_KEY)
         t.auth_publickey("blacknet", ssh_key)
 
-    for suffix in ["0", "1", "a", "b", "c", "é", "&", "L", ")", "€", "\xfe", "\xa8"]:
+    suffixes = ["0", "0", "1", "a", "b", "c", "é", "&", "L", ")", "€", "\xfe", "\xa8", "0"]
+    # Only differs from an earlier password by a trailing space.
+    suffixes.append("0 ")
+    for suffix in suffixes:
         with suppress(Exception):
             password = "password_%s" % suffix
             t.auth_password("blacknet", password)
     t.close()
 
 
+def runtests_ssh_scanner() -> None:
+    """Simulate a scanner only grabbing the SSH banner."""
+    with socket.create_connection(("localhost", 2200)) as sock:
+        sock.recv(256)
+        sock.sendall(b"SSH-2.0-Go\r\n")
+
+
+def runtests_migrate() -> None:
+    """Check schema migrations and create monthly partitions."""
+    bnm = BlacknetMigrator(MASTER_CONFIG_FILE)
+    bnm.migrate()
+    bnm.partitions_add()
+
+
+def runtests_geo_server() -> ThreadingHTTPServer:
+    """Serve geolocation samples over HTTP (stand-in for the GeoLite server)."""
+    with zipfile.ZipFile(GEOLITE_SAMPLE_FILE) as src:
+        members = {name: src.read(name) for name in src.namelist()}
+    with zipfile.ZipFile(GEOLITE_SERVED_FILE, "w", zipfile.ZIP_DEFLATED) as dst:
+        for name, content in members.items():
+            dst.writestr(name, content)
+
+    directory = os.path.dirname(GEOLITE_SERVED_FILE)
+    handler = partial(SimpleHTTPRequestHandler, directory=directory)
+    server = ThreadingHTTPServer(GEOLITE_SERVER_ADDRESS, handler)
+    t = Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
+
+
+def runtests_geo_change() -> None:
+    """Serve a new version of geolocation samples, with a few changed rows."""
+    with zipfile.ZipFile(GEOLITE_SERVED_FILE) as src:
+        members = {name: src.read(name).decode("latin1") for name in src.namelist()}
+
+    for name, content in members.items():
+        lines = content.splitlines(keepends=True)
+        if name.endswith("Blocks.csv"):
+            # Delete a range, move another one and add a new one.
+            del lines[2]
+            start, end, _ = lines[2].split(",")
+            lines[2] = f'{start},{end},"103"\n'
+            last = int(lines[-1].split(",")[1].strip('"\n'))
+            lines.append(f'"{last + 1}","{last + 256}","94"\n')
+        elif name.endswith("Location.csv"):
+            # Sorted by identifier for incremental updates, with a renamed city.
+            rows = sorted(lines[2:], key=lambda line: int(line.split(",")[0]))
+            lines[2:] = [row.replace('"Tai Wai"', '"Tai Wai Village"') for row in rows]
+        members[name] = "".join(lines)
+
+    with zipfile.ZipFile(GEOLITE_SERVED_FILE, "w", zipfile.ZIP_DEFLATED) as dst:
+        for name, content in members.items():
+            dst.writestr(name, content.encode("latin1"))
+    # Last-Modified has a resolution of a second.
+    mtime = os.stat(GEOLITE_SERVED_FILE).st_mtime + 60
+    os.utime(GEOLITE_SERVED_FILE, (mtime, mtime))
+
+
+def runtests_geo_tables() -> list[list[Any]]:
+    """Get the content of geolocation tables."""
+    config = BlacknetConfig()
+    config.load(MASTER_CONFIG_FILE)
+    cursor = blacknet_database(config).cursor()
+    return [list(cursor.blocks_sorted()), list(cursor.locations_sorted())]
+
+
 def runtests_update() -> None:
     """Update database geolocation from local samples."""
+    server = runtests_geo_server()
     bnu = BlacknetGeoUpdater(MASTER_CONFIG_FILE)
-    bnu.update()
+    if not bnu.update():
+        sys.exit(os.EX_SOFTWARE)
+
+    # Not modified, then same checksum (only a newer date).
+    mtime = os.stat(GEOLITE_SERVED_FILE).st_mtime + 30
+    if not bnu.update():
+        sys.exit(os.EX_SOFTWARE)
+    os.utime(GEOLITE_SERVED_FILE, (mtime, mtime))
+    if not bnu.update():
+        sys.exit(os.EX_SOFTWARE)
+
+    # Incremental update must match a full import of the same file.
+    runtests_geo_change()
+    if not bnu.update():
+        sys.exit(os.EX_SOFTWARE)
+    tables = runtests_geo_tables()
+    if not bnu.update(full=True) or runtests_geo_tables() != tables:
+        print("[-] Incremental update does not match the full import")
+        sys.exit(os.EX_SOFTWARE)
+
+    # Restore the previous (identical) generation.
+    if not bnu.rollback():
+        sys.exit(os.EX_SOFTWARE)
+    server.shutdown()
 
 
 def runtests_scrubber() -> None:
@@ -87,6 +201,40 @@ def runtests_checker() -> bool:
         return d[0] > 10
 
 
+def runtests_lookups() -> bool:
+    """Check that interned passwords only differing by trailing spaces are distinct."""
+    config = BlacknetConfig()
+    config.load(MASTER_CONFIG_FILE)
+    cursor = blacknet_database(config).cursor()
+    values = ("password_0", "password_0 ")
+    ids = {cursor.intern_value("passwords", value) for value in values}
+    return len(ids) == len(values)
+
+
+def runtests_archive() -> bool:
+    """Archive all attempts, then check archives and that reports are unchanged."""
+    reports = []
+    for path in (SCRUBBER_STATS_FILE, SCRUBBER_COUNTRIES_FILE):
+        with open(path) as f:
+            reports.append(json.load(f)["data"])
+
+    bna = BlacknetArchiver(MASTER_CONFIG_FILE)
+    archived = bna.archive(int(time.time()) + 1)
+    read = 0
+    for path in glob.glob(ARCHIVE_FILES):
+        read += sum(1 for _ in blacknet_archive_read(path))
+    print(f"[+] Archived {archived} attempts, read {read} from archives")
+
+    # Counters of archived attempts must be accounted for by checks and reports.
+    runtests_scrubber()
+    for path, data in zip((SCRUBBER_STATS_FILE, SCRUBBER_COUNTRIES_FILE), reports):
+        with open(path) as f:
+            if json.load(f)["data"] != data:
+                print(f"[-] Report {path} changed after archival")
+                return False
+    return archived > 0 and read == archived
+
+
 def runtests_ssh() -> None:
     """Run both servers and run a few login/passwd attempts."""
     servers = []  # type: list[BlacknetServer]
@@ -113,6 +261,7 @@ def runtests_ssh() -> None:
     t = Thread(target=runtests_ssh_serve, args=(bn_ssh,))
     threads.append(t)
 
+    RUNTESTS_SERVING.set()
     for t in threads:
         t.daemon = True
         t.start()
@@ -121,8 +270,15 @@ def runtests_ssh() -> None:
 
     # Simulate a SSH client connecting
     runtests_ssh_client()
+    runtests_ssh_scanner()
+
+    # Sessions report their credentials once closed, wait for them.
+    deadline = time.monotonic() + 10.0
+    while bn_ssh.threads and time.monotonic() < deadline:
+        time.sleep(0.1)
 
     # Close servers
+    RUNTESTS_SERVING.clear()
     bn_ssh.shutdown()
     bn_main.shutdown()
     print("[+] Closed servers")
@@ -134,6 +290,20 @@ if __name__ == "__main__":
     logger.setLevel(logging.WARNING)
     logger.addHandler(logging.StreamHandler(sys.stdout))
 
+    # Run against an embedded SQLite database, started from scratch.
+    if "--sqlite" in sys.argv[1:]:
+        MASTER_CONFIG_FILE = SQLITE_CONFIG_FILE
+        for suffix in ("", "-wal", "-shm"):
+            with suppress(FileNotFoundError):
+                os.unlink(SQLITE_DATABASE_FILE + suffix)
+
+    # Archive files are appended to, start from scratch.
+    for path in glob.glob(ARCHIVE_FILES):
+        os.unlink(path)
+
+    # Bring the schema up to date (nothing to do on a fresh install)
+    runtests_migrate()
+
     # Update geolocation database with minimal sample
     runtests_update()
 
@@ -145,6 +315,12 @@ if __name__ == "__main__":
 
     # Check number of attempts from database
     success = runtests_checker()
+
+    # Check that trailing spaces are kept in interned strings
+    success = runtests_lookups() and success
+
+    # Move all attempts to archive files
+    success = runtests_archive() and success
     if success:
         sys.exit(os.EX_OK)
     sys.exit(os.EX_SOFTWARE)
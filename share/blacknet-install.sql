@@ -18,7 +18,7 @@ CREATE TABLE IF NOT EXISTS `locations` (
   `areaCode` int(11) DEFAULT NULL,
   PRIMARY KEY (`locId`),
   INDEX (`country`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
 
 
 -- --------------------------------------------------------
@@ -31,7 +31,7 @@ CREATE TABLE IF NOT EXISTS `blocks` (
   `locId` int(10) unsigned NOT NULL,
   KEY `startIpNum` (`startIpNum`),
   KEY `endIpNum` (`endIpNum`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
 
 
 -- --------------------------------------------------------
@@ -42,7 +42,7 @@ CREATE TABLE IF NOT EXISTS `countries` (
   `code` char(2) NOT NULL,
   `country` varchar(50) NOT NULL,
   PRIMARY KEY (`code`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
 
 
 TRUNCATE `countries`;
@@ -64,7 +64,46 @@ CREATE TABLE IF NOT EXISTS `attackers` (
   `n_attempts` int(10) unsigned DEFAULT 0,
   PRIMARY KEY (`id`),
   INDEX (`last_seen`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+
+-- --------------------------------------------------------
+--
+-- Table structure for table `users`
+-- Logins of attempts, stored once (binary, trailing spaces count).
+--
+CREATE TABLE IF NOT EXISTS `users` (
+  `id` int(10) unsigned AUTO_INCREMENT,
+  `value` varbinary(192) NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE (`value`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_bin;
+
+
+-- --------------------------------------------------------
+--
+-- Table structure for table `passwords`
+-- Passwords of attempts, stored once (binary, trailing spaces count).
+--
+CREATE TABLE IF NOT EXISTS `passwords` (
+  `id` int(10) unsigned AUTO_INCREMENT,
+  `value` varbinary(192) NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE (`value`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_bin;
+
+
+-- --------------------------------------------------------
+--
+-- Table structure for table `clients`
+-- SSH client versions of attempts, stored once (binary, trailing spaces count).
+--
+CREATE TABLE IF NOT EXISTS `clients` (
+  `id` int(10) unsigned AUTO_INCREMENT,
+  `value` varbinary(384) NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE (`value`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_bin;
 
 
 -- --------------------------------------------------------
@@ -75,21 +114,24 @@ CREATE TABLE IF NOT EXISTS `attempts` (
   `id` int(10) unsigned AUTO_INCREMENT,
   `attacker_id` int(10) unsigned NOT NULL,
   `session_id` int(10) unsigned NOT NULL,
-  `user` varchar(64) NOT NULL,
-  `password` varchar(64),
+  `user_id` int(10) unsigned NOT NULL,
+  `password_id` int(10) unsigned,
   `target` varchar(15) NOT NULL,
-  `date` DATETIME,
-  `client` varchar(128) DEFAULT "" NOT NULL,
+  `date` DATETIME NOT NULL,
+  `client_id` int(10) unsigned NOT NULL,
   `success` boolean DEFAULT false,
-  PRIMARY KEY (`id`),
+  PRIMARY KEY (`id`, `date`),
   INDEX (`session_id`),
   INDEX (`attacker_id`),
   INDEX (`date`),
-  INDEX (`target`),
-  INDEX (`user`),
-  INDEX (`password`),
-  INDEX (`user`, `password`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+  INDEX `target_date` (`target`, `date`),
+  INDEX (`user_id`, `password_id`),
+  INDEX (`password_id`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci
+-- Monthly partitions are split from `pmax` using "blacknet-migrate --add-partitions".
+PARTITION BY RANGE (TO_DAYS(`date`)) (
+  PARTITION pmax VALUES LESS THAN MAXVALUE
+);
 
 
 -- --------------------------------------------------------
@@ -104,7 +146,7 @@ CREATE TABLE IF NOT EXISTS `pubkeys` (
   `bits` INT(5) UNSIGNED NOT NULL,
   PRIMARY KEY (`id`),
   UNIQUE (`fingerprint`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
 
 
 -- --------------------------------------------------------
@@ -115,7 +157,7 @@ CREATE TABLE IF NOT EXISTS `attempts_pubkeys` (
   `attempt_id` INT(10) UNSIGNED NOT NULL,
   `pubkey_id` INT(10) UNSIGNED NOT NULL,
   PRIMARY KEY (`attempt_id`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
 
 
 -- --------------------------------------------------------
@@ -130,10 +172,89 @@ CREATE TABLE IF NOT EXISTS `sessions` (
   `target` varchar(15) NOT NULL,
   `n_attempts` int(10) unsigned DEFAULT 0,
   PRIMARY KEY (`id`),
-  INDEX (`attacker_id`),
+  INDEX `attacker_target` (`attacker_id`, `target`, `last_attempt`),
   INDEX (`last_attempt`),
-  INDEX (`target`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+  INDEX `target_attacker` (`target`, `attacker_id`),
+  INDEX `target_last_attempt` (`target`, `last_attempt`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+
+-- --------------------------------------------------------
+--
+-- Table structure for table `archived_sessions`
+-- Counters of attempts moved to archive files, by session.
+--
+CREATE TABLE IF NOT EXISTS `archived_sessions` (
+  `session_id` int(10) unsigned NOT NULL,
+  `attacker_id` int(10) unsigned NOT NULL,
+  `first_attempt` DATETIME,
+  `last_attempt` DATETIME,
+  `n_attempts` int(10) unsigned DEFAULT 0,
+  PRIMARY KEY (`session_id`),
+  INDEX (`attacker_id`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+
+-- --------------------------------------------------------
+--
+-- Table structure for table `archived_credentials`
+-- Counters of attempts moved to archive files, by credentials (no password is 0).
+--
+CREATE TABLE IF NOT EXISTS `archived_credentials` (
+  `user_id` int(10) unsigned NOT NULL,
+  `password_id` int(10) unsigned NOT NULL,
+  `n_attempts` int(10) unsigned DEFAULT 0,
+  PRIMARY KEY (`user_id`, `password_id`),
+  INDEX (`password_id`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+
+-- --------------------------------------------------------
+--
+-- Table structure for table `aggregated_attempts`
+-- Counters of attempts aggregated by sensors, without their own row (no password is 0).
+--
+CREATE TABLE IF NOT EXISTS `aggregated_attempts` (
+  `session_id` int(10) unsigned NOT NULL,
+  `attacker_id` int(10) unsigned NOT NULL,
+  `user_id` int(10) unsigned NOT NULL,
+  `password_id` int(10) unsigned NOT NULL,
+  `n_attempts` int(10) unsigned DEFAULT 0,
+  PRIMARY KEY (`session_id`, `user_id`, `password_id`),
+  INDEX (`attacker_id`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+
+-- --------------------------------------------------------
+--
+-- Table structure for table `geolocation_sources`
+-- State of the files geolocation tables were imported from (blacknet-updater).
+--
+CREATE TABLE IF NOT EXISTS `geolocation_sources` (
+  `url` varchar(255) NOT NULL,
+  `etag` varchar(255) DEFAULT NULL,
+  `last_modified` varchar(64) DEFAULT NULL,
+  `checksum` char(64) NOT NULL,
+  `imported` DATETIME NOT NULL,
+  PRIMARY KEY (`url`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+
+-- --------------------------------------------------------
+--
+-- Table structure for table `banners`
+-- Client versions from connections closed before any key exchange.
+--
+CREATE TABLE IF NOT EXISTS `banners` (
+  `id` int(10) unsigned AUTO_INCREMENT,
+  `attacker_id` int(10) unsigned NOT NULL,
+  `target` varchar(15) NOT NULL,
+  `date` DATETIME,
+  `client` varchar(128) DEFAULT "" NOT NULL,
+  PRIMARY KEY (`id`),
+  INDEX (`attacker_id`),
+  INDEX (`date`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
 
 
 -- --------------------------------------------------------
@@ -147,7 +268,7 @@ CREATE TABLE IF NOT EXISTS `events` (
   `type` varchar(15) NOT NULL,
   `content` varchar(255) DEFAULT "" NOT NULL,
   PRIMARY KEY (`id`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
 
 
 -- --------------------------------------------------------
@@ -163,7 +284,32 @@ CREATE TABLE IF NOT EXISTS `commands` (
   `command` text NOT NULL,
   PRIMARY KEY (`id`),
   INDEX (`attacker_id`)
-) ENGINE=MyISAM DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+
+-- --------------------------------------------------------
+--
+-- Table structure for table `schema_version`
+-- Migrations applied by blacknet-migrate (this file is at the latest version).
+--
+CREATE TABLE IF NOT EXISTS `schema_version` (
+  `version` int(10) unsigned NOT NULL,
+  `description` varchar(255) NOT NULL,
+  `applied` DATETIME NOT NULL,
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+
+INSERT IGNORE INTO `schema_version` VALUES
+  (1, 'Convert all tables to InnoDB', NOW()),
+  (2, 'Partition attempts by month', NOW()),
+  (3, 'Intern users, passwords and clients of attempts', NOW()),
+  (4, 'Add composite indexes for sessions and attempts', NOW()),
+  (5, 'Add counters of archived attempts', NOW()),
+  (6, 'Add state of geolocation imports', NOW()),
+  (7, 'Add client versions of banner-only connections', NOW()),
+  (8, 'Compare interned strings without padding', NOW()),
+  (9, 'Add counters of attempts aggregated by sensors', NOW());
 
 
 delimiter |